@@ -0,0 +1,92 @@
+"""
+Readers querying the catalog while an import writes to it.
+
+A writer thread inserts synthetic books with insert_books(batch_size=...)
+while reader threads, each on its own read-only connection, page through
+Book. Runs once with the rollback journal and once in WAL mode and
+reports the writer time, reader queries per second and how many reader
+queries failed on a lock.
+
+usage: python benchmarks/concurrency_bench.py [books] [readers]
+"""
+import sys
+import time
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import DatabaseConnector, BookDBHandler  # noqa: E402
+from pdfshelf.domain import Book, Folder  # noqa: E402
+
+
+def make_books(count: int) -> list[Book]:
+    folder = Folder(name="bench", path=Path("/books"))
+    return [
+        Book(title=f"Book {i}", authors=[f"Author {i}"], year=2000,
+             lang="en", publisher="Publisher", isbn13=None, parsed_isbn=None,
+             folder=folder, filename=f"book_{i}.pdf", ext=".pdf",
+             storage_path=Path(f"book_{i}.pdf"), size=1e6, tags=[],
+             cover_path=None)
+        for i in range(count)
+    ]
+
+
+def run(path: Path, wal: bool, books: list[Book], readers: int) -> None:
+    con = sqlite3.connect(path)
+    if wal:
+        DatabaseConnector.configure(con)
+    else:
+        con.execute(f"PRAGMA busy_timeout = {DatabaseConnector.BUSY_TIMEOUT}")
+    DatabaseConnector.create_tables(con)
+
+    done = threading.Event()
+    queries = [0] * readers
+    failures = [0] * readers
+
+    def read(n: int) -> None:
+        reader = DatabaseConnector.connect_readonly(path)
+        # Fail fast instead of waiting, to count the blocked queries.
+        reader.execute("PRAGMA busy_timeout = 0")
+        while not done.is_set():
+            try:
+                reader.execute("SELECT book_id, title FROM Book "
+                               "ORDER BY book_id DESC LIMIT 50").fetchall()
+                queries[n] += 1
+            except sqlite3.OperationalError:
+                failures[n] += 1
+        reader.close()
+
+    threads = [threading.Thread(target=read, args=(n, ))
+               for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    BookDBHandler(con).insert_books(books, batch_size=100)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in threads:
+        thread.join()
+    con.close()
+
+    mode = "wal" if wal else "rollback"
+    print(f"{mode:<9} writer {elapsed:6.2f}s  "
+          f"readers {sum(queries) / elapsed:8.0f} queries/s  "
+          f"{sum(failures):6} locked")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    books = make_books(count)
+
+    print(f"{count} books, {readers} readers")
+    for wal in (False, True):
+        with tempfile.TemporaryDirectory() as folder:
+            run(Path(folder) / "bench.db", wal, books, readers)
+
+
+if __name__ == "__main__":
+    main()
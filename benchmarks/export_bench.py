@@ -0,0 +1,96 @@
+"""
+Round-trips a synthetic catalog through export_library/import_library.
+
+Seeds an on-disk database with `books` rows (plus a Folder per 1000
+books and a Duplicate per 100), then exports and reloads it in every
+available format, reporting throughput, file sizes and the peak RSS of
+each run (each format runs in its own process, so peaks do not mix).
+
+usage: python benchmarks/export_bench.py [books]
+"""
+import sys
+import json
+import time
+import sqlite3
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import DatabaseConnector  # noqa: E402
+from pdfshelf.export import (  # noqa: E402
+    export_library, import_library, available_formats
+)
+
+
+def seed(path: Path, count: int) -> None:
+    con = sqlite3.connect(path)
+    DatabaseConnector.create_tables(con)
+    con.execute("BEGIN")
+    con.executemany(
+        "INSERT INTO Folder VALUES (?, ?, ?, '2023-01-01', 1)",
+        ((i, f"folder-{i}", f"/books/{i}") for i in range(count // 1000 + 1))
+    )
+    con.execute("DROP TRIGGER BookStats_insert")
+    con.executemany(
+        """INSERT INTO Book VALUES (NULL, ?, ?, ?, 'en', ?, '.pdf', ?, ?, ?,
+                                    '["tag"]', '2023-01-01 00:00:00', ?,
+                                    'Publisher', NULL, NULL, 1, 0, NULL)""",
+        ((f"Book {i}", json.dumps([f"Author {i % 5000}"]), 1950 + i % 70,
+          f"book_{i}.pdf", f"{i % 1000}/book_{i}.pdf", i // 1000,
+          1e6 + i, f"{i:040x}") for i in range(count))
+    )
+    con.execute("""INSERT INTO Duplicate
+                   SELECT book_id, title, authors, year, lang, filename, ext,
+                          storage_path, folder_id, size, tags, added_date,
+                          hash_id, publisher, isbn13, parsed_isbn, cover_path
+                   FROM Book WHERE book_id % 100 = 0""")
+    con.commit()
+    con.close()
+
+
+def run(source: Path, folder: Path, fmt: str) -> None:
+    con = sqlite3.connect(source)
+    start = time.perf_counter()
+    counts = export_library(con, folder, fmt)
+    export_time = time.perf_counter() - start
+    con.close()
+
+    target = folder / "target.db"
+    con = sqlite3.connect(target)
+    DatabaseConnector.create_tables(con)
+    start = time.perf_counter()
+    import_library(con, folder)
+    import_time = time.perf_counter() - start
+    con.close()
+
+    rows = sum(counts.values())
+    size = sum(p.stat().st_size for p in folder.glob("*") if p != target)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{fmt:<8} export {export_time:6.2f}s ({rows / export_time:8.0f}"
+          f" rows/s)  import {import_time:6.2f}s ({rows / import_time:8.0f}"
+          f" rows/s)  {size / 1024 ** 2:7.1f} MiB  peak RSS {peak:5.0f} MiB")
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        run(Path(sys.argv[2]), Path(sys.argv[3]), sys.argv[4])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as folder:
+        source = Path(folder) / "source.db"
+        seed(source, count)
+        print(f"{count} books, database "
+              f"{source.stat().st_size / 1024 ** 2:.1f} MiB")
+        for fmt in available_formats():
+            out = Path(folder) / fmt
+            out.mkdir()
+            subprocess.run([sys.executable, __file__, "--run", str(source),
+                            str(out), fmt], check=True)
+
+
+if __name__ == "__main__":
+    main()
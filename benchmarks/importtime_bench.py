@@ -0,0 +1,55 @@
+"""
+Measures `python -X importtime` for the pdfshelf modules and fails when a
+module exceeds its budget, so startup regressions show up in CI.
+
+usage: python benchmarks/importtime_bench.py [runs]
+"""
+import os
+import sys
+import tempfile
+import subprocess
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Cumulative import time budgets in milliseconds (best of `runs`).
+BUDGETS = {
+    "pdfshelf.database": 60,
+    "pdfshelf.importer": 60,
+    "pdfshelf.cover": 60,
+    "pdfshelf.pipeline": 150,
+}
+
+
+def import_time(module: str, home: str) -> float:
+    """Cumulative microseconds spent importing module, from -X importtime."""
+    env = {**os.environ, "HOME": home, "PYTHONPATH": str(SRC)}
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, check=True, capture_output=True, text=True
+    ).stderr
+
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"{module} not found in importtime output.")
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+
+    with tempfile.TemporaryDirectory() as home:
+        for module, budget in BUDGETS.items():
+            best = min(import_time(module, home) for _ in range(runs))
+            status = "ok" if best <= budget else "OVER BUDGET"
+            failed = failed or best > budget
+            print(f"{module:<22} {best:7.1f} ms  (budget {budget} ms) "
+                  f"{status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares checking every Book file one by one, through load_books and
+get_full_path, against IntegrityChecker.
+
+Builds a library of small files (100k books by default) in a temporary
+folder, removes 1% of them and times each check, then the checker with
+content checksums.
+
+usage: python benchmarks/integrity_bench.py [books] [workers]
+"""
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import (  # noqa: E402
+    BookDBHandler, DatabaseConnector
+)
+from pdfshelf.integrity import IntegrityChecker  # noqa: E402
+
+FILES_PER_DIR = 500
+FILE_SIZE = 4096
+
+
+def build_library(root: Path, books: int) -> DatabaseConnector:
+    folder = root / "books"
+    content = os.urandom(FILE_SIZE)
+    connector = DatabaseConnector(root / "pdfshelf.db")
+    con = connector.con
+    con.execute("""INSERT INTO Folder VALUES
+                   (1, 'books', ?, '2024-01-01', 1)""", (str(folder), ))
+    rows = []
+    for i in range(books):
+        storage_path = f"dir_{i // FILES_PER_DIR}/book_{i}.pdf"
+        path = folder / storage_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content[i % 64:] + content[:i % 64])
+        rows.append((f"book_{i}.pdf", storage_path, FILE_SIZE,
+                     datetime.now(), f"hash_{i}"))
+    con.executemany(
+        """INSERT INTO Book (filename, ext, storage_path, folder_id, size,
+                             added_date, hash_id, active, confirmed)
+           VALUES (?, '.pdf', ?, 1, ?, ?, ?, 1, 0)""", rows)
+    con.commit()
+    for i in range(0, books, 100):
+        (folder / f"dir_{i // FILES_PER_DIR}" / f"book_{i}.pdf").unlink()
+    return connector
+
+
+def check_one_by_one(con) -> int:
+    missing = 0
+    for book in BookDBHandler(con).load_books():
+        path = book.get_full_path()
+        if not path.exists() or path.stat().st_size != int(book.size):
+            missing += 1
+    return missing
+
+
+def check_parallel(con, workers: int, content_hash: bool = False) -> int:
+    checker = IntegrityChecker(con, workers=workers, relink=False,
+                               content_hash=content_hash)
+    return len(checker.check())
+
+
+def timed(label: str, func, *args) -> None:
+    start = time.perf_counter()
+    findings = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f}s  {findings} findings")
+
+
+def main() -> None:
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {books} books...")
+        with build_library(Path(tmp), books) as con:
+            timed("load_books + stat", check_one_by_one, con)
+            timed(f"IntegrityChecker ({workers})", check_parallel, con,
+                  workers)
+            timed("  with checksums (1st run)", check_parallel, con,
+                  workers, True)
+            timed("  with checksums", check_parallel, con, workers, True)
+
+
+if __name__ == "__main__":
+    main()
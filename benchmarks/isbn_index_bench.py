@@ -0,0 +1,89 @@
+"""
+Builds an offline ISBN index from a synthetic gzipped editions dump and
+times lookups against it.
+
+Writes `editions` OpenLibrary-style TSV records (half with an ISBN-10,
+half with an ISBN-13), builds the index, then looks up random ISBNs from
+one thread and from the import pipeline's default of 8 fetch threads.
+Peak RSS shows the build's memory stays flat as the dump grows.
+
+usage: python benchmarks/isbn_index_bench.py [editions] [lookups]
+"""
+import sys
+import gzip
+import json
+import time
+import random
+import resource
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.isbnindex import ISBNIndex  # noqa: E402
+from pdfshelf.utilities import isbn10_to_isbn13  # noqa: E402
+
+
+def isbn10(i: int) -> str:
+    body = f"{i:09d}"
+    check = sum((10 - n) * int(d) for n, d in enumerate(body)) % 11
+    check = (11 - check) % 11
+    return body + ("X" if check == 10 else str(check))
+
+
+def write_dump(path: Path, count: int) -> None:
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as dump:
+        for i in range(count):
+            record = {"key": f"/books/OL{i}M", "title": f"Edition {i}",
+                      "publishers": ["Publisher"], "publish_date": "2001",
+                      "languages": [{"key": "/languages/eng"}],
+                      "authors": [{"name": f"Author {i % 50000}"}]}
+            if i % 2:
+                record["isbn_10"] = [isbn10(i)]
+            else:
+                record["isbn_13"] = [isbn10_to_isbn13(isbn10(i))]
+            dump.write(f"/type/edition\t{record['key']}\t1\t2023-01-01\t"
+                       f"{json.dumps(record)}\n")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    with tempfile.TemporaryDirectory() as folder:
+        dump = Path(folder) / "editions.txt.gz"
+        write_dump(dump, count)
+
+        start = time.perf_counter()
+        index = ISBNIndex.build(dump, Path(folder) / "isbn.db")
+        build_time = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        size = (Path(folder) / "isbn.db").stat().st_size
+
+        isbns = [isbn10(random.randrange(count)) for _ in range(lookups)]
+        start = time.perf_counter()
+        found = sum(index.lookup(isbn) is not None for isbn in isbns)
+        single = time.perf_counter() - start
+        assert found == lookups
+
+        chunks = [isbns[i::8] for i in range(8)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda chunk: [index.lookup(i) for i in chunk],
+                          chunks))
+        threaded = time.perf_counter() - start
+        index.close()
+
+    print(f"{count} editions, dump {dump.name}")
+    print(f"build:     {build_time:7.2f}s ({count / build_time:8.0f} "
+          f"editions/s), index {size / 1024 ** 2:.1f} MiB, "
+          f"peak RSS {peak:.0f} MiB")
+    print(f"lookup:    {single / lookups * 1e6:7.1f} us/lookup "
+          f"({lookups / single:8.0f}/s, 1 thread)")
+    print(f"           {threaded / lookups * 1e6:7.1f} us/lookup "
+          f"({lookups / threaded:8.0f}/s, 8 threads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Logging overhead per imported book, as seen by the importing thread.
+
+Replays the records an import writes for each book (ISBN and metadata
+lookups, the database insert, the cover) and, for one book in ten, a
+failed metadata fetch with its traceback. "before" is the previous
+setup: f-strings and traceback.format_exc() formatted by the caller and
+a RotatingFileHandler written synchronously. "after" is
+pdfshelf.log.setup_logging: %-style records put on a queue, formatted
+and written by the listener thread. The time to drain the queue at the
+end is reported separately.
+
+usage: python benchmarks/logging_bench.py [books]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import traceback
+from pathlib import Path
+from types import SimpleNamespace
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf import log  # noqa: E402
+
+FORMAT = "%(asctime)s %(name)-22s %(levelname)-8s [%(lineno)-3s] %(message)s"
+
+
+def import_before(logger: logging.Logger, i: int) -> None:
+    isbn, name = f"978{i:010d}", f"book_{i}.pdf"
+    logger.info(f"ISBN-13: {isbn} found.")
+    if i % 10 == 0:
+        try:
+            raise ValueError(f"Service unavailable for {isbn}")
+        except ValueError:
+            logger.error("ISBNLib metadata fetching failed!\n"
+                         f"{traceback.format_exc()}")
+    logger.info(f"Metadata found with ISBN-13!")
+    logger.debug(f"    [EXISTING] Folder library (ID = {1})")
+    logger.info(f"    [ADDED] Book \"{name}\"")
+    logger.info(f"[COVER] Found for {name}")
+    logger.info(f"        Saved as {i}.jpg")
+
+
+def import_after(logger: logging.Logger, i: int) -> None:
+    isbn, name = f"978{i:010d}", f"book_{i}.pdf"
+    logger.info("ISBN-13: %s found.", isbn)
+    if i % 10 == 0:
+        try:
+            raise ValueError(f"Service unavailable for {isbn}")
+        except ValueError:
+            logger.error("ISBNLib metadata fetching failed!", exc_info=True)
+    logger.info("Metadata found with ISBN-13!")
+    logger.debug("    [%s] Folder %s (ID = %s)", "EXISTING", "library", 1)
+    logger.info("    [ADDED] Book \"%s\"", name)
+    logger.info("[COVER] Found for %s", name)
+    logger.info("        Saved as %s", f"{i}.jpg")
+
+
+def run(books: int, folder: Path, queued: bool) -> tuple[float, float]:
+    logger = logging.getLogger("pdfshelf.bench")
+    if queued:
+        log.get_config = lambda: SimpleNamespace(config_folder=folder)
+        log.setup_logging()
+        replay = import_after
+    else:
+        handler = RotatingFileHandler(folder / "pdfshelf.log",
+                                      maxBytes=2500000, backupCount=25)
+        handler.setFormatter(logging.Formatter(FORMAT, "%Y-%m-%d %H:%M"))
+        stream = logging.StreamHandler()
+        stream.setLevel(logging.WARNING)
+        root = logging.getLogger("pdfshelf")
+        root.setLevel(logging.DEBUG)
+        root.addHandler(handler)
+        root.addHandler(stream)
+        replay = import_before
+
+    start = time.perf_counter()
+    for i in range(books):
+        replay(logger, i)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if queued:
+        log.stop_logging()
+    else:
+        for handler in logging.getLogger("pdfshelf").handlers[1:]:
+            logging.getLogger("pdfshelf").removeHandler(handler)
+            handler.close()
+    return elapsed, time.perf_counter() - start
+
+
+def main() -> None:
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Errors also go to the console handler: keep them out of the output.
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    results = {}
+    for name, queued in (("before", False), ("after", True)):
+        with tempfile.TemporaryDirectory() as folder:
+            results[name] = run(books, Path(folder), queued)
+    sys.stderr.close()
+    sys.stderr = stderr
+
+    print(f"{books} books, 6 records each, a traceback every 10 books")
+    for name, (elapsed, drain) in results.items():
+        print(f"{name:<7} {elapsed / books * 1e6:7.1f} us/book in the "
+              f"importing thread, {drain * 1000:7.1f} ms to drain")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Multi-criteria queries: filtering loaded Books in Python against
+BookDBHandler.find_books, which runs the whole query in SQL.
+
+Fills a temporary library with synthetic books, then runs the same
+author + year range + extension query both ways and prints the time per
+query and the query plan of the SQL one.
+
+usage: python benchmarks/query_bench.py [books] [repeats]
+"""
+import sys
+import time
+import sqlite3
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import DatabaseConnector, BookDBHandler  # noqa: E402
+from pdfshelf.domain import Book, Folder  # noqa: E402
+from pdfshelf.query import F, BookQuery, query_plan  # noqa: E402
+
+
+def make_books(count: int) -> list[Book]:
+    folder = Folder(name="bench", path=Path("/books"))
+    return [
+        Book(title=f"Book {i}", authors=[f"Author {i % 1000}"],
+             year=1950 + i % 70, lang="en", publisher="Publisher",
+             isbn13=None, parsed_isbn=None, folder=folder,
+             filename=f"book_{i}.pdf", ext=(".pdf", ".epub")[i % 2],
+             storage_path=Path(f"book_{i}.pdf"), size=1e6, tags=[],
+             cover_path=None)
+        for i in range(count)
+    ]
+
+
+def timed(function, repeats: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        found = len(function())
+    return (time.perf_counter() - start) / repeats, found
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as folder:
+        con = sqlite3.connect(Path(folder) / "bench.db")
+        con.row_factory = sqlite3.Row
+        DatabaseConnector.configure(con)
+        DatabaseConnector.create_tables(con)
+        handler = BookDBHandler(con)
+        handler.insert_books(make_books(count), batch_size=5000)
+
+        def in_python() -> list[Book]:
+            return [book for book in handler.load_books("year")
+                    if "Author 7" in book.authors
+                    and 2000 <= (book.year or 0) <= 2010
+                    and book.ext == ".epub"]
+
+        query = (BookQuery()
+                 .where(F("author") == "Author 7",
+                        F("year").between(2000, 2010), F("ext") == ".epub")
+                 .order_by("year"))
+
+        python_time, python_found = timed(in_python, max(1, repeats // 10))
+        sql_time, sql_found = timed(lambda: handler.find_books(query),
+                                    repeats)
+        assert python_found == sql_found
+        plan = query_plan(con, query)
+        con.close()
+
+    print(f"{count} books, {sql_found} matches")
+    print(f"python filter: {python_time * 1000:9.2f} ms/query")
+    print(f"find_books:    {sql_time * 1000:9.2f} ms/query")
+    print("plan:", *plan, sep="\n  ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares moving a Folder by rewriting every Book (the new path of each
+file checked, its cover path updated one row at a time) against
+FolderDBHandler.relocate_folder.
+
+Builds a library with one folder of small files (100k books by default)
+in a temporary folder and moves the files to another folder.
+
+usage: python benchmarks/relocate_bench.py [books]
+"""
+import sys
+import time
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import (  # noqa: E402
+    BookDBHandler, DatabaseConnector, FolderDBHandler
+)
+
+FILES_PER_DIR = 500
+
+
+def build_library(root: Path, books: int) -> DatabaseConnector:
+    folder = root / "disk1" / "books"
+    connector = DatabaseConnector(root / "pdfshelf.db")
+    con = connector.con
+    con.execute("""INSERT INTO Folder VALUES
+                   (1, 'books', ?, '2024-01-01', 1)""", (str(folder), ))
+    rows = []
+    for i in range(books):
+        storage_path = f"dir_{i // FILES_PER_DIR}/book_{i}.pdf"
+        path = folder / storage_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"%d" % i)
+        rows.append((f"book_{i}.pdf", storage_path, len(b"%d" % i),
+                     datetime.now(), f"hash_{i}",
+                     str(root / "disk1" / "covers" / f"{i}.jpg")))
+    con.executemany(
+        """INSERT INTO Book (filename, ext, storage_path, folder_id, size,
+                             added_date, hash_id, active, confirmed,
+                             cover_path)
+           VALUES (?, '.pdf', ?, 1, ?, ?, ?, 1, 0, ?)""", rows)
+    con.commit()
+    (root / "disk1").rename(root / "disk2")
+    return connector
+
+
+def per_book(con, root: Path) -> None:
+    handler = BookDBHandler(con)
+    FolderDBHandler(con).update_folder(
+        1, {"path": str(root / "disk2" / "books")})
+    updates = []
+    for book in handler.load_books():
+        assert book.get_full_path().exists()
+        cover = str(book.cover_path).replace("disk1", "disk2", 1)
+        updates.append((book.book_id, {"cover_path": cover}))
+    handler.update_books(updates)
+
+
+def relocate(con, root: Path) -> None:
+    FolderDBHandler(con).relocate_folder(
+        1, root / "disk2" / "books",
+        covers=(root / "disk1" / "covers", root / "disk2" / "covers")
+    )
+
+
+def timed(label: str, func, *args) -> None:
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.3f}s")
+
+
+def main() -> None:
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"Building {books} books...")
+        with build_library(root, books) as con:
+            timed("per Book", per_book, con, root)
+            # Back to disk1 in the database, then moved again.
+            con.execute("UPDATE Folder SET path = ?",
+                        (str(root / "disk1" / "books"), ))
+            con.execute("UPDATE Book SET cover_path = replace(cover_path, "
+                        "'disk2', 'disk1')")
+            con.commit()
+            timed("relocate_folder", relocate, con, root)
+
+
+if __name__ == "__main__":
+    main()
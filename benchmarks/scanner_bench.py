@@ -0,0 +1,82 @@
+"""
+Compares Path.rglob + is_file + getsize against DirectoryScanner.
+
+Builds a synthetic tree (500k entries by default, ~5% of them books) in a
+temporary folder and times each walk over it.
+
+usage: python benchmarks/scanner_bench.py [entries] [workers]
+"""
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.importer import FORMATS  # noqa: E402
+from pdfshelf.scanner import DirectoryScanner  # noqa: E402
+
+FILES_PER_DIR = 100
+DIRS_PER_LEVEL = 20
+
+
+def build_tree(root: Path, entries: int) -> None:
+    created = 0
+    level = [root]
+    while created < entries:
+        next_level = []
+        for folder in level:
+            for i in range(FILES_PER_DIR):
+                if created >= entries:
+                    return
+                ext = (".pdf", ".epub")[i % 2] if i % 20 == 0 else ".txt"
+                (folder / f"file_{i}{ext}").touch()
+                created += 1
+            for i in range(DIRS_PER_LEVEL):
+                subdir = folder / f"dir_{i}"
+                subdir.mkdir()
+                next_level.append(subdir)
+                created += 1
+        level = next_level
+
+
+def walk_rglob(root: Path) -> int:
+    total = 0
+    for filepath in root.rglob("*"):
+        if filepath.suffix in [".pdf", ".epub"] and filepath.is_file():
+            total += os.path.getsize(filepath)
+    return total
+
+
+def walk_scanner(root: Path, workers: int) -> int:
+    scanner = DirectoryScanner(FORMATS, workers=workers)
+    return sum(scanned.size for scanned in scanner.scan(root))
+
+
+def timed(label: str, func, *args) -> None:
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f} s")
+
+
+def main() -> None:
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        start = time.perf_counter()
+        build_tree(root, entries)
+        print(f"Built {entries} entries in "
+              f"{time.perf_counter() - start:.1f} s")
+
+        timed("rglob + is_file + getsize", walk_rglob, root)
+        timed("DirectoryScanner", walk_scanner, root, 1)
+        timed(f"DirectoryScanner ({workers} thr)", walk_scanner, root,
+              workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Load test for the catalog server (pdfshelf serve).
+
+Without --url, seeds a temporary library with synthetic books, starts
+`python -m pdfshelf serve` on it in a separate process and runs against
+that. Each client keeps one HTTP/1.1 connection alive and requests a mix of
+listing pages, search and single books. With --etag, clients revalidate
+with If-None-Match, as a browser or caching proxy would.
+
+usage: python benchmarks/server_load.py [--url URL] [--books N]
+           [--clients N] [--seconds S] [--etag]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from urllib.parse import urlsplit
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def seed_library(home: Path, count: int) -> None:
+    # pdfshelf resolves its folders from HOME, so set it before importing.
+    os.environ["HOME"] = str(home)
+    sys.path.insert(0, str(SRC))
+    from pdfshelf.database import DatabaseConnector, BookDBHandler
+    from pdfshelf.domain import Book, Folder
+
+    folder = Folder(name="bench", path=home / "books")
+    books = [
+        Book(title=f"Book {i} about {random.choice(['python', 'rust', 'go'])}",
+             authors=[f"Author {i % 500}"], year=1990 + i % 35, lang="en",
+             publisher=f"Publisher {i % 40}", isbn13=None, parsed_isbn=None,
+             folder=folder, filename=f"book_{i}.pdf", ext=".pdf",
+             storage_path=Path(f"book_{i}.pdf"), size=1e6 + i, tags=[],
+             cover_path=None)
+        for i in range(count)
+    ]
+    with DatabaseConnector() as con:
+        BookDBHandler(con).insert_books(books)
+
+
+def make_targets(books: int) -> list[str]:
+    targets = []
+    for _ in range(200):
+        kind = random.random()
+        if kind < 0.5:
+            offset = random.randrange(0, max(books - 50, 1), 50)
+            targets.append(f"/books?limit=50&offset={offset}&sort=title")
+        elif kind < 0.7:
+            targets.append(f"/books?q={random.choice(['python', 'rust'])}"
+                           "&limit=20")
+        else:
+            targets.append(f"/books/{random.randint(1, books)}")
+    return targets
+
+
+async def client(
+    host: str, port: int, targets: list[str], deadline: float, etag: bool,
+    latencies: list[float], statuses: dict[int, int]
+) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    etags: dict[str, str] = {}
+    while time.perf_counter() < deadline:
+        target = random.choice(targets)
+        extra = ""
+        if etag and target in etags:
+            extra = f"If-None-Match: {etags[target]}\r\n"
+
+        start = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n{extra}\r\n"
+                     .encode())
+        head = await reader.readuntil(b"\r\n\r\n")
+        headers = dict(line.split(": ", 1) for line in
+                       head.decode("latin-1").split("\r\n")[1:] if line)
+        await reader.readexactly(int(headers.get("Content-Length", 0)))
+        latencies.append(time.perf_counter() - start)
+
+        status = int(head.split(b" ", 2)[1])
+        statuses[status] = statuses.get(status, 0) + 1
+        if "ETag" in headers:
+            etags[target] = headers["ETag"]
+    writer.close()
+
+
+async def run(url: str, books: int, clients: int, seconds: float,
+              etag: bool) -> None:
+    parts = urlsplit(url)
+    targets = make_targets(books)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    deadline = time.perf_counter() + seconds
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(parts.hostname, parts.port, targets, deadline, etag,
+               latencies, statuses)
+        for _ in range(clients)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    print(f"{len(latencies)} requests in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.0f} req/s), {clients} clients")
+    print(f"latency p50 {pct(0.5) * 1000:.2f} ms | "
+          f"p90 {pct(0.9) * 1000:.2f} ms | p99 {pct(0.99) * 1000:.2f} ms")
+    print(f"statuses {dict(sorted(statuses.items()))}")
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10.0) -> None:
+    import socket
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server did not start on {host}:{port}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="existing server, e.g. "
+                                      "http://127.0.0.1:8080")
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--etag", action="store_true")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run(args.url, args.books, args.clients, args.seconds,
+                        args.etag))
+        return
+
+    with tempfile.TemporaryDirectory() as home:
+        print(f"Seeding {args.books} books...")
+        seed_library(Path(home), args.books)
+        env = {**os.environ, "HOME": home, "PYTHONPATH": str(SRC)}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "pdfshelf", "serve", "--port",
+             str(args.port)], env=env
+        )
+        try:
+            wait_for_port("127.0.0.1", args.port)
+            asyncio.run(run(f"http://127.0.0.1:{args.port}", args.books,
+                            args.clients, args.seconds, args.etag))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
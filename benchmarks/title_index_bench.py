@@ -0,0 +1,75 @@
+"""
+Builds a title index from synthetic metadata and times fuzzy matches of
+noisy file names against it.
+
+Titles are random words from a Zipf-distributed vocabulary; queries are
+file names built from a title with one typo, an extension and an id, as
+found in downloaded collections.
+
+usage: python benchmarks/title_index_bench.py [titles] [queries]
+"""
+import sys
+import time
+import random
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.titleindex import TitleIndex, filename_title  # noqa: E402
+
+SYLLABLES = ["py", "da", "le", "ma", "co", "re", "an", "ste", "gra", "lo",
+             "net", "qui", "thon", "ta", "ar", "ning", "chi", "ne", "de",
+             "st", "sis", "ps", "phs", "gic", "work", "ck", "in", "tro"]
+
+
+def make_entries(count: int, rng: random.Random) -> list[dict]:
+    # Word frequencies follow Zipf's law, as in real titles.
+    words = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+             for _ in range(20000)]
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [{"Title": " ".join(rng.choices(words, weights,
+                                           k=rng.randint(2, 6))),
+             "Authors": [f"Author {i % 5000}"], "Year": "2001"}
+            for i in range(count)]
+
+
+def noisy_filename(title: str, rng: random.Random) -> str:
+    chars = list(title)
+    i = rng.randrange(len(chars))
+    chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "_".join("".join(chars).split()) + f"-{rng.randrange(10 ** 6)}.pdf"
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(0)
+    entries = make_entries(count, rng)
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        index = TitleIndex.build(entries, Path(folder) / "titles.db")
+        build_time = time.perf_counter() - start
+        size = (Path(folder) / "titles.db").stat().st_size
+
+        samples = rng.sample(entries, queries)
+        names = [filename_title(noisy_filename(e["Title"], rng))
+                 for e in samples]
+        start = time.perf_counter()
+        found = 0
+        for entry, name in zip(samples, names):
+            matches = index.match(name)
+            found += any(m.metadata["Title"] == entry["Title"]
+                         for m in matches)
+        elapsed = time.perf_counter() - start
+        index.close()
+
+    print(f"{count} titles, index {size / 1024 ** 2:.1f} MiB, "
+          f"built in {build_time:.1f}s")
+    print(f"match: {elapsed / queries * 1000:7.2f} ms/query, "
+          f"{found / queries:.1%} found in the top 5")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares looping BookDBHandler.update_book against update_books.
+
+Seeds an on-disk database (commits hit the disk, as in real use) with
+synthetic books, then retags and corrects the publisher of every book,
+one call per book and then as a single batch.
+
+usage: python benchmarks/update_bench.py [books]
+"""
+import sys
+import time
+import sqlite3
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pdfshelf.database import DatabaseConnector, BookDBHandler  # noqa: E402
+from pdfshelf.domain import Book, Folder  # noqa: E402
+
+
+def seed(path: Path, count: int) -> sqlite3.Connection:
+    con = sqlite3.connect(path)
+    con.row_factory = sqlite3.Row
+    DatabaseConnector.create_tables(con)
+    folder = Folder(name="bench", path=Path("/books"))
+    BookDBHandler(con).insert_books([
+        Book(title=f"Book {i}", authors=[f"Author {i}"], year=2000,
+             lang="en", publisher="Publisher", isbn13=None, parsed_isbn=None,
+             folder=folder, filename=f"book_{i}.pdf", ext=".pdf",
+             storage_path=Path(f"book_{i}.pdf"), size=1e6, tags=[],
+             cover_path=None)
+        for i in range(count)
+    ])
+    return con
+
+
+def changes(book_id: int, run: int) -> dict:
+    if book_id % 2:
+        return {"tags": f'["run-{run}"]'}
+    return {"tags": f'["run-{run}"]', "publisher": f"Publisher {run}"}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with tempfile.TemporaryDirectory() as folder:
+        con = seed(Path(folder) / "bench.db", count)
+        handler = BookDBHandler(con)
+        ids = [row[0] for row in con.execute("SELECT book_id FROM Book")]
+
+        start = time.perf_counter()
+        for book_id in ids:
+            handler.update_book(book_id, changes(book_id, 1))
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = handler.update_books(
+            [(book_id, changes(book_id, 2)) for book_id in ids]
+        )
+        batch_time = time.perf_counter() - start
+        assert all(results.values())
+        con.close()
+
+    print(f"{count} books")
+    print(f"update_book loop: {loop_time:7.3f}s "
+          f"({count / loop_time:9.0f} rows/s)")
+    print(f"update_books:     {batch_time:7.3f}s "
+          f"({count / batch_time:9.0f} rows/s)")
+    print(f"speedup:          {loop_time / batch_time:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Books kept inside ZIP (or CBZ) archives, read in place. A member is
+addressed by the path of its archive joined with its name in the archive,
+e.g. `books/2021.zip/python/fluent.pdf`, which is what Book.storage_path
+keeps; nothing is extracted to disk.
+"""
+import io
+import os
+import mmap
+import errno
+import struct
+import logging
+import zipfile
+from functools import lru_cache
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, ContextManager, Iterable, Iterator
+from .scanner import ScannedFile
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = frozenset({".zip", ".cbz"})
+
+# The fixed part of a local file header, then the name and extra lengths.
+_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+class _MappedFile(io.RawIOBase):
+    """A seekable, read-only file over a memoryview."""
+
+    def __init__(self, view: memoryview) -> None:
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def _missing(path: Path | str) -> FileNotFoundError:
+    return FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                             str(path))
+
+
+def split_member(path: Path | str) -> tuple[Path, str] | None:
+    """The archive and the member name of path, or None for other paths."""
+    parts = Path(path).parts
+    for i, part in enumerate(parts[:-1]):
+        if os.path.splitext(part)[1].lower() not in ARCHIVE_FORMATS:
+            continue
+        archive = Path(*parts[:i + 1])
+        if archive.is_file():
+            return archive, "/".join(parts[i + 1:])
+    return None
+
+
+def _is_safe(name: str) -> bool:
+    member = PurePosixPath(name)
+    return not member.is_absolute() and ".." not in member.parts
+
+
+def scan_archive(
+    archive: Path, extensions: Iterable[str]
+) -> list[ScannedFile]:
+    """The members of archive with one of the extensions."""
+    extensions = frozenset(extensions)
+    files = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if (info.is_dir() or os.path.splitext(info.filename)[1]
+                    not in extensions):
+                continue
+            if info.flag_bits & 0x1 or not _is_safe(info.filename):
+                LOGGER.warning("[ARCHIVE] Skipping %s in %s: encrypted or "
+                               "outside the archive.", info.filename,
+                               archive.name)
+                continue
+            files.append(ScannedFile(
+                path=archive.joinpath(*info.filename.split("/")),
+                size=info.file_size
+            ))
+    return files
+
+
+def expand_archives(
+    files: Iterable[ScannedFile], extensions: Iterable[str]
+) -> Iterator[ScannedFile]:
+    """
+    The scanned files, each archive among them replaced by its members
+    with one of the extensions. Unreadable archives are skipped.
+    """
+    for scanned in files:
+        if scanned.path.suffix.lower() not in ARCHIVE_FORMATS:
+            yield scanned
+            continue
+        try:
+            yield from scan_archive(scanned.path, extensions)
+        except (OSError, zipfile.BadZipFile) as e:
+            LOGGER.warning("[ARCHIVE] Skipping %s: %s", scanned.path, e)
+
+
+@lru_cache(maxsize=64)
+def _member_sizes(archive: str, mtime_ns: int, size: int) -> dict[str, int]:
+    # Keyed by mtime and size too: a rewritten archive is read again.
+    with zipfile.ZipFile(archive) as zf:
+        return {info.filename: info.file_size for info in zf.infolist()}
+
+
+def file_size(path: Path | str) -> int:
+    """
+    The size of a file or of an archive member. Raises FileNotFoundError
+    when there is neither.
+    """
+    try:
+        return os.stat(path).st_size
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+
+    split = split_member(path)
+    if split is None:
+        raise _missing(path)
+    archive, name = split
+    st = archive.stat()
+    try:
+        sizes = _member_sizes(str(archive), st.st_mtime_ns, st.st_size)
+        return sizes[name]
+    except (KeyError, zipfile.BadZipFile):
+        raise _missing(path) from None
+
+
+@contextmanager
+def open_member(path: Path | str) -> Iterator[BinaryIO]:
+    """
+    A seekable, read-only file of an archive member. Stored members are
+    read straight from a memory map of the archive, compressed ones are
+    inflated in memory. The file must not be used after the block.
+    """
+    split = split_member(path)
+    if split is None:
+        raise _missing(path)
+    archive, name = split
+
+    with open(archive, "rb") as file, zipfile.ZipFile(file) as zf:
+        try:
+            info = zf.getinfo(name)
+        except KeyError:
+            raise _missing(path) from None
+
+        if (info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1
+                or info.file_size == 0):
+            with zf.open(info) as member:
+                yield io.BytesIO(member.read())
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, name_len, extra_len = _LOCAL_HEADER.unpack_from(
+                mapped, info.header_offset)
+            if magic != b"PK\x03\x04":
+                raise zipfile.BadZipFile(f"Bad local header for {name}")
+            start = (info.header_offset + _LOCAL_HEADER.size + name_len
+                     + extra_len)
+            with memoryview(mapped)[start:start + info.file_size] as view:
+                with _MappedFile(view) as member:
+                    yield member
+
+
+def open_book(path: Path | str) -> ContextManager[BinaryIO]:
+    """A binary file of path, which may be an archive member."""
+    try:
+        return open(path, "rb")
+    except (FileNotFoundError, NotADirectoryError):
+        if split_member(path) is None:
+            raise
+    return open_member(path)
@@ -0,0 +1,81 @@
+import queue
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+from .textstore import TextStore
+
+LOGGER = logging.getLogger(__name__)
+
+# Marks the end of the cleaner's input.
+_DONE: Any = object()
+
+
+def remove_files(
+    paths: Iterable[Path], hash_ids: Iterable[str] = (),
+    text_store: TextStore | None = None
+) -> int:
+    """
+    Remove files left behind by deleted Books (covers and, with a
+    text_store, their stored text). Returns how many were removed.
+    """
+    removed = 0
+    for path in paths:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            LOGGER.warning("[CLEANUP] Could not remove %s: %s", path, e)
+
+    if text_store is not None:
+        for hash_id in hash_ids:
+            if text_store.exists(hash_id):
+                text_store.delete(hash_id)
+                removed += 1
+
+    return removed
+
+
+class FileCleaner:
+    """
+    Background file-cleanup pass for bulk deletes: the database
+    transaction commits without waiting on the filesystem, and files are
+    removed afterwards on a worker thread. close() waits for the pending
+    removals.
+    """
+
+    def __init__(self, text_store: TextStore | None = None) -> None:
+        self.text_store = text_store
+        self.removed = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def submit(self, paths: Iterable[Path], hash_ids: Iterable[str] = ()):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="file-cleaner")
+                self._thread.start()
+        self._queue.put((list(paths), list(hash_ids)))
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_DONE)
+            thread.join()
+            LOGGER.debug("[CLEANUP] %s files removed.", self.removed)
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not _DONE:
+            paths, hash_ids = item
+            self.removed += remove_files(paths, hash_ids, self.text_store)
@@ -0,0 +1,837 @@
+import json
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Any, TextIO
+from .domain import Book
+
+# Subcommands import what they need when they run, so `pdfshelf list`
+# never pays for pypdf, ebooklib, requests or asyncio.
+
+
+class ProgressReporter:
+    """
+    Live progress line with throughput and ETA. Redraws in place on a
+    terminal and prints a line every `interval` seconds otherwise (logs,
+    CI), so long runs stay readable in both.
+    """
+
+    def __init__(
+        self, total: int, label: str, stream: TextIO = sys.stderr,
+        interval: float = 2.0
+    ) -> None:
+        self.total = total
+        self.label = label
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self._last_draw = 0.0
+        self._tty = stream.isatty()
+
+    def update(self, count: int = 1) -> None:
+        self.done += count
+        now = time.monotonic()
+        if self._tty or now - self._last_draw >= self.interval:
+            self._draw(now)
+
+    def finish(self) -> None:
+        self._draw(time.monotonic())
+        if self._tty:
+            self.stream.write("\n")
+        self.stream.flush()
+
+    def _draw(self, now: float) -> None:
+        self._last_draw = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        if rate > 0 and self.total:
+            eta = f"{(self.total - self.done) / rate:6.0f}s"
+        else:
+            eta = "     ?"
+
+        line = (f"{self.label}: {self.done}/{self.total} "
+                f"| {rate:6.1f}/s | ETA {eta}")
+        if self._tty:
+            self.stream.write(f"\r{line}")
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+
+def _connect(db_path: Path | None = None):
+    # Opened on the pipeline's writer thread, so kept out of a `with` block.
+    from .database import DatabaseConnector
+    return DatabaseConnector(db_path).con
+
+
+def _shard_spec(text: str) -> tuple[int, int]:
+    """INDEX/COUNT, e.g. 0/4, as (index, count)."""
+    try:
+        index, count = map(int, text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not INDEX/COUNT.")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"Shard index {index} is not in 0 to {count - 1}.")
+    return index, count
+
+
+class _FilterAction(argparse.Action):
+    """
+    KEY VALUE, where only KEY must be one of `choices` (argparse would
+    check both values against them).
+    """
+
+    def __init__(self, *args, choices, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.keys = choices
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if values[0] not in self.keys:
+            parser.error(f"argument {option_string}: invalid key "
+                         f"{values[0]!r} (choose from "
+                         f"{', '.join(map(repr, self.keys))})")
+        setattr(namespace, self.dest, values)
+
+
+def _print_books(books: list[Book]) -> None:
+    for book in books:
+        authors = ", ".join(book.authors)
+        print(f"{book.book_id:>6}  {book.title or '-':<40.40}  "
+              f"{authors or '-':<25.25}  {book.year or '':>4}  "
+              f"{book.ext:<5}  {book.filename}")
+
+
+def _open_isbn_index(args: argparse.Namespace):
+    from .isbnindex import ISBNIndex, default_index_path
+
+    path = args.isbn_index
+    if path is None and default_index_path().exists():
+        path = default_index_path()
+    return None if path is None else ISBNIndex(path)
+
+
+def _open_title_index(args: argparse.Namespace):
+    from .titleindex import TitleIndex, default_index_path
+
+    path = args.title_index
+    if path is None and default_index_path().exists():
+        path = default_index_path()
+    return None if path is None else TitleIndex(path)
+
+
+def _open_text_store(create: bool = False):
+    """The TextStore of the library, or None if it was never filled."""
+    from .textstore import TextStore, default_store_path
+
+    path = default_store_path()
+    return TextStore(path) if create or path.is_dir() else None
+
+
+def _run_import(
+    args: argparse.Namespace, name: str, folderpath: Path, skip: set[str]
+) -> int:
+    """Scan folderpath and import the files whose hash_id is not in skip."""
+    import asyncio
+    from .archive import ARCHIVE_FORMATS, expand_archives
+    from .cover import (
+        BookCover, CoverLedger, OLCoverFetcher, FileCoverExtractor
+    )
+    from .importer import BookImporter, ISBNParser, MetadataFetcher, FORMATS
+    from .pipeline import ImportPipeline
+    from .sandbox import SandboxedISBNParser
+    from .scanner import DirectoryScanner
+
+    backend = None
+    if args.ocr:
+        from .ocr import OCRStage, TesseractBackend
+        try:
+            backend = TesseractBackend()
+        except ImportError as e:
+            print(f"--ocr: {e}", file=sys.stderr)
+            return 2
+
+    extensions = FORMATS | ARCHIVE_FORMATS if args.archives else FORMATS
+    scanner = DirectoryScanner(extensions, workers=args.scan_workers)
+    scanned_files = scanner.scan(folderpath)
+    if args.archives:
+        scanned_files = expand_archives(scanned_files, FORMATS)
+    db_path = None
+    if args.shard is not None:
+        from .config import get_config
+        from .database import BookDBHandler, DatabaseConnector
+        from .shard import default_shard_path, select_shard
+
+        db_path = args.shard_db or default_shard_path(
+            get_config().document_folder, *args.shard)
+        scanned_files = select_shard(scanned_files, folderpath, *args.shard)
+        if not args.no_cache:
+            with DatabaseConnector(db_path) as con:
+                skip = skip | BookDBHandler(con).load_hash_ids()
+
+    files = [scanned for scanned in scanned_files
+             if Book.hash_filename(scanned.path.name) not in skip]
+    print(f"{len(files)} new files in {folderpath}")
+    if args.dry_run:
+        for scanned in files:
+            print(f"  {scanned.path.relative_to(folderpath)}")
+        return 0
+    if not files:
+        return 0
+
+    text_store = _open_text_store(create=True) if args.store_text else None
+    parser = ISBNParser(pages_to_read=args.pages, text_store=text_store)
+    if args.sandbox:
+        parser = SandboxedISBNParser(parser, workers=args.parse_workers)
+    index = _open_isbn_index(args)
+    titles = _open_title_index(args)
+    bookcover = ledger = extractor = None
+    if args.covers:
+        ledger = CoverLedger()
+        extractor = FileCoverExtractor()
+        bookcover = BookCover(OLCoverFetcher(ledger=ledger), extractor)
+    ocr = None
+    if backend is not None:
+        # Page one is only shared when covers are extracted too.
+        ocr = OCRStage(backend, workers=args.ocr_workers, dpi=args.ocr_dpi,
+                       cover_extractor=extractor)
+    importer = BookImporter(MetadataFetcher(index, offline=args.offline),
+                            parser, ocr=ocr, titles=titles)
+
+    progress = ProgressReporter(len(files), "import")
+    pipeline = ImportPipeline(
+        importer, bookcover, lambda: _connect(db_path),
+        parse_workers=args.parse_workers, fetch_workers=args.fetch_workers,
+        write_batch_size=args.batch_size,
+        write_interval=args.commit_interval,
+        on_progress=lambda book: progress.update()
+    )
+    folder = {"name": name, "path": folderpath}
+    try:
+        asyncio.run(pipeline.import_files(files, folder))
+    finally:
+        progress.finish()
+        if args.sandbox:
+            parser.close()
+        if ledger is not None:
+            ledger.close()
+        if index is not None:
+            index.close()
+        if titles is not None:
+            titles.close()
+        if ocr is not None:
+            ocr.close()
+
+    for failure in importer.failures:
+        print(f"  [{failure.status.name}] {failure.file.name} "
+              f"{failure.message}")
+    return 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    folderpath = args.folder.resolve()
+    if not folderpath.is_dir():
+        print(f"{folderpath} is not a folder.", file=sys.stderr)
+        return 1
+
+    # A shard only skips its own files (see _run_import): workers never
+    # open the library, which may be on another machine.
+    if args.no_cache or args.shard is not None:
+        return _run_import(args, folderpath.name, folderpath, set())
+
+    from .database import DatabaseConnector, BookDBHandler
+    with DatabaseConnector() as con:
+        skip = BookDBHandler(con).load_hash_ids()
+    return _run_import(args, folderpath.name, folderpath, skip)
+
+
+def cmd_rescan(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, BookDBHandler, FolderDBHandler
+
+    with DatabaseConnector() as con:
+        folders = FolderDBHandler(con).load_folders(filter_key="active")
+        skip = set() if args.no_cache else BookDBHandler(con).load_hash_ids()
+
+    if args.folder:
+        folders = [f for f in folders if f.name in args.folder]
+
+    status = 0
+    for folder in folders:
+        if not folder.path.is_dir():
+            print(f"{folder.name}: {folder.path} is missing.",
+                  file=sys.stderr)
+            status = 1
+            continue
+        status = _run_import(args, folder.name, folder.path, skip) or status
+    return status
+
+
+def cmd_covers(args: argparse.Namespace) -> int:
+    from .cover import (
+        BookCover, CoverLedger, OLCoverFetcher, FileCoverExtractor
+    )
+    from .database import DatabaseConnector, BookDBHandler
+    from .query import BookQuery, Condition
+
+    with DatabaseConnector() as con:
+        handler = BookDBHandler(con)
+        query = BookQuery()
+        if not args.no_cache:
+            query = query.where(Condition("cover_path", "is null"))
+        books = handler.find_books(query)
+        print(f"{len(books)} books without cover")
+        if args.dry_run or not books:
+            return 0
+
+        ledger = CoverLedger()
+        fetcher = OLCoverFetcher(refresh=args.no_cache, ledger=ledger)
+        bookcover = BookCover(fetcher, FileCoverExtractor())
+        progress = ProgressReporter(len(books), "covers")
+        try:
+            for i in range(0, len(books), args.batch_size):
+                batch = bookcover.get_cover_for_books(
+                    books[i:i + args.batch_size]
+                )
+                handler.update_books(
+                    (book.book_id, {"cover_path": str(book.cover_path)})
+                    for book in batch if book.cover_path is not None
+                )
+                progress.update(len(batch))
+        finally:
+            progress.finish()
+            ledger.close()
+    return 0
+
+
+def _parse_value(text: str) -> Any:
+    """JSON values (2010, [".pdf", ".epub"], null), plain text otherwise."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def cmd_list(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, BookDBHandler
+    from .query import BookQuery, Condition
+
+    with DatabaseConnector() as con:
+        handler = BookDBHandler(con)
+        if args.where or args.order:
+            try:
+                query = BookQuery().where(*(
+                    Condition(field, op.lower(), _parse_value(value))
+                    for field, op, value in args.where or ()
+                )).order_by(*args.order or ())
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 2
+            if args.limit:
+                query = query.page(args.limit)
+            books = handler.find_books(query)
+        elif args.filter:
+            key, value = args.filter
+            books = handler.load_books(args.sort, key, value)
+        else:
+            books = handler.load_books(args.sort)
+
+    _print_books(books[:args.limit] if args.limit else books)
+    return 0
+
+
+def cmd_search(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, BookDBHandler
+
+    with DatabaseConnector() as con:
+        books = BookDBHandler(con).search_books(" ".join(args.text))
+    _print_books(books)
+    return 0 if books else 1
+
+
+def cmd_dedupe(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, DuplicateDBHandler
+
+    with DatabaseConnector() as con:
+        handler = DuplicateDBHandler(con)
+        duplicates = handler.load_duplicates()
+        original = None
+        for duplicate in duplicates:
+            if duplicate["original_book_id"] != original:
+                original = duplicate["original_book_id"]
+                print(f"{original:>6}  {duplicate['original_title'] or '-'}"
+                      f"  ({duplicate['original_filename']})")
+            path = Path(duplicate["folder_path"] or "")
+            print(f"        {path / duplicate['storage_path']}")
+
+        if args.clear and not args.dry_run:
+            print(f"Cleared {handler.delete_duplicates()} duplicate records.")
+    return 0
+
+
+def cmd_delete(args: argparse.Namespace) -> int:
+    from .cleanup import FileCleaner
+    from .database import DatabaseConnector, BookDBHandler, FolderDBHandler
+
+    with (DatabaseConnector() as con,
+          FileCleaner(_open_text_store()) as cleaner):
+        if args.folders:
+            count = FolderDBHandler(con).delete_folders(args.ids, args.soft,
+                                                        cleaner)
+        else:
+            count = BookDBHandler(con).delete_books(args.ids, args.soft,
+                                                    cleaner)
+
+    kind = "folders" if args.folders else "books"
+    print(f"{'Deactivated' if args.soft else 'Deleted'} {count} {kind}.")
+    return 0 if count else 1
+
+
+def cmd_restore(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, BookDBHandler, FolderDBHandler
+
+    with DatabaseConnector() as con:
+        if args.folders:
+            count = FolderDBHandler(con).restore_folders(args.ids)
+        else:
+            count = BookDBHandler(con).restore_books(args.ids)
+
+    print(f"Restored {count} {'folders' if args.folders else 'books'}.")
+    return 0 if count else 1
+
+
+def cmd_relocate(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, FolderDBHandler
+
+    with DatabaseConnector() as con:
+        try:
+            moved = FolderDBHandler(con).relocate_folder(
+                args.folder_id, args.path.resolve(), sample=args.sample,
+                covers=args.covers
+            )
+        except (ValueError, FileNotFoundError) as e:
+            print(e, file=sys.stderr)
+            return 1
+    if moved:
+        print(f"Folder {args.folder_id} relocated to {args.path.resolve()}")
+    return 0 if moved else 1
+
+
+def cmd_purge(args: argparse.Namespace) -> int:
+    from .cleanup import FileCleaner
+    from .database import DatabaseConnector, BookDBHandler, FolderDBHandler
+
+    with (DatabaseConnector() as con,
+          FileCleaner(_open_text_store()) as cleaner):
+        folders = FolderDBHandler(con).purge_folders(cleaner)
+        books = BookDBHandler(con).purge_books(cleaner)
+        print(f"Purged {folders} folders and {books} books.")
+
+        if args.vacuum != "none":
+            DatabaseConnector.vacuum(con, args.pages,
+                                     full=args.vacuum == "full")
+    return 0
+
+
+def cmd_stats(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector, StatsDBHandler
+
+    with DatabaseConnector() as con:
+        stats = StatsDBHandler(con)
+        summary = stats.summary()
+        folders = con.execute("SELECT count(*) FROM Folder").fetchone()[0]
+        duplicates = con.execute(
+            "SELECT count(*) FROM Duplicate").fetchone()[0]
+        if args.by == "folder":
+            rows = [{"value": row["path"], "books": row["books"],
+                     "bytes": row["bytes"]} for row in stats.folder_sizes()]
+        else:
+            rows = stats.breakdown(args.by)
+
+    print(f"Books:          {summary['books']}")
+    print(f"Folders:        {folders}")
+    print(f"Duplicates:     {duplicates}")
+    print(f"Total size:     {summary['bytes'] / 1024 ** 2:.1f} MiB")
+    print(f"Without cover:  {summary['missing_cover']}")
+    print(f"Without ISBN:   {summary['missing_isbn']}")
+    for row in rows:
+        print(f"  {str(row['value']):<20} {row['books']:>7} books  "
+              f"{row['bytes'] / 1024 ** 2:10.1f} MiB")
+    return 0
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector
+    from .export import export_library, count_rows
+
+    with DatabaseConnector() as con:
+        progress = ProgressReporter(count_rows(con), "Exporting")
+        counts = export_library(con, args.folder, args.format,
+                                on_progress=lambda _, n: progress.update(n))
+        progress.finish()
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    return 0
+
+
+def cmd_load(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector
+    from .export import import_library
+
+    with DatabaseConnector() as con:
+        progress = ProgressReporter(0, "Loading")
+        try:
+            counts = import_library(
+                con, args.folder, replace=args.replace,
+                on_progress=lambda _, n: progress.update(n)
+            )
+        except (ValueError, FileNotFoundError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        progress.finish()
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    return 0
+
+
+def cmd_merge(args: argparse.Namespace) -> int:
+    import sqlite3
+    from .database import DatabaseConnector
+    from .shard import merge_shard
+
+    with DatabaseConnector() as con:
+        for path in args.shards:
+            try:
+                counts = merge_shard(con, path)
+            except (ValueError, FileNotFoundError, sqlite3.Error) as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                return 1
+            print(f"{path}: {counts['Book']} books, "
+                  f"{counts['Duplicate']} duplicates, "
+                  f"{counts['Folder']} new folders")
+    return 0
+
+
+def cmd_check(args: argparse.Namespace) -> int:
+    from .database import DatabaseConnector
+    from .integrity import Finding, IntegrityChecker
+
+    with DatabaseConnector() as con:
+        total = con.execute("SELECT count(*) FROM Book").fetchone()[0]
+        progress = ProgressReporter(total, "check")
+        checker = IntegrityChecker(
+            con, content_hash=args.hash, relink=args.relink,
+            workers=args.workers, on_progress=progress.update
+        )
+        try:
+            issues = checker.check()
+        finally:
+            progress.finish()
+
+    for issue in issues:
+        line = f"  [{issue.finding.name}] Book {issue.book_id} {issue.path}"
+        if issue.new_path is not None:
+            line += f" -> {issue.new_path}"
+        print(line)
+    unresolved = [issue for issue in issues
+                  if issue.finding != Finding.RELINKED]
+    print(f"{total} books checked, {len(issues)} findings")
+    return 1 if unresolved else 0
+
+
+def cmd_isbn_index(args: argparse.Namespace) -> int:
+    from .isbnindex import ISBNIndex, default_index_path
+
+    output = args.output or default_index_path()
+    progress = ProgressReporter(0, "editions")
+    last = 0
+
+    def on_progress(count: int) -> None:
+        nonlocal last
+        progress.update(count - last)
+        last = count
+
+    try:
+        with ISBNIndex.build(args.editions, output, args.authors,
+                             on_progress) as index:
+            size = len(index)
+    finally:
+        progress.finish()
+    print(f"{size} ISBNs indexed in {output}")
+    return 0
+
+
+def cmd_title_index(args: argparse.Namespace) -> int:
+    import itertools
+    from .database import DatabaseConnector
+    from .titleindex import TitleIndex, default_index_path, library_entries
+
+    output = args.output or default_index_path()
+    isbn_index = _open_isbn_index(args)
+    progress = ProgressReporter(0, "titles")
+    last = 0
+
+    def on_progress(count: int) -> None:
+        nonlocal last
+        progress.update(count - last)
+        last = count
+
+    try:
+        with DatabaseConnector() as con:
+            entries = library_entries(con)
+            if isbn_index is not None:
+                entries = itertools.chain(entries, isbn_index.entries())
+            with TitleIndex.build(entries, output, on_progress) as index:
+                size = len(index)
+    finally:
+        progress.finish()
+        if isbn_index is not None:
+            isbn_index.close()
+    print(f"{size} titles indexed in {output}")
+    return 0
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    from .server import serve
+
+    print(f"Serving the catalog on http://{args.host}:{args.port}",
+          file=sys.stderr)
+    serve(args.host, args.port, readers=args.readers,
+          cache_size=args.cache_size)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from .database import BookDBHandler
+
+    parser = argparse.ArgumentParser(
+        prog="pdfshelf", description="PDF and EPUB library utility."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="also log to the console")
+    parser.add_argument("--log-json", action="store_true",
+                        help="write the log file as JSON Lines")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the command, report in the config "
+                             "folder (or set PDFSHELF_PROFILE=1)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    importing = argparse.ArgumentParser(add_help=False)
+    importing.add_argument("--parse-workers", type=int, default=4)
+    importing.add_argument("--fetch-workers", type=int, default=8)
+    importing.add_argument("--scan-workers", type=int, default=1)
+    importing.add_argument("--batch-size", type=int, default=100,
+                           help="books per database transaction")
+    importing.add_argument("--commit-interval", type=float, default=2.0,
+                           help="seconds before a partial batch is committed")
+    importing.add_argument("--pages", type=int, default=10,
+                           help="pages searched for an ISBN")
+    importing.add_argument("--covers", action="store_true",
+                           help="fetch covers while importing")
+    importing.add_argument("--no-sandbox", dest="sandbox",
+                           action="store_false",
+                           help="parse in threads instead of processes")
+    importing.add_argument("--no-cache", action="store_true",
+                           help="re-import files already in the database")
+    importing.add_argument("--dry-run", action="store_true",
+                           help="only list the files that would be imported")
+    importing.add_argument("--archives", action="store_true",
+                           help="also import the PDFs and EPUBs inside "
+                                ".zip/.cbz archives, without extracting them")
+    importing.add_argument("--ocr", action="store_true",
+                           help="OCR scanned PDFs without a text layer "
+                                "(requires pytesseract and tesseract)")
+    importing.add_argument("--ocr-workers", type=int, default=2,
+                           help="OCR processes")
+    importing.add_argument("--ocr-dpi", type=int, default=150,
+                           help="resolution of the OCRed pages")
+    importing.add_argument("--store-text", action="store_true",
+                           help="keep the full text of the books in the "
+                                "text folder, for later re-parsing")
+    importing.add_argument("--isbn-index", type=Path,
+                           help="offline ISBN index searched before the "
+                                "network (default: isbn.db, if built)")
+    importing.add_argument("--offline", action="store_true",
+                           help="only use the offline ISBN index")
+    importing.add_argument("--title-index", type=Path,
+                           help="title index matched when a book has no "
+                                "ISBN (default: titles.db, if built)")
+    importing.add_argument("--shard", type=_shard_spec,
+                           metavar="INDEX/COUNT",
+                           help="only import this shard of the files (0/4 "
+                                "to 3/4), into its own database to merge")
+    importing.add_argument("--shard-db", type=Path,
+                           help="database of the shard (default: "
+                                "shard-INDEX-of-COUNT.db)")
+
+    p = sub.add_parser("import", parents=[importing],
+                       help="import a folder")
+    p.add_argument("folder", type=Path)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("rescan", parents=[importing],
+                       help="import new files of the known folders")
+    p.add_argument("--folder", action="append",
+                   help="folder name (repeatable), default all active")
+    p.set_defaults(func=cmd_rescan)
+
+    p = sub.add_parser("covers", help="fetch missing covers")
+    p.add_argument("--batch-size", type=int, default=85)
+    p.add_argument("--no-cache", action="store_true",
+                   help="fetch covers again even when one exists")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_covers)
+
+    p = sub.add_parser("list", help="list books")
+    p.add_argument("--sort", default="no_sorting",
+                   choices=["no_sorting", "title", "added_date", "year",
+                            "size"])
+    p.add_argument("--filter", nargs=2, metavar=("KEY", "VALUE"),
+                   action=_FilterAction,
+                   choices=sorted(BookDBHandler.FILTERING),
+                   help="publisher, author, tag, ext, year, active "
+                        "or confirmed")
+    p.add_argument("--where", nargs=3, action="append",
+                   metavar=("FIELD", "OP", "VALUE"),
+                   help="indexed filter, repeatable (ANDed): e.g. "
+                        "year '>' 2010, ext in '[\".pdf\"]', author = Plato")
+    p.add_argument("--order", action="append",
+                   help="sort field, repeatable; --order=-year sorts "
+                        "descending")
+    p.add_argument("--limit", type=int, default=0)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("search", help="search title, authors and filename")
+    p.add_argument("text", nargs="+")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("dedupe", help="show duplicate files")
+    p.add_argument("--clear", action="store_true",
+                   help="delete the duplicate records (not the files)")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_dedupe)
+
+    p = sub.add_parser("delete", help="delete books or folders")
+    p.add_argument("ids", type=int, nargs="+")
+    p.add_argument("--folders", action="store_true",
+                   help="the ids are folder ids")
+    p.add_argument("--soft", action="store_true",
+                   help="only deactivate, until restored or purged")
+    p.set_defaults(func=cmd_delete)
+
+    p = sub.add_parser("relocate", help="point a folder at the new "
+                                        "location of its files")
+    p.add_argument("folder_id", type=int)
+    p.add_argument("path", type=Path)
+    p.add_argument("--sample", type=int, default=64,
+                   help="books whose files are checked at the new path")
+    p.add_argument("--covers", type=Path, nargs=2, metavar=("OLD", "NEW"),
+                   help="also move the cover paths under OLD to NEW")
+    p.set_defaults(func=cmd_relocate)
+
+    p = sub.add_parser("restore", help="reactivate soft-deleted items")
+    p.add_argument("ids", type=int, nargs="+")
+    p.add_argument("--folders", action="store_true")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("purge", help="hard-delete soft-deleted items "
+                                     "(schedule with cron)")
+    p.add_argument("--vacuum", choices=["incremental", "full", "none"],
+                   default="incremental")
+    p.add_argument("--pages", type=int,
+                   help="pages freed by an incremental vacuum")
+    p.set_defaults(func=cmd_purge)
+
+    p = sub.add_parser("stats", help="library statistics")
+    p.add_argument("--by", default="ext",
+                   choices=["folder", "ext", "publisher", "year", "lang",
+                            "confirmed", "active"],
+                   help="breakdown to list (default: ext)")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("export", help="export the library tables")
+    p.add_argument("folder", type=Path)
+    p.add_argument("--format", default="parquet",
+                   choices=["parquet", "arrow", "jsonl"],
+                   help="parquet and arrow need pyarrow (default: parquet)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("load", help="load an export into the library")
+    p.add_argument("folder", type=Path)
+    p.add_argument("--replace", action="store_true",
+                   help="replace the books and folders in the library")
+    p.set_defaults(func=cmd_load)
+
+    p = sub.add_parser("merge", help="merge shard databases of a sharded "
+                                     "import into the library")
+    p.add_argument("shards", type=Path, nargs="+")
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser("check", help="check that the books still point at "
+                                     "their files and covers")
+    p.add_argument("--hash", action="store_true",
+                   help="also compare content checksums (reads every file)")
+    p.add_argument("--no-relink", dest="relink", action="store_false",
+                   help="do not search the folders for missing files")
+    p.add_argument("--workers", type=int, default=16)
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("isbn-index", help="build the offline ISBN index "
+                                          "from an editions dump")
+    p.add_argument("editions", type=Path,
+                   help="editions dump, JSON Lines or OpenLibrary TSV, "
+                        "optionally gzipped")
+    p.add_argument("--authors", type=Path,
+                   help="OpenLibrary authors dump, to resolve author keys")
+    p.add_argument("--output", type=Path,
+                   help="index file (default: isbn.db in the documents "
+                        "folder)")
+    p.set_defaults(func=cmd_isbn_index)
+
+    p = sub.add_parser("title-index", help="build the title index from the "
+                                           "library and the ISBN index")
+    p.add_argument("--isbn-index", type=Path,
+                   help="ISBN index whose editions are added "
+                        "(default: isbn.db, if built)")
+    p.add_argument("--output", type=Path,
+                   help="index file (default: titles.db in the documents "
+                        "folder)")
+    p.set_defaults(func=cmd_title_index)
+
+    p = sub.add_parser("serve", help="read-only HTTP catalog")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--readers", type=int, default=4,
+                   help="database reader threads")
+    p.add_argument("--cache-size", type=int, default=256,
+                   help="cached responses, 0 disables the cache")
+    p.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(
+    argv: list[str] | None = None, *, log_dependencies: bool = False
+) -> int:
+    """
+    Run a command. `log_dependencies` also logs other libraries, to
+    pdfshelf_dependencies.log.
+    """
+    args = build_parser().parse_args(argv)
+
+    if (args.command not in ("list", "search", "stats") or args.verbose
+            or log_dependencies):
+        from .log import setup_logging
+        setup_logging(json_format=args.log_json,
+                      dependencies=log_dependencies)
+
+    from . import profiling
+    if not (args.profile or profiling.is_enabled()):
+        return args.func(args)
+
+    profiling.enable()
+    with profiling.profile_run(args.command) as report:
+        code = args.func(args)
+    print(f"Profile written to {report}", file=sys.stderr)
+    return code
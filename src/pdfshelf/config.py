@@ -1,17 +1,33 @@
 import os
+import functools
 import configparser
 from pathlib import Path
+from dataclasses import dataclass
+
+# Importing this module has no side effects: folders and config.ini are
+# only created when the configuration is first resolved.
 
 user_folder = Path(os.path.expanduser("~"))
 config_folder = user_folder / ".config" / "pdfshelf"
-config_folder.mkdir(exist_ok=True)
 
 
-def create_base_config_file() -> None:
-    config_file_path = config_folder / "config.ini"
+@dataclass(kw_only=True, frozen=True)
+class Config:
+    config_folder: Path
+    document_folder: Path
+    cover_folder: Path
+
+    def ensure_folders(self) -> None:
+        self.document_folder.mkdir(parents=True, exist_ok=True)
+        self.cover_folder.mkdir(parents=True, exist_ok=True)
+
+
+def create_base_config_file(folder: Path = config_folder) -> None:
+    config_file_path = folder / "config.ini"
     if config_file_path.exists():
         return
 
+    folder.mkdir(parents=True, exist_ok=True)
     default_document_folder = user_folder / "Documents" / "PDFShelf"
     conf = configparser.ConfigParser()
     conf["DEFAULT"] = {
@@ -19,16 +35,39 @@ def create_base_config_file() -> None:
         "cover_folder": str(default_document_folder / "cover")
     }
 
-    with open(config_file_path, 'w') as configfile:
+    # Written aside and renamed, so processes starting together (e.g.
+    # the workers of a sharded import) never read a partial file.
+    tmp_path = folder / f"config.ini.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as configfile:
         conf.write(configfile)
+    os.replace(tmp_path, config_file_path)
+
+
+def load_config(folder: Path = config_folder) -> Config:
+    """Read config.ini from folder, writing the defaults on first use."""
+    create_base_config_file(folder)
+    conf = configparser.ConfigParser()
+    conf.read(folder / "config.ini")
+
+    return Config(
+        config_folder=folder,
+        document_folder=Path(conf["DEFAULT"]["default_document_folder"]),
+        cover_folder=Path(conf["DEFAULT"]["cover_folder"])
+    )
+
 
+@functools.cache
+def get_config() -> Config:
+    """The user configuration, resolved once, with its folders created."""
+    config = load_config()
+    config.ensure_folders()
+    return config
 
-create_base_config_file()
-config = configparser.ConfigParser()
-config.sections()
-config.read(config_folder / "config.ini")
 
-default_document_folder = Path(config["DEFAULT"]["default_document_folder"])
-default_document_folder.mkdir(exist_ok=True)
-COVER_FOLDER = Path(config["DEFAULT"]["cover_folder"])
-COVER_FOLDER.mkdir(exist_ok=True)
+def __getattr__(name: str):
+    # Lazy aliases for the module-level paths older code imports.
+    if name == "default_document_folder":
+        return get_config().document_folder
+    if name == "COVER_FOLDER":
+        return get_config().cover_folder
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
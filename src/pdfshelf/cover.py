@@ -1,18 +1,26 @@
-import asyncio
-import requests
-import traceback
+import os
+import mmap
+import sqlite3
+import hashlib
+import threading
 import time
 import logging
-import pdf2image
-import ebooklib
-from ebooklib import epub
+import posixpath
+import subprocess
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable
-from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
-from ebooklib.epub import EpubException
+from typing import BinaryIO, Callable, Iterable, Iterator, Mapping
+from urllib.parse import unquote
+from xml.etree import ElementTree
+from .archive import open_book, open_member, split_member
 from .exceptions import FormatNotSupportedError
-from .config import COVER_FOLDER
+from .config import get_config
 from .domain import Book
+from .profiling import profiled
+from .utilities import lazy_import
 
 
 # TODO: DOC-STRINGS
@@ -20,13 +28,132 @@ from .domain import Book
 CoverExtractFunc = Callable[[Book], Book]
 LOGGER = logging.getLogger(__name__)
 
+asyncio = lazy_import("asyncio")
+requests = lazy_import("requests")
+pdf2image = lazy_import("pdf2image")
+
+CHUNK_SIZE = 64 * 1024
+# pdf2image's default, for covers rendered from archive members.
+COVER_DPI = 200
+OPF = "{http://www.idpf.org/2007/opf}"
+CONTAINER = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+
+
+def _open_temp(path: Path) -> tuple[BinaryIO, Path]:
+    """
+    A new temporary file next to path. Books with the same file name share
+    a hash_id, so their covers may be written to one path at once.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent,
+                                    prefix=f"{path.name}.", suffix=".tmp")
+    return os.fdopen(fd, "wb"), Path(tmp_path)
+
+
+@contextmanager
+def atomic_file(path: Path) -> Iterator[BinaryIO]:
+    """
+    A temporary file next to path, renamed over it only when the block
+    ends without errors: a crash never leaves a half-written cover.
+    """
+    file, tmp_path = _open_temp(path)
+    try:
+        with file:
+            yield file
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+
+
+def _digest(chunks: Iterable[bytes]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.digest()
+
+
+def _read_chunks(file: BinaryIO) -> Iterator[bytes]:
+    return iter(lambda: file.read(CHUNK_SIZE), b"")
+
+
+def cover_exists(path: Path | None) -> bool:
+    """Whether path holds a complete cover (written files are never empty)."""
+    try:
+        return path is not None and path.stat().st_size > 0
+    except OSError:
+        return False
+
+
+def write_cover(path: Path, chunks: Iterable[bytes]) -> bool:
+    """
+    Stream chunks to path, atomically. Returns False, leaving the stored
+    file (and its mtime) alone, when it already has the same size and
+    BLAKE2 digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    file, tmp_path = _open_temp(path)
+    try:
+        with file:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                file.write(chunk)
+
+        if cover_exists(path) and path.stat().st_size == size:
+            with open(path, "rb") as stored:
+                if _digest(_read_chunks(stored)) == digest.digest():
+                    tmp_path.unlink()
+                    return False
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+    return True
+
+
+@contextmanager
+def map_cover(path: Path) -> Iterator[memoryview]:
+    """
+    A read-only, memory-mapped view of a cover file, for serving or
+    thumbnailing without copying it into memory. The view (and slices
+    of it) must not be used after the block.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield memoryview(b"")
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+def _epub_cover_member(zf: zipfile.ZipFile) -> str | None:
+    """Zip member of the manifest item with the cover-image property."""
+    container = ElementTree.fromstring(zf.read("META-INF/container.xml"))
+    rootfile = container.find(f"{CONTAINER}rootfiles/{CONTAINER}rootfile")
+    if rootfile is None:
+        return None
+    opf_path = rootfile.get("full-path")
+    opf = ElementTree.fromstring(zf.read(opf_path))
+    for item in opf.iterfind(f"{OPF}manifest/{OPF}item"):
+        if "cover-image" in item.get("properties", "").split():
+            return posixpath.join(posixpath.dirname(opf_path),
+                                  unquote(item.get("href")))
+    return None
+
 
 class FileCoverExtractor:
     def __init__(self, cover_folder: Path | None = None):
         if cover_folder is None:
-            self.cover_folder = COVER_FOLDER
+            self.cover_folder = get_config().cover_folder
         else:
             self.cover_folder = cover_folder
+        # hash_ids whose PDF cover the OCR stage rendered during this run.
+        self._rendered: set[str] = set()
 
     def get_format_parser(self, fileformat: str) -> CoverExtractFunc:
         if fileformat == ".epub":
@@ -36,82 +163,237 @@ class FileCoverExtractor:
         else:
             raise FormatNotSupportedError("Format not supported.")
 
+    def get_pdf_cover_path(self, hash_id: str) -> Path:
+        return self.cover_folder / f"cover_fromPDF_{hash_id}.jpg"
+
+    def add_rendered(self, hash_id: str) -> None:
+        """
+        Mark the PDF cover of hash_id as freshly rendered at COVER_DPI, so
+        the next extraction uses it instead of rendering page one again.
+        """
+        self._rendered.add(hash_id)
+
     def _pdf_extractor(self, book: Book) -> Book:
-        cover_path = self.cover_folder / f"cover_fromPDF_{book.hash_id}.jpg"
+        cover_path = self.get_pdf_cover_path(book.hash_id)
+        try:
+            self._rendered.remove(book.hash_id)
+        except KeyError:
+            pass
+        else:
+            if cover_exists(cover_path):
+                book.cover_path = cover_path
+                LOGGER.info("[COVER] Reused page one of %s",
+                            book.get_short_filename())
+                return book
+
         file = book.get_full_path()
         try:
-            pages = pdf2image.convert_from_path(
-                file, first_page=1, last_page=1)
-            pages[0].save(cover_path, 'JPEG')
+            if split_member(file) is None:
+                pages = pdf2image.convert_from_path(
+                    file, first_page=1, last_page=1)
+                with atomic_file(cover_path) as cover:
+                    pages[0].save(cover, 'JPEG')
+            else:
+                self._render_member(file, cover_path)
             book.cover_path = cover_path
-            LOGGER.info("[COVER] Extracted from PDF for "
-                        f"{book.get_short_filename()}")
-            LOGGER.info(f"        Saved as {cover_path.name}")
-        except (PDFSyntaxError, PDFPageCountError):
+            LOGGER.info("[COVER] Extracted from PDF for %s",
+                        book.get_short_filename())
+            LOGGER.info("        Saved as %s", cover_path.name)
+        except (pdf2image.exceptions.PDFSyntaxError,
+                pdf2image.exceptions.PDFPageCountError, OSError,
+                zipfile.BadZipFile, subprocess.SubprocessError):
             LOGGER.error("[COVER-FAILED] Extraction from PDF failed.")
-            LOGGER.error("               File must be corruped or not exist.\n"
-                         f"{traceback.format_exc()}")
+            LOGGER.error("               File must be corruped or not exist.",
+                         exc_info=True)
         return book
 
+    def _render_member(self, file: Path, cover_path: Path) -> None:
+        """
+        Render the first page of a PDF inside an archive. pdf2image only
+        takes paths (or spools bytes to a temporary file), so the member
+        is piped to pdftoppm instead.
+        """
+        with open_member(file) as member:
+            data = member.read()
+        # pdftoppm adds the extension to the reserved name: the image is
+        # renamed over cover_path once done.
+        reserved, tmp_root = _open_temp(cover_path)
+        reserved.close()
+        tmp_path = tmp_root.with_name(f"{tmp_root.name}.jpg")
+        try:
+            subprocess.run(
+                ["pdftoppm", "-jpeg", "-singlefile", "-f", "1", "-l", "1",
+                 "-r", str(COVER_DPI), "-", str(tmp_root)],
+                input=data, capture_output=True, check=True
+            )
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            tmp_root.unlink()
+        os.replace(tmp_path, cover_path)
+
     def _epub_extractor(self, book: Book) -> Book:
         cover_path = self.cover_folder / f"cover_fromEPUB_{book.hash_id}.jpg"
 
+        # Read straight from the zip: epub.read_epub() would load every
+        # file of the book into memory to get at one image.
         try:
-            epubfile = epub.read_epub(book.get_full_path())
-            for item in epubfile.get_items():
-                if item.get_type() == ebooklib.ITEM_COVER:
-                    with open(cover_path, 'wb') as cover:
-                        cover.write(item.get_content())
-                    break
+            with (open_book(book.get_full_path()) as file,
+                  zipfile.ZipFile(file) as zf):
+                member = _epub_cover_member(zf)
+                if member is None:
+                    LOGGER.warning("[COVER-FAILED] No cover in EPUB %s",
+                                   book.get_short_filename())
+                    return book
+                with zf.open(member) as image:
+                    write_cover(cover_path, _read_chunks(image))
             book.cover_path = cover_path
-            LOGGER.info("[COVER] Extracted from EPUB for "
-                        f"{book.get_short_filename()}")
-            LOGGER.info(f"        Saved as {cover_path.name}")
-        except EpubException:
+            LOGGER.info("[COVER] Extracted from EPUB for %s",
+                        book.get_short_filename())
+            LOGGER.info("        Saved as %s", cover_path.name)
+        except (OSError, KeyError, zipfile.BadZipFile,
+                ElementTree.ParseError):
             LOGGER.error("[COVER-FAILED] Extraction from EPUB failed.")
-            LOGGER.error("               File must be corruped or not exist.\n"
-                         f"{traceback.format_exc()}")
+            LOGGER.error("               File must be corruped or not exist.",
+                         exc_info=True)
         return book
 
 
+@dataclass(kw_only=True)
+class CoverLookup:
+    isbn: str
+    size: str
+    status: int
+    etag: str | None = None
+    last_modified: str | None = None
+    checked: float
+
+
+class CoverLedger:
+    """
+    Persistent record of OpenLibrary cover lookups per ISBN and size: the
+    last status, and the ETag/Last-Modified of found covers for
+    conditional requests. ISBNs that got a 404 are not asked again for
+    `not_found_ttl` seconds. Safe to share between threads.
+    """
+
+    def __init__(
+        self, path: Path | None = None, not_found_ttl: float = 7 * 86400
+    ) -> None:
+        if path is None:
+            path = get_config().cover_folder / "lookups.db"
+        self.not_found_ttl = not_found_ttl
+        self._lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("""CREATE TABLE IF NOT EXISTS CoverLookup (
+                            isbn TEXT NOT NULL,
+                            size TEXT NOT NULL,
+                            status INTEGER NOT NULL,
+                            etag TEXT,
+                            last_modified TEXT,
+                            checked REAL NOT NULL,
+                            PRIMARY KEY (isbn, size)
+                            )""")
+        self.con.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self.con.close()
+
+    def get(self, isbn: str, size: str) -> CoverLookup | None:
+        with self._lock:
+            row = self.con.execute(
+                """SELECT status, etag, last_modified, checked
+                   FROM CoverLookup WHERE isbn = ? AND size = ?""",
+                (isbn, size)
+            ).fetchone()
+        if row is None:
+            return None
+        return CoverLookup(isbn=isbn, size=size, status=row[0], etag=row[1],
+                           last_modified=row[2], checked=row[3])
+
+    def record(self, lookup: CoverLookup) -> None:
+        with self._lock, self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO CoverLookup VALUES (?, ?, ?, ?, ?, ?)",
+                (lookup.isbn, lookup.size, lookup.status, lookup.etag,
+                 lookup.last_modified, lookup.checked)
+            )
+
+    def is_missing(self, isbn: str, size: str) -> bool:
+        """Whether OpenLibrary had no such cover less than a TTL ago."""
+        lookup = self.get(isbn, size)
+        return (lookup is not None and lookup.status == 404
+                and time.time() - lookup.checked < self.not_found_ttl)
+
+
 class OLCoverFetcher:
+    """
+    Downloads covers from OpenLibrary. Covers already stored are reused
+    without a request (and do not count against the rate limit) unless
+    `refresh`; a refreshed cover identical to the stored one is not
+    rewritten. With a `ledger`, refreshes are conditional requests and
+    recent 404s are not requested again.
+    """
+
+    SIZE = "L"
+
     def __init__(self, cover_folder: Path | None = None,
-                 rate_limiting: int = 85, waiting_time: float = 300):
+                 rate_limiting: int = 85, waiting_time: float = 300,
+                 refresh: bool = False, ledger: CoverLedger | None = None):
         if cover_folder is None:
-            self.cover_folder = COVER_FOLDER
+            self.cover_folder = get_config().cover_folder
         else:
             self.cover_folder = cover_folder
 
+        self.refresh = refresh
+        self.ledger = ledger
         self.rate_limiting = rate_limiting
         self.waiting_time = waiting_time
+        self._request_count = 0
 
     def fetch(self, books: list[Book]) -> list[Book]:
+        """Sync wrapper around async_fetch. Not usable inside a running loop."""
+        return asyncio.run(self.async_fetch(books))
+
+    async def async_fetch(self, books: list[Book]) -> list[Book]:
+        """
+        Fetch covers for a list of Books from OpenLibrary.
+
+        Requests are counted across calls, so the rate limiting holds when
+        books are fed in several batches (e.g. by the import pipeline).
+        """
         book_chunk = []
-        chunk_size = 0
         processed_books = []
 
         for book in books:
             book_chunk.append(book)
 
-            if book.isbn13 is None:
+            if not self._needs_request(book):
                 continue
 
-            chunk_size += 1
-            if chunk_size % self.rate_limiting == 0:
+            self._request_count += 1
+            if self._request_count % self.rate_limiting == 0:
                 processed_books = [*processed_books,
-                                   *asyncio.run(self._async_fetch(book_chunk))]
+                                   *await self._async_fetch_chunk(book_chunk)]
                 book_chunk = []
-                chunk_size = 0
-                LOGGER.warning("Too many requests."
-                               f" Waiting {self.waiting_time} seconds...")
-                time.sleep(self.waiting_time)
+                LOGGER.warning("Too many requests. Waiting %s seconds...",
+                               self.waiting_time)
+                await asyncio.sleep(self.waiting_time)
 
         if len(book_chunk) != 0:
             processed_books = [*processed_books,
-                               *asyncio.run(self._async_fetch(book_chunk))]
+                               *await self._async_fetch_chunk(book_chunk)]
         return processed_books
 
-    async def _async_fetch(self, books: list[Book]):
+    async def _async_fetch_chunk(self, books: list[Book]) -> list[Book]:
         return await asyncio.gather(
             *[self._async_fetch_cover(book) for book in books]
         )
@@ -119,36 +401,111 @@ class OLCoverFetcher:
     async def _async_fetch_cover(self, book: Book) -> Book:
         return await asyncio.to_thread(self._fetch_cover, book)
 
+    def get_cover_path(self, hash_id: str) -> Path:
+        return self.cover_folder / f"cover_OL_{hash_id}.jpg"
+
+    def _is_stored(self, book: Book) -> bool:
+        return not self.refresh and cover_exists(
+            self.get_cover_path(book.hash_id))
+
+    def _is_missing(self, book: Book) -> bool:
+        return (self.ledger is not None
+                and self.ledger.is_missing(book.isbn13, self.SIZE))
+
+    def _needs_request(self, book: Book) -> bool:
+        return not (book.isbn13 is None or self._is_stored(book)
+                    or self._is_missing(book))
+
+    def _conditional_headers(self, book: Book, cover_path: Path) -> dict:
+        if self.ledger is None or not cover_exists(cover_path):
+            return {}
+        lookup = self.ledger.get(book.isbn13, self.SIZE)
+        if lookup is None or lookup.status != 200:
+            return {}
+
+        headers = {}
+        if lookup.etag:
+            headers["If-None-Match"] = lookup.etag
+        if lookup.last_modified:
+            headers["If-Modified-Since"] = lookup.last_modified
+        return headers
+
+    def _record(
+        self, book: Book, status: int,
+        headers: Mapping[str, str | None] | None = None
+    ) -> None:
+        if self.ledger is None:
+            return
+        headers = headers or {}
+        self.ledger.record(CoverLookup(
+            isbn=book.isbn13, size=self.SIZE, status=status,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"), checked=time.time()
+        ))
+
     def _fetch_cover(self, book: Book) -> Book:
         if book.isbn13 is None:
-            LOGGER.warning("[COVER-FAILED] NO ISBN for "
-                           f"{book.get_short_filename()}")
+            LOGGER.warning("[COVER-FAILED] NO ISBN for %s",
+                           book.get_short_filename())
             return book
 
-        size = 'L'
+        cover_path = self.get_cover_path(book.hash_id)
+        if self._is_stored(book):
+            LOGGER.info("[COVER] Already downloaded for %s",
+                        book.get_short_filename())
+            book.cover_path = cover_path
+            return book
+
+        if self._is_missing(book):
+            LOGGER.info("[COVER-FAILED] NOT Found (cached) for %s",
+                        book.get_short_filename())
+            return book
+
+        size = self.SIZE
         isbn = book.isbn13
         url = f"https://covers.openlibrary.org/b/isbn/{isbn}-{size}.jpg?default=false"
+        headers = self._conditional_headers(book, cover_path)
 
         try:
-            r = requests.get(url, timeout=40)
-            if r.status_code == 200:
-                cover_path = self.cover_folder / f"cover_OL_{book.hash_id}.jpg"
-
-                with open(cover_path, 'wb') as file:
-                    file.write(r.content)
-
-                LOGGER.info(f"[COVER] Found for {book.get_short_filename()}")
-                LOGGER.info(f"        Saved as {cover_path.name}")
-                book.cover_path = cover_path
-            else:
-                LOGGER.warning("[COVER-FAILED] NOT Found for "
-                               f"{book.get_short_filename()}")
+            with requests.get(url, timeout=40, stream=True,
+                              headers=headers) as r:
+                if r.status_code == 304:
+                    LOGGER.info("[COVER] Not modified for %s",
+                                book.get_short_filename())
+                    self._record(book, 200, {
+                        "ETag": r.headers.get("ETag",
+                                              headers.get("If-None-Match")),
+                        "Last-Modified": headers.get("If-Modified-Since")
+                    })
+                    book.cover_path = cover_path
+                elif r.status_code == 200:
+                    changed = write_cover(cover_path,
+                                          r.iter_content(CHUNK_SIZE))
+
+                    LOGGER.info("[COVER] Found for %s",
+                                book.get_short_filename())
+                    if changed:
+                        LOGGER.info("        Saved as %s", cover_path.name)
+                    else:
+                        LOGGER.info("        Unchanged %s", cover_path.name)
+                    self._record(book, 200, r.headers)
+                    book.cover_path = cover_path
+                elif r.status_code == 404:
+                    LOGGER.warning("[COVER-FAILED] NOT Found for %s",
+                                   book.get_short_filename())
+                    self._record(book, 404)
+                else:
+                    LOGGER.warning("[COVER-FAILED] NOT Found for %s",
+                                   book.get_short_filename())
         except requests.exceptions.Timeout:
-            LOGGER.error(
-                "[COVER-FAILED] OpenLibrary.com didn't respond for\n"
-                f"{book.get_short_filename()}"
-                f"{traceback.format_exc()}"
-            )
+            LOGGER.error("[COVER-FAILED] OpenLibrary.com didn't respond for"
+                         "\n%s", book.get_short_filename(), exc_info=True)
+        except requests.exceptions.RequestException:
+            LOGGER.error("[COVER-FAILED] Download interrupted for\n%s",
+                         book.get_short_filename(), exc_info=True)
+        except OSError:
+            LOGGER.error("[COVER-FAILED] Could not save the cover for\n%s",
+                         book.get_short_filename(), exc_info=True)
         return book
 
 
@@ -162,8 +519,8 @@ class BookCover:
     def get_cover_for_book(self, book: Book) -> Book:
         """"""
         if book.cover_path:
-            LOGGER.info("[COVER] Already exists for "
-                        f"{book.get_short_filename()}")
+            LOGGER.info("[COVER] Already exists for %s",
+                        book.get_short_filename())
             return book
 
         book = self.fetcher.fetch([book])[0]
@@ -176,19 +533,29 @@ class BookCover:
 
         return book
 
+    @profiled
     def get_cover_for_books(self, books: list[Book]) -> list[Book]:
-        """"""
+        """Sync wrapper around async_get_cover_for_books."""
+        return asyncio.run(self.async_get_cover_for_books(books))
+
+    async def async_get_cover_for_books(self, books: list[Book]) -> list[Book]:
+        """
+        Fetch covers from OpenLibrary, falling back to extracting them from
+        the files. Extraction runs in worker threads.
+        """
         if len(books) == 0:
             LOGGER.warning("Empty Book list was passed!")
             return books
 
-        books = self.fetcher.fetch(books)
+        books = await self.fetcher.async_fetch(books)
 
-        books_after_extraction = []
-        for book in books:
-            if book.cover_path is None:
-                extract_func = self.extractor.get_format_parser(book.ext)
-                book = extract_func(book)
-            books_after_extraction.append(book)
+        return await asyncio.gather(
+            *[self._async_extract(book) for book in books]
+        )
+
+    async def _async_extract(self, book: Book) -> Book:
+        if book.cover_path is not None:
+            return book
 
-        return books_after_extraction
+        extract_func = self.extractor.get_format_parser(book.ext)
+        return await asyncio.to_thread(extract_func, book)
@@ -1,33 +1,270 @@
+import os
 import json
 import time
 import sqlite3
 import logging
-import traceback
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from .archive import file_size
+from .cleanup import FileCleaner, remove_files
 from .domain import Book, Folder
-from .config import default_document_folder
+from .profiling import profiled
+from .query import BookQuery
+from .config import get_config
 
 Connection = sqlite3.Connection
 
+# Parameters per IN (...) query, below SQLITE_MAX_VARIABLE_NUMBER.
+_CHUNK = 500
+
+
+def _update_rows(
+    con: Connection, logger: logging.Logger, table: str, id_column: str,
+    updates: Iterable[tuple[int, dict[str, Any]]],
+    is_protected: Callable[[str], bool]
+) -> dict[int, bool]:
+    """
+    Apply many (id, changes) pairs in one transaction. Rows changing the
+    same columns share one executemany; when it fails, that group is
+    retried row by row so only the failing rows are lost. Returns, per
+    id, whether it was updated: False for empty changes, unknown columns,
+    missing rows and rows the database rejected. Any protected column
+    raises ValueError before anything is written.
+    """
+
+    updates = list(updates)
+    for _, content in updates:
+        for key in content:
+            if is_protected(key):
+                logger.error("'%s' cannot be changed! Operation canceled!",
+                             key)
+                raise ValueError(f"{key} cannot be changed by this method!")
+
+    results = {row_id: False for row_id, _ in updates}
+    columns = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    groups: dict[tuple[str, ...], list[tuple]] = {}
+    for row_id, content in updates:
+        if len(content) == 0:
+            logger.warning("No update value was passed for %s!", row_id)
+            continue
+        unknown = content.keys() - columns
+        if unknown:
+            logger.error("Column does not exist (%s)", ', '.join(unknown))
+            continue
+
+        keys = tuple(sorted(content))
+        groups.setdefault(keys, []).append(
+            (*(content[key] for key in keys), row_id)
+        )
+        results[row_id] = True
+
+    ids = [row_id for row_id, valid in results.items() if valid]
+    existing = set()
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        res = con.execute(
+            f"""SELECT {id_column} FROM {table}
+                WHERE {id_column} IN ({', '.join('?' * len(chunk))})""",
+            chunk
+        )
+        existing.update(row[0] for row in res.fetchall())
+
+    # An explicit BEGIN, as insert_books switches the connection to
+    # autocommit, where `with con` would commit every row.
+    cur = con.cursor()
+    try:
+        if not con.in_transaction:
+            cur.execute("BEGIN")
+        for keys, rows in groups.items():
+            set_statement = ", ".join(f"{key} = ?" for key in keys)
+            statement = f"""UPDATE {table}
+                            SET {set_statement}
+                            WHERE {table}.{id_column} = ?"""
+            cur.execute("SAVEPOINT update_group")
+            try:
+                cur.executemany(statement, rows)
+            except sqlite3.Error:
+                cur.execute("ROLLBACK TO update_group")
+                for row in rows:
+                    try:
+                        cur.execute(statement, row)
+                    except sqlite3.Error as e:
+                        logger.error("Update of %s %s failed: %s", table,
+                                     row[-1], e)
+                        results[row[-1]] = False
+            cur.execute("RELEASE update_group")
+        con.commit()
+    except sqlite3.Error:
+        logger.error("Batch update failed, rolling back!", exc_info=True)
+        con.rollback()
+        return dict.fromkeys(results, False)
+
+    for row_id in results:
+        results[row_id] = results[row_id] and row_id in existing
+
+    updated = sum(results.values())
+    logger.debug("[UPDATED] %s %s rows in %s batches, %s skipped.", updated,
+                 table, len(groups), len(results) - updated)
+    return results
+
+
+def _fill_ids(cur: sqlite3.Cursor, table: str, ids: Iterable[int]) -> None:
+    """Load ids into a temporary table, for set-based IN (SELECT ...)."""
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} "
+                "(id INTEGER PRIMARY KEY)")
+    cur.execute(f"DELETE FROM {table}")
+    cur.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?)",
+                    ((row_id, ) for row_id in ids))
+
+
+def _delete_listed_books(
+    cur: sqlite3.Cursor
+) -> tuple[int, list[tuple[str, str | None]]]:
+    """
+    Delete the Books listed in temp._book_ids and the Duplicates pointing
+    at them. Returns the count and the (hash_id, cover_path) of each.
+    """
+    listed = "IN (SELECT id FROM temp._book_ids)"
+    files = cur.execute(f"""SELECT hash_id, cover_path FROM Book
+                            WHERE book_id {listed}
+                            UNION ALL
+                            SELECT hash_id, cover_path FROM Duplicate
+                            WHERE original_book_id {listed}""").fetchall()
+    cur.execute(f"DELETE FROM Duplicate WHERE original_book_id {listed}")
+    cur.execute(f"DELETE FROM FolderDeletedBook WHERE book_id {listed}")
+    cur.execute(f"DELETE FROM Book WHERE book_id {listed}")
+    return cur.rowcount, [(row[0], row[1]) for row in files]
+
+
+def _clean_files(
+    con: Connection, files: list[tuple[str, str | None]],
+    cleaner: FileCleaner | None
+) -> None:
+    """Remove the covers of deleted Books no remaining Book uses."""
+    covers = [cover for _, cover in files if cover]
+    used = set()
+    for i in range(0, len(covers), _CHUNK):
+        chunk = covers[i:i + _CHUNK]
+        marks = ", ".join("?" * len(chunk))
+        res = con.execute(
+            f"""SELECT cover_path FROM Book WHERE cover_path IN ({marks})
+                UNION
+                SELECT cover_path FROM Duplicate WHERE cover_path IN ({marks})""",
+            chunk * 2
+        )
+        used.update(row[0] for row in res.fetchall())
+
+    paths = [Path(cover) for cover in covers if cover not in used]
+    hash_ids = [hash_id for hash_id, _ in files]
+    if cleaner is None:
+        remove_files(paths)
+    else:
+        cleaner.submit(paths, hash_ids)
+
 
 class DatabaseConnector:
 
-    DB_PATH = default_document_folder / "pdfshelf.db"
+    # Resolved from the configuration on first connection when None.
+    DB_PATH: Path | None = None
 
-    def __init__(self):
-        self.con = sqlite3.connect(self.DB_PATH)
+    # How long a connection waits on a lock before raising, in ms.
+    BUSY_TIMEOUT = 5000
+
+    def __init__(self, db_path: Path | None = None):
+        path = self.get_db_path() if db_path is None else db_path
+        self.con = sqlite3.connect(path)
         self.con.row_factory = sqlite3.Row
+        DatabaseConnector.configure(self.con)
         DatabaseConnector.create_tables(self.con)
 
+    @classmethod
+    def get_db_path(cls) -> Path:
+        if cls.DB_PATH is None:
+            return get_config().document_folder / "pdfshelf.db"
+        return cls.DB_PATH
+
     def __enter__(self):
         return self.con
 
     def __exit__(self, ctx_type, ctx_value, ctx_traceback):
         self.con.close()
 
+    @staticmethod
+    def configure(con: Connection) -> None:
+        """
+        WAL journal: readers on other connections keep reading the last
+        committed data while a writer is in a transaction, and a commit
+        does not wait for them. The mode is stored in the database file.
+        """
+        con.execute(f"PRAGMA busy_timeout = {DatabaseConnector.BUSY_TIMEOUT}")
+        # Before the journal mode, which initializes a new database file:
+        # auto_vacuum can only be set on an empty one.
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        con.execute("PRAGMA journal_mode = WAL")
+        # Durable at checkpoints instead of every commit; safe under WAL.
+        con.execute("PRAGMA synchronous = NORMAL")
+
+    @classmethod
+    def connect_readonly(
+        cls, db_path: Path | None = None, *, check_same_thread: bool = True
+    ) -> Connection:
+        """A read-only connection, for readers that scale apart from writers."""
+        path = cls.get_db_path() if db_path is None else db_path
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                              check_same_thread=check_same_thread)
+        con.row_factory = sqlite3.Row
+        con.execute(f"PRAGMA busy_timeout = {cls.BUSY_TIMEOUT}")
+        return con
+
+    @classmethod
+    @contextmanager
+    def snapshot(cls, db_path: Path | None = None) -> Iterator[Connection]:
+        """
+        A read-only connection pinned to the data committed when the block
+        starts, for long reports that must be consistent while imports go
+        on. Keep it short-lived: WAL checkpoints can not pass an open
+        snapshot, so the -wal file grows until it ends.
+        """
+        con = cls.connect_readonly(db_path)
+        try:
+            con.execute("BEGIN")
+            # The snapshot is taken by the first read, not by BEGIN.
+            con.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            yield con
+        finally:
+            con.rollback()
+            con.close()
+
+    @staticmethod
+    def vacuum(
+        con: Connection, pages: int | None = None, full: bool = False
+    ) -> None:
+        """
+        Give the space of deleted rows back to the filesystem. Databases
+        created with incremental auto_vacuum free `pages` pages (all when
+        None) without rewriting the file; others, or `full`, get a VACUUM.
+        """
+        if con.in_transaction:
+            con.commit()
+
+        incremental = con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if incremental and not full:
+            query = "PRAGMA incremental_vacuum"
+            if pages is not None:
+                query += f"({int(pages)})"
+            # execute() steps this pragma once, freeing a single page.
+            con.executescript(f"{query};")
+        else:
+            # Also switches older databases to incremental auto_vacuum.
+            con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            con.execute("VACUUM")
+
     @staticmethod
     def create_tables(con) -> None:
         cur = con.cursor()
+        # Only takes effect on a new database, before any table exists.
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
         cur.execute("""CREATE TABLE IF NOT EXISTS Folder (
                         folder_id INTEGER PRIMARY KEY,
                         name TEXT NOT NULL UNIQUE,
@@ -81,9 +318,91 @@ class DatabaseConnector:
                         FOREIGN KEY (folder_id) REFERENCES Folder (folder_id)
                         )""")
 
+        # The Books a soft Folder delete deactivated: restoring the Folder
+        # leaves the Books deleted on their own before it alone.
+        cur.execute("""CREATE TABLE IF NOT EXISTS FolderDeletedBook (
+                        book_id INTEGER PRIMARY KEY,
+                        folder_id INTEGER NOT NULL,
+                        FOREIGN KEY (book_id) REFERENCES Book (book_id)
+                        )""")
+
+        StatsDBHandler.create_tables(con)
+        DatabaseConnector._create_indexes(con)
+
+    # Columns that Book filters compare directly.
+    INDEXED = ("title", "year", "lang", "ext", "folder_id", "size",
+               "added_date", "publisher", "active", "confirmed",
+               "cover_path")
+    # Lookup table -> (JSON list column of Book, value column).
+    LISTS = {"BookAuthor": ("authors", "author"), "BookTag": ("tags", "tag")}
+
+    @staticmethod
+    def _create_indexes(con: Connection) -> None:
+        """
+        Indexes for the query builder. Authors and tags are JSON lists in
+        Book, so triggers keep one row per value in BookAuthor/BookTag,
+        which can be searched by value.
+        """
+        cur = con.cursor()
+        for column in DatabaseConnector.INDEXED:
+            cur.execute(f"CREATE INDEX IF NOT EXISTS Book_{column} "
+                        f"ON Book ({column})")
+
+        for table, (column, value) in DatabaseConnector.LISTS.items():
+            exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?",
+                                 (table, )).fetchone()
+            if exists:
+                continue
+
+            cur.execute(f"""CREATE TABLE {table} (
+                            {value} NOT NULL,
+                            book_id INTEGER NOT NULL,
+                            PRIMARY KEY ({value}, book_id)
+                            ) WITHOUT ROWID""")
+            cur.execute(f"CREATE INDEX {table}_book_id ON {table} (book_id)")
+            # json_each() fails on malformed JSON, which must not block
+            # writes to Book.
+            values = (f"""SELECT value, {{row}}.book_id FROM json_each(
+                          CASE WHEN json_valid({{row}}.{column})
+                          THEN {{row}}.{column} ELSE '[]' END)""")
+            add = (f"INSERT OR IGNORE INTO {table} "
+                   + values.format(row="NEW") + ";")
+            remove = f"DELETE FROM {table} WHERE book_id = OLD.book_id;"
+            cur.execute(f"""CREATE TRIGGER {table}_insert AFTER INSERT ON Book
+                            BEGIN {add} END""")
+            cur.execute(f"""CREATE TRIGGER {table}_delete AFTER DELETE ON Book
+                            BEGIN {remove} END""")
+            cur.execute(f"""CREATE TRIGGER {table}_update
+                            AFTER UPDATE OF {column} ON Book
+                            BEGIN {remove} {add} END""")
+            cur.execute(f"""INSERT OR IGNORE INTO {table}
+                            SELECT json_each.value, Book.book_id
+                            FROM Book, json_each(
+                            CASE WHEN json_valid(Book.{column})
+                            THEN Book.{column} ELSE '[]' END)""")
+            con.commit()
+
 
 class BookDBHandler:
 
+    SORTING = {
+        "no_sorting": "",
+        "title": " ORDER BY title NULLS LAST",
+        "added_date": " ORDER BY added_date",
+        "year": " ORDER BY year NULLS LAST",
+        "size": " ORDER BY size"
+    }
+    FILTERING = {
+        "no_filter": " WHERE Book.hash_id != ?",
+        "publisher": " WHERE Book.publisher == ?",
+        "ext": " WHERE Book.ext == ?",
+        "year": " WHERE Book.year == ?",
+        "tag": " WHERE Book.tags LIKE ?",
+        "active": " WHERE Book.active == ?",
+        "confirmed": " WHERE Book.confirmed == ?",
+        "author": " WHERE Book.authors LIKE ?"
+    }
+
     def __init__(self, con: Connection) -> None:
         self.con = con
         self.logger = logging.getLogger(__name__)
@@ -93,46 +412,53 @@ class BookDBHandler:
 
         try:
             cur = self.con.cursor()
-            self.logger.info(f"Transaction started")
+            self.logger.info("Transaction started")
 
             book_id, folder_id = self._insert_single_book(book, cur)
 
             self.con.commit()
-            self.logger.info(f"Transaction ended successfully!")
+            self.logger.info("Transaction ended successfully!")
         except sqlite3.Error:
-            self.logger.error(
-                "Transaction failed, rolling back!\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Transaction failed, rolling back!",
+                              exc_info=True)
             self.con.rollback()
             return -1, -1
 
         return book_id, folder_id
 
-    def insert_books(self, books: list[Book]) -> None:
-        """Insert a single Book object into Book table."""
+    @profiled
+    def insert_books(
+        self, books: list[Book], batch_size: int | None = None
+    ) -> None:
+        """
+        Insert Book objects into Book table. With a batch_size, every
+        batch_size Books are committed on their own, so other connections
+        see a long insert progress; a failed batch is rolled back and
+        stops the insert, earlier batches stay. Otherwise all or nothing.
+        """
 
         if len(books) == 0:
             self.logger.warning("Empty Book list was passed!")
             return
 
+        size = batch_size or len(books)
         self.con.isolation_level = None
-        try:
-            cur = self.con.cursor()
-            cur.execute("BEGIN")
-            self.logger.info(f"Transaction started")
-
-            for book in books:
-                self._insert_single_book(book, cur)
-
-            self.con.commit()
-            self.logger.info(f"Transaction ended successfully!")
-        except sqlite3.Error:
-            self.logger.error(
-                "Transaction failed, rolling back!\n"
-                f"{traceback.format_exc()}"
-            )
-            self.con.rollback()
+        for start in range(0, len(books), size):
+            try:
+                cur = self.con.cursor()
+                cur.execute("BEGIN")
+                self.logger.info("Transaction started")
+
+                for book in books[start:start + size]:
+                    self._insert_single_book(book, cur)
+
+                self.con.commit()
+                self.logger.info("Transaction ended successfully!")
+            except sqlite3.Error:
+                self.logger.error("Transaction failed, rolling back!",
+                                  exc_info=True)
+                self.con.rollback()
+                return
 
     def _insert_single_book(self, book: Book, cur: sqlite3.Cursor) -> tuple[int, int]:
         """Inserts Book into Book table if not Duplicate."""
@@ -156,9 +482,8 @@ class BookDBHandler:
         ).fetchone()[0]
         parsed_book["folder_id"] = folder_id
 
-        self.logger.debug(f"    "
-                          f"[{folder_status}] Folder {book.folder.name} "
-                          f"(ID = {folder_id})")
+        self.logger.debug("    [%s] Folder %s (ID = %s)", folder_status,
+                          book.folder.name, folder_id)
 
         is_duplicate = False
         try:
@@ -168,8 +493,8 @@ class BookDBHandler:
                         :active, :confirmed, :cover_path"""
             cur.execute(f"INSERT INTO Book VALUES({values})", parsed_book)
 
-            self.logger.info(f"    "
-                             f"[ADDED] Book \"{book.get_short_filename()}\"")
+            self.logger.info("    [ADDED] Book \"%s\"",
+                             book.get_short_filename())
         except sqlite3.IntegrityError:
             is_duplicate = True
 
@@ -202,9 +527,8 @@ class BookDBHandler:
                     :parsed_isbn, :cover_path"""
         cur.execute(f"INSERT INTO Duplicate VALUES({values})", parsed_book)
 
-        self.logger.warning(f"    "
-                            f"[DUPLICATE] "
-                            f"\"{short_name}\" equal to Book {book_id}")
+        self.logger.warning("    [DUPLICATE] \"%s\" equal to Book %s",
+                            short_name, book_id)
 
     def load_book_by_id(self, book_id: int) -> Book:
         cur = self.con.cursor()
@@ -219,49 +543,35 @@ class BookDBHandler:
             raise ValueError("Book ID does not exist!")
 
         book = self._get_book_from_row(row)
-        self.logger.debug(f"[SELECTED] Book \"{book.get_short_filename()}\"")
+        self.logger.debug("[SELECTED] Book \"%s\"", book.get_short_filename())
 
         return book
 
     def load_books(
         self, sorting_key: str = "no_sorting", filter_key: str = "no_filter",
-        filter_content: Any = ""
+        filter_content: Any = "", limit: int | None = None, offset: int = 0
     ) -> list[Book]:
         """
-        Read Books from Database.
+        Read Books from Database, optionally one page of `limit` Books.
 
         Sorting by: title, added_date, year and size.
         Filtering by: publisher, author, tag, ext, year, active and confirmed.
         """
 
         cur = self.con.cursor()
-        sorting = {
-            "no_sorting": "",
-            "title": " ORDER BY title NULLS LAST",
-            "added_date": " ORDER BY added_date",
-            "year": " ORDER BY year NULLS LAST",
-            "size": " ORDER BY size"
-        }
-        filtering = {
-            "no_filter": " WHERE Book.hash_id != ?",
-            "publisher": " WHERE Book.publisher == ?",
-            "ext": " WHERE Book.ext == ?",
-            "year": " WHERE Book.year == ?",
-            "tag": " WHERE Book.tags LIKE ?",
-            "active": " WHERE Book.active == ?",
-            "confirmed": " WHERE Book.confirmed == ?",
-            "author": " WHERE Book.authors LIKE ?"
-        }
-
         if filter_key == "tag" or filter_key == "author":
             filter_content = f"%{filter_content}%"
 
         query = ("""SELECT * FROM Book
                     LEFT JOIN Folder 
                     ON Book.folder_id == Folder.folder_id"""
-                 + filtering[filter_key]
-                 + sorting[sorting_key])
-        res = cur.execute(query, (filter_content, ))
+                 + self.FILTERING[filter_key]
+                 + self.SORTING[sorting_key])
+        params: tuple = (filter_content, )
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += (limit, offset)
+        res = cur.execute(query, params)
 
         books = []
         for row in res.fetchall():
@@ -276,10 +586,80 @@ class BookDBHandler:
         if sorting_key != "no_sorting":
             sorted_message = f", ordered by {sorting_key}"
 
-        self.logger.debug(f"[SELECTED] {filtered_message}{sorted_message}")
+        self.logger.debug("[SELECTED] %s%s", filtered_message, sorted_message)
 
         return books
 
+    def find_books(
+        self, query: BookQuery
+    ) -> list[Book] | list[dict[str, Any]]:
+        """
+        Run a BookQuery (any number of filters and sort keys, in one
+        statement). Books, or dicts of the selected fields.
+        """
+
+        sql, params = query.compile()
+        rows = self.con.execute(sql, params).fetchall()
+        self.logger.debug("[SELECTED] %s Books by query", len(rows))
+        if not query.columns:
+            return [self._get_book_from_row(row) for row in rows]
+
+        results = []
+        for row in rows:
+            result = dict(zip(query.columns, row))
+            for field in ("authors", "tags"):
+                if result.get(field):
+                    result[field] = json.loads(result[field])
+            results.append(result)
+        return results
+
+    def count_matching(self, query: BookQuery) -> int:
+        """Number of Books find_books would return, ignoring paging."""
+
+        sql, params = query.compile_count()
+        return self.con.execute(sql, params).fetchone()[0]
+
+    def count_books(
+        self, filter_key: str = "no_filter", filter_content: Any = ""
+    ) -> int:
+        """Number of Books load_books would return with the same filter."""
+
+        if filter_key == "tag" or filter_key == "author":
+            filter_content = f"%{filter_content}%"
+
+        query = "SELECT count(*) FROM Book" + self.FILTERING[filter_key]
+        return self.con.execute(query, (filter_content, )).fetchone()[0]
+
+    def search_books(
+        self, text: str, limit: int | None = None, offset: int = 0
+    ) -> list[Book]:
+        """Read Books whose title, authors or filename contain text."""
+
+        query = """SELECT * FROM Book
+                   LEFT JOIN Folder
+                   ON Book.folder_id == Folder.folder_id
+                   WHERE Book.title LIKE :text
+                   OR Book.authors LIKE :text
+                   OR Book.filename LIKE :text
+                   ORDER BY title NULLS LAST"""
+        params = {"text": f"%{text}%", "limit": limit, "offset": offset}
+        if limit is not None:
+            query += " LIMIT :limit OFFSET :offset"
+        res = self.con.execute(query, params)
+
+        books = [self._get_book_from_row(row) for row in res.fetchall()]
+        self.logger.debug("[SELECTED] %s Books matching \"%s\"", len(books),
+                          text)
+        return books
+
+    def load_hash_ids(self) -> set[str]:
+        """hash_id of every imported file, including Duplicates."""
+
+        res = self.con.execute("""SELECT hash_id FROM Book
+                                  UNION
+                                  SELECT hash_id FROM Duplicate""")
+        return {row[0] for row in res.fetchall()}
+
     def _get_book_from_row(self, row: sqlite3.Row) -> Book:
         keys = row.keys()
         cut_idx = keys.index("name") - 1
@@ -302,19 +682,13 @@ class BookDBHandler:
 
         cur = self.con.cursor()
         values = list(content.values())
-        set_statement = "SET "
 
-        for i, key in enumerate(content):
+        for key in content:
             if BookDBHandler._is_protected(key):
-                self.logger.error(
-                    f"'{key}' cannot be changed! Operation canceled!"
-                )
+                self.logger.error("'%s' cannot be changed! Operation "
+                                  "canceled!", key)
                 raise ValueError(f"{key} cannot be changed by this method!")
-
-            if (i + 1) == len(content):
-                set_statement += f"{key} = ?"
-            else:
-                set_statement += f"{key} = ?, "
+        set_statement = "SET " + ", ".join(f"{key} = ?" for key in content)
 
         query = f"""
                 UPDATE Book
@@ -325,26 +699,30 @@ class BookDBHandler:
         try:
             cur.execute(query, (*values, book_id, ))
         except sqlite3.OperationalError:
-            self.logger.error(
-                f"Column does not exist ({', '.join(list(content.keys()))})\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Column does not exist (%s)",
+                              ', '.join(list(content.keys())), exc_info=True)
             return False
         except sqlite3.Error:
-            self.logger.error(
-                "Update failed!\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Update failed!", exc_info=True)
             return False
         self.con.commit()
 
         content_msg = '\n'.join([f'{k} = {v}' for k, v in content.items()])
-        self.logger.debug(
-            f"[UPDATED] Book {book_id} with following values:\n"
-            f"{content_msg}"
-        )
+        self.logger.debug("[UPDATED] Book %s with following values:\n%s",
+                          book_id, content_msg)
         return True
 
+    def update_books(
+        self, updates: Iterable[tuple[int, dict[str, Any]]]
+    ) -> dict[int, bool]:
+        """
+        Update many Books in a single transaction, from (book_id, content)
+        pairs as taken by update_book. Returns whether each Book was
+        updated.
+        """
+        return _update_rows(self.con, self.logger, "Book", "book_id",
+                            updates, BookDBHandler._is_protected)
+
     @staticmethod
     def _is_protected(key: str) -> bool:
         protected_fields = [
@@ -356,20 +734,72 @@ class BookDBHandler:
 
     def delete_book(self, book_id: int) -> bool:
         """Delete one Book from Book table."""
+        return self._delete_books([book_id], False, None) is not None
+
+    def delete_books(
+        self, book_ids: Iterable[int], soft: bool = False,
+        cleaner: FileCleaner | None = None
+    ) -> int:
+        """
+        Delete Books, with their Duplicates and cover files, in one
+        transaction. Soft deletion only deactivates them (see
+        restore_books and purge_books). Cover files are removed after the
+        commit, by `cleaner` when given. Returns how many Books changed.
+        """
+        return self._delete_books(book_ids, soft, cleaner) or 0
+
+    def restore_books(self, book_ids: Iterable[int]) -> int:
+        """Reactivate soft-deleted Books."""
+        return self._set_active(book_ids, True)
+
+    def purge_books(self, cleaner: FileCleaner | None = None) -> int:
+        """Hard-delete every soft-deleted Book."""
+        res = self.con.execute("SELECT book_id FROM Book WHERE active == 0")
+        return self.delete_books([row[0] for row in res.fetchall()],
+                                 cleaner=cleaner)
 
+    def _set_active(self, book_ids: Iterable[int], active: bool) -> int:
         cur = self.con.cursor()
         try:
-            cur.execute("DELETE from Book WHERE Book.book_id = ?", (book_id, ))
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            _fill_ids(cur, "_book_ids", book_ids)
+            cur.execute("UPDATE Book SET active = ? "
+                        "WHERE book_id IN (SELECT id FROM temp._book_ids)",
+                        (1 if active else 0, ))
+            count = cur.rowcount
             self.con.commit()
         except sqlite3.Error:
-            self.logger.error(
-                "Deletion failed!\n"
-                f"{traceback.format_exc()}"
-            )
-            return False
+            self.logger.error("Update failed, rolling back!", exc_info=True)
+            self.con.rollback()
+            return 0
 
-        self.logger.debug(f"[DELETED] Book {book_id}.")
-        return True
+        state = "Activated" if active else "Deactivated"
+        self.logger.debug("[UPDATED] %s %s Books.", state, count)
+        return count
+
+    def _delete_books(
+        self, book_ids: Iterable[int], soft: bool,
+        cleaner: FileCleaner | None
+    ) -> int | None:
+        if soft:
+            return self._set_active(book_ids, False)
+
+        cur = self.con.cursor()
+        try:
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            _fill_ids(cur, "_book_ids", book_ids)
+            count, files = _delete_listed_books(cur)
+            self.con.commit()
+        except sqlite3.Error:
+            self.logger.error("Deletion failed, rolling back!", exc_info=True)
+            self.con.rollback()
+            return None
+
+        _clean_files(self.con, files, cleaner)
+        self.logger.debug("[DELETED] %s Books.", count)
+        return count
 
 
 class FolderDBHandler:
@@ -401,8 +831,8 @@ class FolderDBHandler:
         folder_id = (self.con.execute(select_query, (folder.name, ))
                      .fetchone()[0])
 
-        self.logger.debug(f"[{folder_status}] Folder \"{folder.name}\" "
-                          f"(ID = {folder_id})")
+        self.logger.debug("[%s] Folder \"%s\" (ID = %s)", folder_status,
+                          folder.name, folder_id)
 
         return folder_id
 
@@ -418,12 +848,12 @@ class FolderDBHandler:
 
         row = res.fetchone()
         if row is None:
-            self.logger.error(f"Folder ID {folder_id} doest not exist!")
+            self.logger.error("Folder ID %s doest not exist!", folder_id)
             raise ValueError(f"Folder ID {folder_id} doest not exist!")
 
         folder_dict = {k: v for k, v in zip(row.keys(), row)}
         folder = Folder.from_raw_data(folder_dict)
-        self.logger.debug(f"[SELECTED] Folder \"{folder.name}\"")
+        self.logger.debug("[SELECTED] Folder \"%s\"", folder.name)
         return folder
 
     def load_folders(
@@ -469,18 +899,12 @@ class FolderDBHandler:
             self.logger.warning("No update value was passed!")
             return False
 
-        set_statement = "SET "
-        for i, key in enumerate(content):
+        for key in content:
             if FolderDBHandler._is_protected(key):
-                self.logger.error(
-                    f"'{key}' cannot be changed! Operation canceled!"
-                )
+                self.logger.error("'%s' cannot be changed! Operation "
+                                  "canceled!", key)
                 raise ValueError(f"{key} cannot be changed by this method!")
-
-            if (i + 1) == len(content):
-                set_statement += f"{key} = ?"
-            else:
-                set_statement += f"{key} = ?, "
+        set_statement = "SET " + ", ".join(f"{key} = ?" for key in content)
 
         query = f"""
                 UPDATE Folder
@@ -493,67 +917,434 @@ class FolderDBHandler:
         try:
             self.con.execute(query, (*values, folder_id, ))
         except sqlite3.OperationalError:
-            self.logger.error(
-                f"Column does not exist ({', '.join(list(content.keys()))})\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Column does not exist (%s)",
+                              ', '.join(list(content.keys())), exc_info=True)
             return False
         except sqlite3.Error:
-            self.logger.error(
-                "Update failed!\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Update failed!", exc_info=True)
             return False
         self.con.commit()
 
         content_msg = '\n'.join([f'{k} = {v}' for k, v in content.items()])
-        self.logger.debug(
-            f"[UPDATED] Folder {folder_id} with following values:\n"
-            f"{content_msg}"
-        )
+        self.logger.debug("[UPDATED] Folder %s with following values:\n%s",
+                          folder_id, content_msg)
         return True
 
+    def update_folders(
+        self, updates: Iterable[tuple[int, dict[str, Any]]]
+    ) -> dict[int, bool]:
+        """
+        Update many Folders in a single transaction, from (folder_id,
+        content) pairs as taken by update_folder. Returns whether each
+        Folder was updated.
+        """
+        return _update_rows(self.con, self.logger, "Folder", "folder_id",
+                            updates, FolderDBHandler._is_protected)
+
     @staticmethod
     def _is_protected(key: str) -> bool:
         protected_fields = ["folder_id", "active", "added_date"]
         return True if key in protected_fields else False
 
+    # Books whose files are checked at the new path of a relocated Folder.
+    RELOCATE_SAMPLE = 64
+
+    def relocate_folder(
+        self, folder_id: int, new_path: Path, *,
+        sample: int = RELOCATE_SAMPLE, covers: tuple[Path, Path] | None = None
+    ) -> bool:
+        """
+        Point a Folder at the new location of its files (e.g. another
+        disk). Book.storage_path is relative to the Folder, so only
+        Folder.path is rewritten. The files of `sample` random Books (all
+        of them, if fewer) must be at the new path with their size, else
+        FileNotFoundError is raised before anything is written. `covers`,
+        an (old, new) folder pair, also moves the cover paths under old,
+        of the Books and Duplicates of the Folder.
+        """
+        folder = self.load_folder_by_id(folder_id)
+        if not new_path.is_dir():
+            raise FileNotFoundError(f"{new_path} is not a folder.")
+
+        rows = self.con.execute(
+            """SELECT storage_path, size FROM Book WHERE folder_id = ?
+               ORDER BY random() LIMIT ?""", (folder_id, sample)
+        ).fetchall()
+        moved = []
+        for storage_path, size in rows:
+            path = new_path / storage_path
+            try:
+                if file_size(path) == int(size):
+                    continue
+            except FileNotFoundError:
+                pass
+            moved.append(path)
+        if moved:
+            self.logger.error("[RELOCATE] %s of %s sampled files are not at "
+                              "%s: %s", len(moved), len(rows), new_path,
+                              moved[0])
+            raise FileNotFoundError(
+                f"{len(moved)} of {len(rows)} sampled files are not at "
+                f"{new_path}, e.g. {moved[0]}.")
+
+        cur = self.con.cursor()
+        try:
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            cur.execute("UPDATE Folder SET path = ? WHERE folder_id = ?",
+                        (str(new_path), folder_id))
+            if covers is not None:
+                old, new = (os.path.join(path, "") for path in covers)
+                # A cover path stays set: the statistics do not change.
+                with StatsDBHandler(self.con).bulk_load(recompute=False):
+                    for table in ("Book", "Duplicate"):
+                        cur.execute(
+                            f"""UPDATE {table}
+                                SET cover_path = ? || substr(cover_path, ?)
+                                WHERE folder_id = ?
+                                AND substr(cover_path, 1, ?) = ?""",
+                            (new, len(old) + 1, folder_id, len(old), old)
+                        )
+            self.con.commit()
+        except sqlite3.Error:
+            self.logger.error("Relocation failed, rolling back!",
+                              exc_info=True)
+            self.con.rollback()
+            return False
+
+        self.logger.info("[RELOCATED] Folder \"%s\" from %s to %s",
+                         folder.name, folder.path, new_path)
+        return True
+
     def delete_folder(self, folder_id: int) -> bool:
-        """Delete one Folder from Folder table."""
+        """Delete one Folder from Folder table, with its Books."""
+        return self._delete_folders([folder_id], False, None) is not None
+
+    def delete_folders(
+        self, folder_ids: Iterable[int], soft: bool = False,
+        cleaner: FileCleaner | None = None
+    ) -> int:
+        """
+        Delete Folders with their Books, the Duplicates of those Books,
+        the Duplicates found in the Folders and the cover files, in one
+        transaction. Soft deletion deactivates the Folders and their
+        Books instead. Returns how many Folders changed.
+        """
+        return self._delete_folders(folder_ids, soft, cleaner) or 0
 
-        success = True
+    def restore_folders(self, folder_ids: Iterable[int]) -> int:
+        """
+        Reactivate soft-deleted Folders and the Books their deletion
+        deactivated.
+        """
+        return self._set_active(folder_ids, True)
+
+    def purge_folders(self, cleaner: FileCleaner | None = None) -> int:
+        """Hard-delete every soft-deleted Folder."""
+        res = self.con.execute(
+            "SELECT folder_id FROM Folder WHERE active == 0"
+        )
+        return self.delete_folders([row[0] for row in res.fetchall()],
+                                   cleaner=cleaner)
+
+    def _set_active(self, folder_ids: Iterable[int], active: bool) -> int:
+        cur = self.con.cursor()
+        value = 1 if active else 0
         try:
-            query = "DELETE from Book WHERE Book.folder_id = ?"
-            self.con.execute(query, (folder_id, ))
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            _fill_ids(cur, "_folder_ids", folder_ids)
+            listed = "folder_id IN (SELECT id FROM temp._folder_ids)"
+            if active:
+                cur.execute(f"""UPDATE Book SET active = 1 WHERE book_id IN
+                                (SELECT book_id FROM FolderDeletedBook
+                                 WHERE {listed})""")
+                cur.execute(f"DELETE FROM FolderDeletedBook WHERE {listed}")
+            else:
+                cur.execute(f"""INSERT OR REPLACE INTO FolderDeletedBook
+                                SELECT book_id, folder_id FROM Book
+                                WHERE {listed} AND active = 1""")
+                cur.execute(f"UPDATE Book SET active = 0 WHERE {listed}")
+            cur.execute("""UPDATE Folder SET active = ?
+                           WHERE folder_id IN
+                           (SELECT id FROM temp._folder_ids)""", (value, ))
+            count = cur.rowcount
+            self.con.commit()
         except sqlite3.Error:
-            success = False
-            self.logger.error(
-                "Deletion of related Books failed!\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Update failed, rolling back!", exc_info=True)
+            self.con.rollback()
+            return 0
+
+        state = "Activated" if active else "Deactivated"
+        self.logger.debug("[UPDATED] %s %s Folders and their Books.", state,
+                          count)
+        return count
+
+    def _delete_folders(
+        self, folder_ids: Iterable[int], soft: bool,
+        cleaner: FileCleaner | None
+    ) -> int | None:
+        if soft:
+            return self._set_active(folder_ids, False)
 
+        cur = self.con.cursor()
         try:
-            query = "DELETE from Folder WHERE Folder.folder_id = ?"
-            self.con.execute(query, (folder_id, ))
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            _fill_ids(cur, "_folder_ids", folder_ids)
+            _fill_ids(cur, "_book_ids", [])
+            cur.execute("""INSERT INTO temp._book_ids
+                           SELECT book_id FROM Book WHERE folder_id IN
+                           (SELECT id FROM temp._folder_ids)""")
+            files = cur.execute("""SELECT hash_id, cover_path FROM Duplicate
+                                   WHERE folder_id IN
+                                   (SELECT id FROM temp._folder_ids)"""
+                                ).fetchall()
+            cur.execute("""DELETE FROM Duplicate WHERE folder_id IN
+                           (SELECT id FROM temp._folder_ids)""")
+            _, book_files = _delete_listed_books(cur)
+            files = [(row[0], row[1]) for row in files] + book_files
+            cur.execute("""DELETE FROM Folder WHERE folder_id IN
+                           (SELECT id FROM temp._folder_ids)""")
+            count = cur.rowcount
+            self.con.commit()
         except sqlite3.Error:
-            success = False
-            self.logger.error(
-                "Deletion of Folder failed!\n"
-                f"{traceback.format_exc()}"
-            )
+            self.logger.error("Deletion failed, rolling back!", exc_info=True)
+            self.con.rollback()
+            return None
+
+        _clean_files(self.con, files, cleaner)
+        self.logger.debug("[DELETED] %s Folders and their Books.", count)
+        return count
+
+
+class StatsDBHandler:
+    """
+    Library statistics from the BookStats summary table, which triggers
+    on Book keep up to date on every insert, update and delete, whatever
+    the write path. Reading a breakdown never scans Book.
+    """
+
+    # dimension -> Book column ('' for the whole library).
+    DIMENSIONS = {
+        "all": None,
+        "folder": "folder_id",
+        "ext": "ext",
+        "publisher": "publisher",
+        "year": "year",
+        "lang": "lang",
+        "confirmed": "confirmed",
+        "active": "active"
+    }
+    COUNTED = ("folder_id", "ext", "publisher", "year", "lang", "confirmed",
+               "active", "size", "cover_path", "isbn13")
+
+    def __init__(self, con: Connection) -> None:
+        self.con = con
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def create_tables(con: Connection) -> None:
+        exists = con.execute("""SELECT 1 FROM sqlite_master
+                                WHERE name = 'BookStats'""").fetchone()
+        if exists:
+            return
+
+        cur = con.cursor()
+        # value has no type, so years and ids keep their type.
+        cur.execute("""CREATE TABLE BookStats (
+                        dimension TEXT NOT NULL,
+                        value NOT NULL,
+                        books INTEGER NOT NULL,
+                        bytes REAL NOT NULL,
+                        missing_cover INTEGER NOT NULL,
+                        missing_isbn INTEGER NOT NULL,
+                        PRIMARY KEY (dimension, value)
+                        ) WITHOUT ROWID""")
+
+        StatsDBHandler._create_triggers(cur)
+        StatsDBHandler(con).rebuild()
+
+    @staticmethod
+    def _create_triggers(cur: sqlite3.Cursor) -> None:
+        columns = ", ".join(StatsDBHandler.COUNTED)
+        add = StatsDBHandler._upserts("NEW", "+")
+        remove = StatsDBHandler._upserts("OLD", "-")
+        cur.execute(f"""CREATE TRIGGER BookStats_insert AFTER INSERT ON Book
+                        BEGIN {add} END""")
+        cur.execute(f"""CREATE TRIGGER BookStats_delete AFTER DELETE ON Book
+                        BEGIN {remove} END""")
+        cur.execute(f"""CREATE TRIGGER BookStats_update
+                        AFTER UPDATE OF {columns} ON Book
+                        BEGIN {remove} {add} END""")
+
+    @contextmanager
+    def bulk_load(self, recompute: bool = True) -> Iterator[None]:
+        """
+        Drop the triggers while the caller loads many Books, then recreate
+        them and recompute BookStats once. Must run inside the caller's
+        transaction, so a rollback also restores the triggers. Without
+        `recompute`, for writes that can not change any statistic, BookStats
+        is left as it is.
+        """
+        if not self.con.in_transaction:
+            raise RuntimeError("bulk_load() needs an open transaction.")
+
+        cur = self.con.cursor()
+        for trigger in ("insert", "delete", "update"):
+            cur.execute(f"DROP TRIGGER IF EXISTS BookStats_{trigger}")
+        yield
+        self._create_triggers(cur)
+        if recompute:
+            self._recompute(cur)
 
-        if success:
-            self.logger.debug(
-                f"[DELETED] Folder {folder_id} and related Books."
+    @staticmethod
+    def _upserts(row: str, sign: str) -> str:
+        statements = []
+        for dimension, column in StatsDBHandler.DIMENSIONS.items():
+            value = "''" if column is None else f"coalesce({row}.{column}, '')"
+            statements.append(
+                f"""INSERT INTO BookStats VALUES (
+                    '{dimension}', {value}, {sign}1, {sign}{row}.size,
+                    {sign}(coalesce({row}.cover_path, '') = ''),
+                    {sign}(coalesce({row}.isbn13, '') = ''))
+                    ON CONFLICT (dimension, value) DO UPDATE SET
+                    books = books + excluded.books,
+                    bytes = bytes + excluded.bytes,
+                    missing_cover = missing_cover + excluded.missing_cover,
+                    missing_isbn = missing_isbn + excluded.missing_isbn;"""
             )
+        return "\n".join(statements)
+
+    def rebuild(self) -> None:
+        """Recompute BookStats from Book, in one transaction."""
+
+        cur = self.con.cursor()
+        try:
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            self._recompute(cur)
             self.con.commit()
-            return True
-        else:
-            self.logger.error(f"Deletion failed, rolling back!")
+        except sqlite3.Error:
+            self.logger.error("Stats rebuild failed, rolling back!",
+                              exc_info=True)
             self.con.rollback()
-            return False
+            return
+        self.logger.debug("[UPDATED] BookStats rebuilt.")
+
+    def _recompute(self, cur: sqlite3.Cursor) -> None:
+        cur.execute("DELETE FROM BookStats")
+        for dimension, column in self.DIMENSIONS.items():
+            value = "''" if column is None else f"coalesce({column}, '')"
+            cur.execute(
+                f"""INSERT INTO BookStats
+                    SELECT '{dimension}', {value}, count(*),
+                           coalesce(sum(size), 0),
+                           count(*) - count(nullif(cover_path, '')),
+                           count(*) - count(nullif(isbn13, ''))
+                    FROM Book GROUP BY 2"""
+            )
+
+    def summary(self) -> dict[str, Any]:
+        """Totals of the whole library."""
+
+        row = self.con.execute("""SELECT books, bytes, missing_cover,
+                                         missing_isbn
+                                  FROM BookStats WHERE dimension = 'all'"""
+                               ).fetchone()
+        if row is None:
+            return {"books": 0, "bytes": 0.0, "missing_cover": 0,
+                    "missing_isbn": 0}
+        return dict(zip(("books", "bytes", "missing_cover", "missing_isbn"),
+                        row))
+
+    def breakdown(self, dimension: str) -> list[dict[str, Any]]:
+        """
+        Counts and sizes per value of a dimension: folder, ext,
+        publisher, year, lang, confirmed or active. Unknown values are
+        None. Sorted by number of Books.
+        """
+
+        if dimension not in self.DIMENSIONS or dimension == "all":
+            raise ValueError(f"Unknown dimension {dimension!r}.")
+
+        res = self.con.execute(
+            """SELECT value, books, bytes, missing_cover, missing_isbn
+               FROM BookStats
+               WHERE dimension = ? AND books > 0
+               ORDER BY books DESC, value""",
+            (dimension, )
+        )
+        keys = ("value", "books", "bytes", "missing_cover", "missing_isbn")
+        rows = [dict(zip(keys, row)) for row in res.fetchall()]
+        for row in rows:
+            if row["value"] == "":
+                row["value"] = None
+        return rows
+
+    def folder_sizes(self) -> list[dict[str, Any]]:
+        """Books and bytes per Folder, with the Folder name and path."""
+
+        res = self.con.execute(
+            """SELECT Folder.folder_id, Folder.name, Folder.path,
+                      BookStats.books, BookStats.bytes
+               FROM BookStats
+               JOIN Folder ON Folder.folder_id = BookStats.value
+               WHERE BookStats.dimension = 'folder' AND BookStats.books > 0
+               ORDER BY BookStats.bytes DESC"""
+        )
+        return [dict(row) for row in res.fetchall()]
 
 
 class DuplicateDBHandler:
-    pass
+
+    def __init__(self, con: Connection) -> None:
+        self.con = con
+        self.logger = logging.getLogger(__name__)
+
+    def load_duplicates(self) -> list[dict[str, Any]]:
+        """
+        Read Duplicate rows, with the title and filename of the original
+        Book and the path of the Folder holding the duplicate.
+        """
+
+        query = """
+                SELECT Duplicate.*,
+                       Book.title AS original_title,
+                       Book.filename AS original_filename,
+                       Folder.path AS folder_path
+                FROM Duplicate
+                LEFT JOIN Book
+                ON Duplicate.original_book_id == Book.book_id
+                LEFT JOIN Folder
+                ON Duplicate.folder_id == Folder.folder_id
+                ORDER BY Duplicate.original_book_id
+                """
+        res = self.con.execute(query)
+        duplicates = [dict(row) for row in res.fetchall()]
+
+        self.logger.debug("[SELECTED] %s Duplicates", len(duplicates))
+        return duplicates
+
+    def delete_duplicates(self, original_book_id: int | None = None) -> int:
+        """
+        Delete Duplicate records (not files), all of them or those of one
+        original Book. Returns the number of deleted rows.
+        """
+
+        try:
+            if original_book_id is None:
+                cur = self.con.execute("DELETE FROM Duplicate")
+            else:
+                cur = self.con.execute(
+                    "DELETE FROM Duplicate WHERE original_book_id = ?",
+                    (original_book_id, )
+                )
+            self.con.commit()
+        except sqlite3.Error:
+            self.logger.error("Deletion failed!", exc_info=True)
+            return 0
+
+        self.logger.debug("[DELETED] %s Duplicates.", cur.rowcount)
+        return cur.rowcount
 # https://docs.python.org/3/library/sqlite3.html#sqlite3-tutorial
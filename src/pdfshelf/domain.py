@@ -3,6 +3,7 @@ import hashlib
 from typing import Any
 from pathlib import Path
 from datetime import datetime
+from enum import Enum
 from dataclasses import dataclass
 
 
@@ -58,7 +59,11 @@ class Book:
 
     def __post_init__(self):
         if self.hash_id is None:
-            self.hash_id = hashlib.md5(self.filename.encode()).hexdigest()
+            self.hash_id = Book.hash_filename(self.filename)
+
+    @staticmethod
+    def hash_filename(filename: str) -> str:
+        return hashlib.md5(filename.encode()).hexdigest()
 
     @classmethod
     def from_raw_data(cls, data: dict[str, Any]):
@@ -112,3 +117,29 @@ class Book:
 
     def get_cover_filename(self) -> str | None:
         return self.cover_path.name if self.cover_path else None
+
+
+class ParseStatus(str, Enum):
+    OK = "ok"
+    NO_ISBN = "no_isbn"
+    NO_TEXT = "no_text"
+    CORRUPTED = "corrupted"
+    TIMEOUT = "timeout"
+    MEMORY = "memory"
+    CRASHED = "crashed"
+    ERROR = "error"
+
+
+@dataclass(kw_only=True)
+class ParseResult:
+    file: Path
+    status: ParseStatus
+    isbn10: str = ""
+    isbn13: str = ""
+    # The file's own metadata title, read when no ISBN is found.
+    title: str = ""
+    message: str = ""
+
+    @property
+    def failed(self) -> bool:
+        return self.status != ParseStatus.OK
@@ -1,2 +1,10 @@
 class FormatNotSupportedError(Exception):
     pass
+
+
+class CorruptedFileError(Exception):
+    pass
+
+
+class NoTextLayerError(Exception):
+    pass
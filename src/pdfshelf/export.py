@@ -0,0 +1,265 @@
+import os
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+from .database import StatsDBHandler
+from .utilities import lazy_import
+
+try:
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+    ipc = lazy_import("pyarrow.ipc")
+except ModuleNotFoundError:  # Only JSON Lines is available.
+    pa = pq = ipc = None
+
+LOGGER = logging.getLogger(__name__)
+
+Connection = sqlite3.Connection
+
+# In foreign key order: imports load them in this order.
+TABLES = ("Folder", "Book", "Duplicate")
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "jsonl": ".jsonl"}
+# Rows held in memory at a time, per table.
+CHUNK_ROWS = 50000
+
+
+def available_formats() -> list[str]:
+    if pa is None:
+        return ["jsonl"]
+    return list(EXTENSIONS)
+
+
+def _columns(con: Connection, table: str) -> list[tuple[str, str]]:
+    """(name, declared type) of the columns of `table`."""
+    return [(row[1], row[2].upper())
+            for row in con.execute(f"PRAGMA table_info({table})")]
+
+
+def _arrow_schema(columns: list[tuple[str, str]], table: str):
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    return pa.schema(
+        [(name, types.get(kind, pa.string())) for name, kind in columns],
+        metadata={"pdfshelf.table": table}
+    )
+
+
+def _chunks(cur: sqlite3.Cursor, size: int) -> Iterator[list[tuple]]:
+    while rows := cur.fetchmany(size):
+        yield rows
+
+
+class _TableWriter:
+    """Writes the rows of one table to `path` in chunks."""
+
+    def __init__(self, path: Path, fmt: str, columns, table: str) -> None:
+        self.fmt = fmt
+        self.names = [name for name, _ in columns]
+        if fmt == "jsonl":
+            self._file = open(path, "w", encoding="utf-8")
+            return
+
+        self.schema = _arrow_schema(columns, table)
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema,
+                                            compression="zstd")
+        else:
+            self._sink = pa.OSFile(str(path), "wb")
+            self._writer = ipc.new_file(self._sink, self.schema)
+
+    def write(self, rows: list[tuple]) -> None:
+        if self.fmt == "jsonl":
+            self._file.writelines(
+                json.dumps(dict(zip(self.names, row)), ensure_ascii=False)
+                + "\n" for row in rows
+            )
+            return
+
+        arrays = [pa.array(column, type=field.type)
+                  for column, field in zip(zip(*rows), self.schema)]
+        self._writer.write_batch(
+            pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        )
+
+    def close(self) -> None:
+        if self.fmt == "jsonl":
+            self._file.close()
+            return
+        self._writer.close()
+        if self.fmt == "arrow":
+            self._sink.close()
+
+
+def _read_chunks(
+    path: Path, fmt: str, size: int
+) -> Iterator[tuple[list[str], list[tuple]]]:
+    """(column names, rows) of an exported table, `size` rows at a time."""
+
+    if fmt == "jsonl":
+        with open(path, encoding="utf-8") as file:
+            names: list[str] = []
+            rows: list[tuple] = []
+            for line in file:
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if not names:
+                    names = list(obj)
+                rows.append(tuple(obj.get(name) for name in names))
+                if len(rows) == size:
+                    yield names, rows
+                    rows = []
+            if rows:
+                yield names, rows
+        return
+
+    if fmt == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=size)
+    else:
+        reader = ipc.open_file(pa.memory_map(str(path), "r"))
+        batches = (reader.get_batch(i)
+                   for i in range(reader.num_record_batches))
+
+    for batch in batches:
+        columns = [column.to_pylist() for column in batch.columns]
+        yield batch.schema.names, list(zip(*columns))
+
+
+def _find_export(folder: Path, table: str) -> tuple[Path, str] | None:
+    for fmt, ext in EXTENSIONS.items():
+        path = folder / f"{table}{ext}"
+        if path.exists():
+            return path, fmt
+    return None
+
+
+def export_library(
+    con: Connection, folder: Path, fmt: str = "parquet",
+    chunk_rows: int = CHUNK_ROWS,
+    on_progress: Callable[[str, int], None] | None = None
+) -> dict[str, int]:
+    """
+    Stream the Folder, Book and Duplicate tables into `folder`, one
+    file per table (Book.parquet, ...), `chunk_rows` rows at a time.
+    Files only get their final name once complete. Returns the number of
+    rows written per table; `on_progress` gets (table, rows) per chunk.
+    """
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown export format {fmt!r}.")
+    if fmt not in available_formats():
+        raise ModuleNotFoundError(f"The {fmt} format needs pyarrow.",
+                                  name="pyarrow")
+
+    folder.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    # One read transaction: the tables are exported from the same snapshot.
+    cur = con.cursor()
+    started = not con.in_transaction
+    if started:
+        cur.execute("BEGIN")
+    try:
+        for table in TABLES:
+            path = folder / f"{table}{EXTENSIONS[fmt]}"
+            tmp_path = path.with_name(f"{path.name}.tmp")
+            columns = _columns(con, table)
+            writer = _TableWriter(tmp_path, fmt, columns, table)
+            counts[table] = 0
+            try:
+                names = ", ".join(name for name, _ in columns)
+                res = con.execute(f"SELECT {names} FROM {table} "
+                                  f"ORDER BY rowid")
+                for rows in _chunks(res, chunk_rows):
+                    writer.write(rows)
+                    counts[table] += len(rows)
+                    if on_progress is not None:
+                        on_progress(table, len(rows))
+            except BaseException:
+                writer.close()
+                tmp_path.unlink()
+                raise
+            writer.close()
+            os.replace(tmp_path, path)
+            LOGGER.info("[EXPORTED] %s rows of %s to %s", counts[table],
+                        table, path)
+    finally:
+        if started:
+            con.rollback()
+    return counts
+
+
+def import_library(
+    con: Connection, folder: Path, replace: bool = False,
+    chunk_rows: int = CHUNK_ROWS,
+    on_progress: Callable[[str, int], None] | None = None
+) -> dict[str, int]:
+    """
+    Load an export made by export_library() back, keeping the ids, in a
+    single transaction. The tables must be empty unless `replace`, which
+    deletes their rows first. Rows are inserted with executemany, one
+    chunk at a time, and the statistics triggers are replaced by one
+    recomputation at the end. Returns the number of rows per table.
+    """
+    found = {table: _find_export(folder, table) for table in TABLES}
+    if found["Book"] is None:
+        raise FileNotFoundError(f"No Book export in {folder}.")
+
+    cur = con.cursor()
+    if not replace:
+        for table in TABLES:
+            if cur.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                raise ValueError(f"{table} is not empty, "
+                                 "pass replace=True to overwrite it.")
+
+    counts = {}
+    try:
+        if not con.in_transaction:
+            cur.execute("BEGIN")
+        with StatsDBHandler(con).bulk_load():
+            if replace:
+                for table in reversed(TABLES):
+                    cur.execute(f"DELETE FROM {table}")
+
+            for table, export in found.items():
+                counts[table] = 0
+                if export is None:
+                    LOGGER.warning("[SKIPPED] No %s export in %s.", table,
+                                   folder)
+                    continue
+                counts[table] = _load_table(cur, table, *export, chunk_rows,
+                                            on_progress)
+                LOGGER.info("[IMPORTED] %s rows of %s from %s", counts[table],
+                            table, export[0])
+        con.commit()
+    except BaseException:
+        LOGGER.error("Import failed, rolling back!", exc_info=True)
+        con.rollback()
+        raise
+    return counts
+
+
+def _load_table(
+    cur: sqlite3.Cursor, table: str, path: Path, fmt: str, chunk_rows: int,
+    on_progress: Callable[[str, int], None] | None
+) -> int:
+    known = {name for name, _ in _columns(cur.connection, table)}
+    count = 0
+    for names, rows in _read_chunks(path, fmt, chunk_rows):
+        unknown = set(names) - known
+        if unknown:
+            raise ValueError(f"{path} has columns {table} does not: "
+                             f"{', '.join(sorted(unknown))}")
+        placeholders = ", ".join("?" * len(names))
+        cur.executemany(
+            f"INSERT INTO {table} ({', '.join(names)}) "
+            f"VALUES ({placeholders})", rows
+        )
+        count += len(rows)
+        if on_progress is not None:
+            on_progress(table, len(rows))
+    return count
+
+
+def count_rows(con: Connection, tables: Iterable[str] = TABLES) -> int:
+    return sum(con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+               for table in tables)
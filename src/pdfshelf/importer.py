@@ -1,23 +1,39 @@
-import os
 import re
+import itertools
 import logging
-import isbnlib
-import ebooklib
-import traceback
-from typing import Callable
-from isbnlib import ISBNLibException
-from ebooklib import epub
-from ebooklib.epub import EpubException
+from html import unescape
+from typing import Any, Callable, ContextManager, TYPE_CHECKING
+from contextlib import nullcontext
+from zipfile import BadZipFile
 from pathlib import Path
-from pypdf import PdfReader
-from pypdf.errors import PdfReadError
-from .domain import Book
-from .exceptions import FormatNotSupportedError
-from .utilities import validade_isbn10, validate_isbn13
+from dataclasses import dataclass
+from .archive import (
+    ARCHIVE_FORMATS, expand_archives, file_size, open_book, split_member
+)
+from .domain import Book, ParseResult, ParseStatus
+from .exceptions import (
+    FormatNotSupportedError, CorruptedFileError, NoTextLayerError
+)
+from .profiling import profiled
+from .scanner import DirectoryScanner
+from .textstore import TextStore, TextWriter
+from .titleindex import filename_title
+from .utilities import validade_isbn10, validate_isbn13, lazy_import
+
+if TYPE_CHECKING:
+    from .isbnindex import ISBNIndex
+    from .ocr import OCRStage
+    from .titleindex import TitleIndex
+
+asyncio = lazy_import("asyncio")
+isbnlib = lazy_import("isbnlib")
+ebooklib = lazy_import("ebooklib")
+epub = lazy_import("ebooklib.epub")
+pypdf = lazy_import("pypdf")
 
 ParserFunc = Callable[..., tuple[str, str]]
 
-FORMATS = [".pdf", ".epub"]
+FORMATS = frozenset({".pdf", ".epub"})
 
 
 def book_from_file(file: Path) -> Book:
@@ -40,7 +56,9 @@ def book_from_file(file: Path) -> Book:
 def books_from_folder(folder: Path) -> list[Book]:
     """
     High-Level function to get a list of Book objects with metadata from 
-    a local folder.
+    a local folder. Runs the async ImportPipeline, so it can not be
+    called from inside a running event loop; await the pipeline instead.
+    Files are parsed in sandboxed worker processes.
 
     input:
         folder: Path
@@ -49,18 +67,52 @@ def books_from_folder(folder: Path) -> list[Book]:
         list[Book]
     """
 
-    parser = ISBNParser(pages_to_read=10)
+    # Imported here because both are built on top of this module.
+    from .pipeline import ImportPipeline
+    from .sandbox import SandboxedISBNParser
+
     fetcher = MetadataFetcher()
-    importer = BookImporter(fetcher, parser)
-    return importer.import_from_folder(folder)
+    with SandboxedISBNParser(ISBNParser(pages_to_read=10)) as parser:
+        importer = BookImporter(fetcher, parser)
+        pipeline = ImportPipeline(importer)
+        return asyncio.run(pipeline.import_from_folder(folder))
+
+
+@dataclass(kw_only=True)
+class ParseContext:
+    """State shared by the cascade steps while parsing one file."""
+    filepath: Path
+    document: Any
+    # None until a step reads the text, then whether any page had text.
+    text_layer: bool | None = None
+    # Receives every page read by the text step when a TextStore is set.
+    text_writer: TextWriter | None = None
+    text_extracted: bool = False
 
 
 class ISBNParser:
     RE_ISBN = re.compile(r'(978-?|979-?)?\d(-?[\dxX]){9}')
 
-    def __init__(self, pages_to_read: int = 10) -> None:
+    RE_TAG = re.compile(r'<[^>]+>')
+
+    # Steps tried in order for each format until one finds an ISBN. Each
+    # name maps to a `_<name>_step` method taking a ParseContext.
+    CASCADE = {
+        ".pdf": ("pdf_metadata", "pdf_text"),
+        ".epub": ("epub_identifier", "epub_text"),
+    }
+    # Run even after an ISBN is found, to fill the TextStore.
+    TEXT_STEPS = {".pdf": "pdf_text", ".epub": "epub_text"}
+
+    def __init__(
+        self, pages_to_read: int = 10,
+        cascade: dict[str, tuple[str, ...]] | None = None,
+        text_store: TextStore | None = None
+    ) -> None:
         self.logger = logging.getLogger(__name__)
         self.pages_to_read = pages_to_read
+        self.cascade = {**self.CASCADE, **(cascade or {})}
+        self.text_store = text_store
 
     def get_format_parser(self, fileformat: str) -> ParserFunc:
         if fileformat == ".epub":
@@ -70,97 +122,269 @@ class ISBNParser:
         else:
             raise FormatNotSupportedError("Format not supported.")
 
-    def _epub_parser(self, filepath: Path) -> tuple[str, str]:
-        isbn10 = ""
-        isbn13 = ""
+    def parse(self, filepath: Path) -> ParseResult:
+        """
+        Parse the ISBNs of a file, classifying failures instead of raising
+        them. Only FormatNotSupportedError is raised.
+        """
+        parse_function = self.get_format_parser(filepath.suffix)
         try:
-            book = epub.read_epub(filepath)
-        except EpubException:
-            self.logger.error(
-                "EPUB file is probably corrupted!\n"
-                f"{traceback.format_exc()}"
-            )
-            return "", ""
+            isbn10, isbn13 = parse_function(filepath)
+        except CorruptedFileError as e:
+            return ParseResult(file=filepath, status=ParseStatus.CORRUPTED,
+                               message=str(e))
+        except NoTextLayerError as e:
+            return ParseResult(file=filepath, status=ParseStatus.NO_TEXT,
+                               message=str(e))
+        except MemoryError:
+            return ParseResult(file=filepath, status=ParseStatus.MEMORY,
+                               message="Memory limit exceeded.")
+        except Exception as e:
+            return ParseResult(file=filepath, status=ParseStatus.ERROR,
+                               message=f"{type(e).__name__}: {e}")
+
+        if isbn10 or isbn13:
+            return ParseResult(file=filepath, status=ParseStatus.OK,
+                               isbn10=isbn10, isbn13=isbn13)
+        return ParseResult(file=filepath, status=ParseStatus.NO_ISBN,
+                           title=self.embedded_title(filepath))
+
+    def embedded_title(self, filepath: Path) -> str:
+        """The title in the file's metadata, or "" if it has none."""
+        try:
+            with open_book(filepath) as file:
+                if filepath.suffix == ".pdf":
+                    metadata = pypdf.PdfReader(file).metadata
+                    return str(metadata.title or "") if metadata else ""
+                titles = epub.read_epub(file).get_metadata("DC", "title")
+                return titles[0][0] if titles else ""
+        except Exception:
+            # Only a hint for the title index: never fails the parse.
+            return ""
+
+    def parse_stored(self, filepath: Path) -> ParseResult:
+        """
+        Match ISBNs against the text kept in the TextStore by an earlier
+        import, without opening the file again.
+        """
+        if self.text_store is None:
+            raise ValueError("ISBNParser has no TextStore!")
+
+        pages = self.text_store.iter_pages(Book.hash_filename(filepath.name))
+        isbn10, isbn13 = self.match_isbns(
+            "\n".join(itertools.islice(pages, self.pages_to_read))
+        )
+        if isbn10 or isbn13:
+            status = ParseStatus.OK
+        else:
+            status = ParseStatus.NO_ISBN
+        return ParseResult(file=filepath, status=status,
+                           isbn10=isbn10, isbn13=isbn13)
+
+    def store_text(self, filepath: Path) -> bool:
+        """
+        Stream every page of a file to the TextStore, apart from parsing.
+        Returns False, storing nothing, when the file can't be read.
+        """
+        if self.text_store is None:
+            raise ValueError("ISBNParser has no TextStore!")
+
+        self.get_format_parser(filepath.suffix)
+        try:
+            with open_book(filepath) as file:
+                if filepath.suffix == ".pdf":
+                    document = pypdf.PdfReader(file)
+                else:
+                    document = epub.read_epub(file)
+                with self._open_text_writer(filepath) as writer:
+                    step = self.TEXT_STEPS[filepath.suffix]
+                    getattr(self, f"_{step}_step")(ParseContext(
+                        filepath=filepath, document=document,
+                        text_writer=writer
+                    ))
+        except Exception:
+            self.logger.warning("[TEXT] Could not store the text of %s.",
+                                filepath.name, exc_info=True)
+            return False
+        return True
+
+    def _run_cascade(self, ctx: ParseContext) -> tuple[str, str]:
+        fileformat = ctx.filepath.suffix
+        isbn10, isbn13 = "", ""
+        for step in self.cascade[fileformat]:
+            isbn10, isbn13 = getattr(self, f"_{step}_step")(ctx)
+            if isbn10 or isbn13:
+                break
+
+        if ctx.text_writer is not None and not ctx.text_extracted:
+            getattr(self, f"_{self.TEXT_STEPS[fileformat]}_step")(ctx)
+
+        if not (isbn10 or isbn13) and ctx.text_layer is False:
+            raise NoTextLayerError("No text layer, the file is probably "
+                                   "scanned.")
+        return isbn10, isbn13
 
-        # Get ISBN from metadata.
-        identifier = book.get_metadata("DC", "identifier")[0][0]
-        filtered_identifier = "".join(filter(str.isdigit, identifier))
-        if len(filtered_identifier) == 10 and validade_isbn10(filtered_identifier):
-            isbn10 = filtered_identifier
-        if len(filtered_identifier) == 13 and validate_isbn13(filtered_identifier):
-            isbn13 = filtered_identifier
-
-        # Get ISBN with REGEX if needed.
-        if isbn10 == "" and isbn13 == "":
-            docs = book.get_items_of_type(ebooklib.ITEM_DOCUMENT)
-            html_pile = ""
-            for i, html in enumerate(docs):
-                if i > self.pages_to_read:
-                    break
-                html_pile += str(html.get_body_content())
-
-            isbn_mos = self.RE_ISBN.finditer(html_pile)
-
-            for mo in isbn_mos:
-                match_str = mo.group()
-                if len(match_str.replace("-", "")) == 10 and validade_isbn10(match_str.replace("-", "")):
-                    if not isbn10:
-                        isbn10 = match_str
-                if len(match_str.replace("-", "")) == 13 and validate_isbn13(match_str.replace("-", "")):
-                    if not isbn13:
-                        isbn13 = match_str
+    def _open_text_writer(self, filepath: Path) -> ContextManager:
+        if self.text_store is None:
+            return nullcontext()
+        return self.text_store.writer(Book.hash_filename(filepath.name))
 
-        return isbn10, isbn13
+    def _epub_parser(self, filepath: Path) -> tuple[str, str]:
+        try:
+            with open_book(filepath) as file:
+                book = epub.read_epub(file)
+            with self._open_text_writer(filepath) as writer:
+                return self._run_cascade(ParseContext(
+                    filepath=filepath, document=book, text_writer=writer
+                ))
+        except (epub.EpubException, BadZipFile, KeyError) as e:
+            self.logger.error("EPUB file is probably corrupted!",
+                              exc_info=True)
+            raise CorruptedFileError(f"Corrupted EPUB: {e}") from e
+
+    def _epub_identifier_step(self, ctx: ParseContext) -> tuple[str, str]:
+        """Get ISBN from the dc:identifier metadata, which may be absent."""
+        for identifier, _ in ctx.document.get_metadata("DC", "identifier"):
+            filtered_identifier = "".join(filter(str.isdigit, identifier))
+            if (len(filtered_identifier) == 10
+                    and validade_isbn10(filtered_identifier)):
+                return filtered_identifier, ""
+            if (len(filtered_identifier) == 13
+                    and validate_isbn13(filtered_identifier)):
+                return "", filtered_identifier
+        return "", ""
+
+    def _epub_text_step(self, ctx: ParseContext) -> tuple[str, str]:
+        """
+        Get ISBN with REGEX from the first documents. With a TextStore,
+        every document is read and streamed to it as plain text.
+        """
+        docs = ctx.document.get_items_of_type(ebooklib.ITEM_DOCUMENT)
+        html_pile = []
+        for i, html in enumerate(docs):
+            if i > self.pages_to_read and ctx.text_writer is None:
+                break
+
+            body = html.get_body_content().decode(errors="replace")
+            if i <= self.pages_to_read:
+                html_pile.append(body)
+            if ctx.text_writer is not None:
+                ctx.text_writer.write_page(
+                    unescape(self.RE_TAG.sub(" ", body))
+                )
 
-    def _pdf_parser(self, filepath: Path) -> tuple[str, str]:
-        isbn10 = ""
-        isbn13 = ""
+        ctx.text_extracted = True
+        return self.match_isbns("\n".join(html_pile))
 
+    def _pdf_parser(self, filepath: Path) -> tuple[str, str]:
         try:
-            reader = PdfReader(filepath)
-        except PdfReadError:
-            self.logger.error(
-                "PDF file is probably corrupted!"
-                f"\n{traceback.format_exc()}"
-            )
+            # The reader loads pages from the file as they are read.
+            with (open_book(filepath) as file,
+                  self._open_text_writer(filepath) as writer):
+                return self._run_cascade(ParseContext(
+                    filepath=filepath, document=pypdf.PdfReader(file),
+                    text_writer=writer
+                ))
+        except pypdf.errors.PdfReadError as e:
+            self.logger.error("PDF file is probably corrupted!", exc_info=True)
+            raise CorruptedFileError(f"Corrupted PDF: {e}") from e
+
+    def _pdf_metadata_step(self, ctx: ParseContext) -> tuple[str, str]:
+        """Get ISBN from the document information dictionary."""
+        if not ctx.document.metadata:
             return "", ""
-
-        pages = reader.pages[0:self.pages_to_read]
-        for i, page in enumerate(pages):
+        fields = " ".join(str(value)
+                          for value in ctx.document.metadata.values())
+        return self.match_isbns(fields)
+
+    def _pdf_text_step(self, ctx: ParseContext) -> tuple[str, str]:
+        """
+        Get ISBN with REGEX from the text of the first pages. With a
+        TextStore, every page is read and streamed to it.
+        """
+        isbn10 = ""
+        isbn13 = ""
+        ctx.text_layer = False
+        last_page = None if ctx.text_writer else self.pages_to_read
+        for i, page in enumerate(ctx.document.pages[0:last_page]):
             text = page.extract_text()
-            isbn_mos = self.RE_ISBN.finditer(text)
-            if isbn_mos:
-                for mo in isbn_mos:
-                    match_str = mo.group()
-                    if len(match_str.replace("-", "")) == 10 and validade_isbn10(match_str.replace("-", "")):
-                        if not isbn10:
-                            isbn10 = match_str
-                    if len(match_str.replace("-", "")) == 13 and validate_isbn13(match_str.replace("-", "")):
-                        if not isbn13:
-                            isbn13 = match_str
+            if ctx.text_writer is not None:
+                ctx.text_writer.write_page(text)
+            if i >= self.pages_to_read:
+                continue
+
+            if text.strip():
+                ctx.text_layer = True
+            page_isbn10, page_isbn13 = self.match_isbns(text)
+            isbn10 = isbn10 or page_isbn10
+            isbn13 = isbn13 or page_isbn13
+
+        ctx.text_extracted = True
+        return isbn10, isbn13
+
+    def match_isbns(self, text: str) -> tuple[str, str]:
+        """Returns the first valid ISBN-10 and ISBN-13 found in text."""
+        isbn10 = ""
+        isbn13 = ""
+        for mo in self.RE_ISBN.finditer(text):
+            match_str = mo.group()
+            digits = match_str.replace("-", "")
+            if len(digits) == 10 and validade_isbn10(digits):
+                if not isbn10:
+                    isbn10 = match_str
+            if len(digits) == 13 and validate_isbn13(digits):
+                if not isbn13:
+                    isbn13 = match_str
 
         return isbn10, isbn13
 
 
 class MetadataFetcher:
+    """
+    Metadata for an ISBN from isbnlib. With an offline `index`, it is
+    searched first; with `offline`, the network is never used.
+    """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, index: "ISBNIndex | None" = None, offline: bool = False
+    ) -> None:
         self.logger = logging.getLogger(__name__)
+        self.index = index
+        self.offline = offline
+
+    def _from_index(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        for isbn in (isbn13, isbn10):
+            if not isbn:
+                continue
+            metadata = self.index.lookup(isbn)
+            if metadata:
+                self.logger.info("Metadata found offline with %s!", isbn)
+                return {**metadata, "parsed_isbn": isbn}, True
+        return {}, False
 
     def from_isbn(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        if self.index is not None:
+            metadata, found = self._from_index(isbn10, isbn13)
+            if found:
+                return metadata, True
+        if self.offline:
+            self.logger.warning(
+                "Metadata not in the offline index. "
+                "Manual Metadata is required."
+            )
+            return {}, False
+
         if isbn13:
-            self.logger.info(f"ISBN-13: {isbn13} found.")
+            self.logger.info("ISBN-13: %s found.", isbn13)
             try:
                 metadata = isbnlib.meta(isbn13.replace("-", ""))
-            except ISBNLibException:
-                self.logger.error(
-                    "ISBNLib metadata fetching failed!\n"
-                    f"{traceback.format_exc()}"
-                )
+            except isbnlib.ISBNLibException:
+                self.logger.error("ISBNLib metadata fetching failed!",
+                                  exc_info=True)
                 return {}, False
 
             if metadata:
-                self.logger.info(f"Metadata found with ISBN-13!")
+                self.logger.info("Metadata found with ISBN-13!")
                 metadata = {
                     **metadata,
                     "parsed_isbn": isbn13
@@ -172,21 +396,19 @@ class MetadataFetcher:
                     "Trying ISBN-10..."
                 )
         else:
-            self.logger.info(f"ISBN-13 not found. Trying ISBN-10...")
+            self.logger.info("ISBN-13 not found. Trying ISBN-10...")
 
         if isbn10:
-            self.logger.info(f"ISBN-10: {isbn10} found.")
+            self.logger.info("ISBN-10: %s found.", isbn10)
             try:
                 metadata = isbnlib.meta(isbn10.replace("-", ""))
-            except ISBNLibException:
-                self.logger.error(
-                    "ISBNLib metadata fetching failed!\n"
-                    f"{traceback.format_exc()}"
-                )
+            except isbnlib.ISBNLibException:
+                self.logger.error("ISBNLib metadata fetching failed!",
+                                  exc_info=True)
                 return {}, False
 
             if metadata:
-                self.logger.info(f"Metadata found with ISBN-10!")
+                self.logger.info("Metadata found with ISBN-10!")
                 metadata = {
                     **metadata,
                     "parsed_isbn": isbn10
@@ -207,28 +429,89 @@ class MetadataFetcher:
 
 
 class BookImporter:
-    def __init__(self, fetcher: MetadataFetcher, parser: ISBNParser) -> None:
+    """
+    Builds Books from files: ISBNs from the parser, metadata from the
+    fetcher. With a `titles` index, books whose ISBN gives no metadata
+    are matched by file name and embedded title instead.
+    """
+
+    def __init__(
+        self, fetcher: MetadataFetcher, parser: ISBNParser,
+        ocr: "OCRStage | None" = None, titles: "TitleIndex | None" = None
+    ) -> None:
         self.logger = logging.getLogger(__name__)
         self.fetcher = fetcher
         self.parser = parser
+        self.ocr = ocr
+        self.titles = titles
+        self.failures: list[ParseResult] = []
+
+    def import_from_file(
+        self, file: Path, folder: dict | None = None,
+        size: float | None = None
+    ) -> Book:
+        """
+        Import one file, which may be a member of a ZIP archive. `size` may
+        be passed when the caller already stat'ed the file (e.g.
+        DirectoryScanner), which skips the checks.
+        """
+        if size is None:
+            try:
+                size = file_size(file)
+            except FileNotFoundError:
+                self.logger.error("File: %s does not exists.", file)
+                raise FileNotFoundError("Provided file does not exists.")
 
-    def import_from_file(self, file: Path, folder: dict | None = None) -> Book:
-        """"""
-        if not file.is_file():
-            self.logger.error(f"File: {file} does not exists.")
-            raise FileNotFoundError("Provided file does not exists.")
-
-        parse_function = self.parser.get_format_parser(file.suffix)
-        isbn10, isbn13 = parse_function(file)
+        result = self.parser.parse(file)
+        if result.status == ParseStatus.NO_TEXT and self.ocr is not None:
+            result = self.ocr.parse(file)
+        self.record_parse_result(result)
 
-        metadata, success = self.fetcher.from_isbn(isbn10, isbn13)
+        metadata, success = self.fetch_metadata(result)
 
         if folder is None:
+            # The folder of the archive, for a member.
+            split = split_member(file)
+            parent = (file if split is None else split[0]).parent
             folder = {
-                "name": file.parent.name,
-                "path": file.parent
+                "name": parent.name,
+                "path": parent
             }
 
+        return self.build_book(file, folder, metadata, size)
+
+    def fetch_metadata(self, result: ParseResult) -> tuple[dict, bool]:
+        """Metadata by ISBN, else by title from the title index."""
+        metadata, success = self.fetcher.from_isbn(result.isbn10,
+                                                   result.isbn13)
+        if success or self.titles is None:
+            return metadata, success
+
+        match = self.titles.best(filename_title(result.file.name),
+                                 result.title)
+        if match is None:
+            return metadata, False
+        self.logger.info("[TITLE-MATCH] %s matched %r (%.2f)",
+                         result.file.name, match.metadata['Title'],
+                         match.score)
+        # The ISBN of a similar title is a guess, not the book's own.
+        metadata = {key: value for key, value in match.metadata.items()
+                    if key != "ISBN-13"}
+        return metadata, True
+
+    def record_parse_result(self, result: ParseResult) -> None:
+        """Keep failed parses in self.failures so bulk imports go on."""
+        if not result.failed:
+            return
+
+        self.failures.append(result)
+        self.logger.warning("[PARSE-%s] %s %s", result.status.name,
+                            result.file.name, result.message)
+
+    def build_book(
+        self, file: Path, folder: dict, metadata: dict, size: float
+    ) -> Book:
+        """Assemble a Book from a file and the metadata fetched for it."""
         year = metadata.get("Year", "0")
         book = Book.from_raw_data({
             "title": metadata.get("Title"),
@@ -242,22 +525,36 @@ class BookImporter:
             "filename": file.name,
             "ext": file.suffix,
             "storage_path": file.relative_to(folder["path"]),
-            "size": os.path.getsize(file),
+            "size": size,
             "tags": [],
             "cover_path": None
         })
         return book
 
-    def import_from_folder(self, folderpath: Path) -> list[Book]:
-        """"""
+    @profiled
+    def import_from_folder(
+        self, folderpath: Path, scanner: DirectoryScanner | None = None,
+        archives: bool = False
+    ) -> list[Book]:
+        """
+        Import every supported file under folderpath. With `archives`, the
+        books inside its ZIP/CBZ archives too.
+        """
         if not folderpath.is_dir():
-            self.logger.error(f"Folder: {folderpath} does not exists.")
+            self.logger.error("Folder: %s does not exists.", folderpath)
             raise FileNotFoundError("This directory does not exist.")
 
+        if scanner is None:
+            scanner = DirectoryScanner(
+                FORMATS | ARCHIVE_FORMATS if archives else FORMATS)
+
         books = []
         folder = {"name": folderpath.name, "path": folderpath}
-        for filepath in folderpath.rglob("*"):
-            if filepath.suffix in FORMATS:
-                book_data = self.import_from_file(filepath, folder)
-                books.append(book_data)
+        scanned_files = scanner.scan(folderpath)
+        if archives:
+            scanned_files = expand_archives(scanned_files, FORMATS)
+        for scanned in scanned_files:
+            book_data = self.import_from_file(scanned.path, folder,
+                                              scanned.size)
+            books.append(book_data)
         return books
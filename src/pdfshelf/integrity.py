@@ -0,0 +1,341 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import zipfile
+from enum import Enum
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, NamedTuple
+from .archive import ARCHIVE_FORMATS, expand_archives, file_size, open_book
+from .importer import FORMATS
+from .scanner import DirectoryScanner, ScannedFile
+
+LOGGER = logging.getLogger(__name__)
+
+Connection = sqlite3.Connection
+
+# Books checked per task of the thread pool.
+BATCH_SIZE = 256
+# stat() and reads wait on the disk, not on the GIL: threads scale until
+# the disk (or the network filesystem) is saturated.
+WORKERS = 16
+
+
+class Finding(str, Enum):
+    MISSING = "missing"
+    CHANGED = "changed"
+    RELINKED = "relinked"
+    COVER_MISSING = "cover_missing"
+
+
+@dataclass(kw_only=True)
+class IntegrityIssue:
+    book_id: int
+    finding: Finding
+    path: Path
+    expected_size: float | None = None
+    actual_size: int | None = None
+    # Where a missing file was found again, for RELINKED.
+    new_path: Path | None = None
+
+
+class _Row(NamedTuple):
+    # Built straight from the query rows, with str paths: Path objects
+    # cost more than the stat() calls on a warm cache.
+    book_id: int
+    path: str
+    filename: str
+    size: float
+    cover_path: str | None
+    checksum: str | None
+
+
+def file_checksum(path: Path) -> str:
+    """SHA-256 of the content of a file, which may be an archive member."""
+    with open_book(path) as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+class IntegrityChecker:
+    """
+    Checks that the Books of the library still point at their files: the
+    file and the cover exist, and the file has the recorded size and,
+    with `content_hash`, the recorded checksum. Checksums are recorded in
+    BookChecksum the first time a file is hashed.
+
+    Files are checked by a thread pool, `batch_size` Books per task, and
+    the database is only used by the calling thread. With `relink`, the
+    active Folders are scanned for missing files: a file of the same size
+    and checksum (or, without a recorded checksum, the same name) is
+    linked to its Book again. Findings replace those of the last check in
+    IntegrityFinding.
+    """
+
+    def __init__(
+        self, con: Connection, *, content_hash: bool = False,
+        relink: bool = True, workers: int = WORKERS,
+        batch_size: int = BATCH_SIZE,
+        on_progress: Callable[[int], None] | None = None
+    ) -> None:
+        self.con = con
+        self.content_hash = content_hash
+        self.relink = relink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.logger = logging.getLogger(__name__)
+        IntegrityChecker.create_tables(con)
+
+    @staticmethod
+    def create_tables(con: Connection) -> None:
+        cur = con.cursor()
+        cur.execute("""CREATE TABLE IF NOT EXISTS IntegrityFinding (
+                        book_id INTEGER NOT NULL,
+                        finding TEXT NOT NULL,
+                        path TEXT NOT NULL,
+                        expected_size REAL,
+                        actual_size INTEGER,
+                        new_path TEXT,
+                        checked_date DATE NOT NULL,
+                        FOREIGN KEY (book_id) REFERENCES Book (book_id)
+                        )""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS BookChecksum (
+                        book_id INTEGER PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        sha256 TEXT NOT NULL,
+                        checked_date DATE NOT NULL,
+                        FOREIGN KEY (book_id) REFERENCES Book (book_id)
+                        )""")
+        # Ids of deleted Books can be reused by new ones.
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS BookChecksum_delete
+                        AFTER DELETE ON Book BEGIN
+                        DELETE FROM BookChecksum WHERE book_id = OLD.book_id;
+                        DELETE FROM IntegrityFinding
+                        WHERE book_id = OLD.book_id;
+                        END""")
+        if con.in_transaction:
+            con.commit()
+
+    def check(self) -> list[IntegrityIssue]:
+        """Check every Book, relink what can be and record the findings."""
+        rows = self._load_rows()
+        issues: list[IntegrityIssue] = []
+        missing: list[_Row] = []
+        batches = [rows[i:i + self.batch_size]
+                   for i in range(0, len(rows), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for batch, (found, lost, checksums) in zip(
+                batches, pool.map(self._check_batch, batches)
+            ):
+                issues.extend(found)
+                missing.extend(lost)
+                if checksums:
+                    self._save_checksums(checksums)
+                if self.on_progress is not None:
+                    self.on_progress(len(batch))
+
+            relinked = {}
+            if self.relink and missing:
+                known = {row.path for row in rows}
+                relinked = self._find_moved(pool, missing, known)
+
+        for row in missing:
+            if row.book_id in relinked:
+                _, _, path = relinked[row.book_id]
+                issues.append(IntegrityIssue(
+                    book_id=row.book_id, finding=Finding.RELINKED,
+                    path=Path(row.path), expected_size=row.size,
+                    new_path=path
+                ))
+            else:
+                issues.append(IntegrityIssue(
+                    book_id=row.book_id, finding=Finding.MISSING,
+                    path=Path(row.path), expected_size=row.size
+                ))
+        issues.sort(key=lambda issue: issue.book_id)
+        self._save_findings(issues, relinked)
+
+        self.logger.info("[INTEGRITY] %s Books checked, %s findings.",
+                         len(rows), len(issues))
+        return issues
+
+    def load_findings(self) -> list[IntegrityIssue]:
+        """The findings of the last check."""
+        res = self.con.execute(
+            """SELECT book_id, finding, path, expected_size, actual_size,
+                      new_path
+               FROM IntegrityFinding ORDER BY book_id, rowid"""
+        )
+        return [
+            IntegrityIssue(
+                book_id=book_id, finding=Finding(finding), path=Path(path),
+                expected_size=expected, actual_size=actual,
+                new_path=None if new_path is None else Path(new_path)
+            )
+            for book_id, finding, path, expected, actual, new_path
+            in res.fetchall()
+        ]
+
+    def _load_rows(self) -> list[_Row]:
+        # Sorted by path, so the files of a folder are checked together.
+        res = self.con.execute(
+            """SELECT Book.book_id, Folder.path || ? || Book.storage_path,
+                      Book.filename, Book.size, Book.cover_path,
+                      BookChecksum.sha256
+               FROM Book
+               JOIN Folder ON Folder.folder_id = Book.folder_id
+               LEFT JOIN BookChecksum ON BookChecksum.book_id = Book.book_id
+               ORDER BY Folder.path, Book.storage_path""", (os.sep, )
+        )
+        return list(map(_Row._make, res))
+
+    def _check_batch(
+        self, rows: list[_Row]
+    ) -> tuple[list[IntegrityIssue], list[_Row], list[tuple]]:
+        """Runs on the pool: the issues, missing files and new checksums."""
+        issues, missing, checksums = [], [], []
+        for row in rows:
+            if row.cover_path and not os.path.exists(row.cover_path):
+                issues.append(IntegrityIssue(
+                    book_id=row.book_id, finding=Finding.COVER_MISSING,
+                    path=Path(row.cover_path)
+                ))
+
+            try:
+                size = file_size(row.path)
+                changed = size != int(row.size)
+                if self.content_hash and not changed:
+                    checksum = file_checksum(row.path)
+                    if row.checksum is None:
+                        checksums.append((row.book_id, size, checksum))
+                    changed = row.checksum not in (None, checksum)
+            except FileNotFoundError:
+                missing.append(row)
+                continue
+            except (OSError, zipfile.BadZipFile) as e:
+                self.logger.warning("[INTEGRITY] Could not read %s: %s",
+                                    row.path, e)
+                continue
+
+            if changed:
+                issues.append(IntegrityIssue(
+                    book_id=row.book_id, finding=Finding.CHANGED,
+                    path=Path(row.path), expected_size=row.size,
+                    actual_size=size
+                ))
+        return issues, missing, checksums
+
+    def _find_moved(
+        self, pool: ThreadPoolExecutor, missing: list[_Row], known: set[str]
+    ) -> dict[int, tuple[int, Path, Path]]:
+        """
+        Search the active Folders for the missing files. Returns book_id ->
+        (folder_id, Folder path, new path) of each file found once.
+        """
+        by_size: dict[int, list[tuple[int, Path, ScannedFile]]] = {}
+        scanner = DirectoryScanner(FORMATS | ARCHIVE_FORMATS,
+                                   workers=self.workers)
+        folders = self.con.execute(
+            "SELECT folder_id, path FROM Folder WHERE active = 1"
+        ).fetchall()
+        seen = set()
+        for folder_id, root in folders:
+            root = Path(root)
+            if not root.is_dir():
+                continue
+            # A moved archive is matched member by member.
+            for scanned in expand_archives(scanner.scan(root), FORMATS):
+                if str(scanned.path) in known or scanned.path in seen:
+                    continue
+                seen.add(scanned.path)
+                by_size.setdefault(scanned.size, []).append(
+                    (folder_id, root, scanned))
+
+        checksums: dict[Path, Any] = {}
+        candidates = {row.book_id: by_size.get(int(row.size), [])
+                      for row in missing}
+        for row in missing:
+            if row.checksum is not None:
+                for _, _, scanned in candidates[row.book_id]:
+                    if scanned.path not in checksums:
+                        checksums[scanned.path] = pool.submit(
+                            self._safe_checksum, scanned.path)
+
+        relinked = {}
+        claimed = set()
+        for row in missing:
+            if row.checksum is None:
+                matches = [candidate for candidate in candidates[row.book_id]
+                           if candidate[2].path.name == row.filename]
+            else:
+                matches = [candidate for candidate in candidates[row.book_id]
+                           if checksums[candidate[2].path].result()
+                           == row.checksum]
+            # Ambiguous matches are left to the user.
+            if len(matches) != 1 or matches[0][2].path in claimed:
+                continue
+            folder_id, root, scanned = matches[0]
+            claimed.add(scanned.path)
+            relinked[row.book_id] = (folder_id, root, scanned.path)
+        return relinked
+
+    def _safe_checksum(self, path: Path) -> str | None:
+        try:
+            return file_checksum(path)
+        except OSError as e:
+            self.logger.warning("[INTEGRITY] Could not read %s: %s", path, e)
+            return None
+
+    def _save_checksums(self, checksums: list[tuple]) -> None:
+        now = datetime.now()
+        cur = self.con.cursor()
+        try:
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            cur.executemany(
+                "INSERT OR REPLACE INTO BookChecksum VALUES (?, ?, ?, ?)",
+                [(*checksum, now) for checksum in checksums]
+            )
+            self.con.commit()
+        except sqlite3.Error:
+            self.logger.error("Saving checksums failed, rolling back!",
+                              exc_info=True)
+            self.con.rollback()
+
+    def _save_findings(
+        self, issues: list[IntegrityIssue],
+        relinked: dict[int, tuple[int, Path, Path]]
+    ) -> None:
+        now = datetime.now()
+        cur = self.con.cursor()
+        try:
+            if not self.con.in_transaction:
+                cur.execute("BEGIN")
+            cur.executemany(
+                """UPDATE Book SET folder_id = ?, storage_path = ?
+                   WHERE book_id = ?""",
+                [(folder_id, str(path.relative_to(root)), book_id)
+                 for book_id, (folder_id, root, path) in relinked.items()]
+            )
+            cur.execute("DELETE FROM IntegrityFinding")
+            cur.executemany(
+                "INSERT INTO IntegrityFinding VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(issue.book_id, issue.finding.value, str(issue.path),
+                  issue.expected_size, issue.actual_size,
+                  None if issue.new_path is None else str(issue.new_path),
+                  now)
+                 for issue in issues]
+            )
+            self.con.commit()
+        except sqlite3.Error:
+            self.logger.error("Saving findings failed, rolling back!",
+                              exc_info=True)
+            self.con.rollback()
+            return
+
+        for book_id, (_, _, path) in relinked.items():
+            self.logger.info("    [RELINKED] Book %s to %s", book_id, path)
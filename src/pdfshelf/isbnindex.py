@@ -0,0 +1,285 @@
+import io
+import os
+import re
+import gzip
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TextIO
+from .config import get_config
+from .utilities import isbn10_to_isbn13
+
+LOGGER = logging.getLogger(__name__)
+
+# Rows per executemany while building.
+BATCH_SIZE = 10000
+YEAR = re.compile(r"\b(1[4-9]\d\d|20\d\d)\b")
+# MARC language codes of OpenLibrary -> the ISO 639-1 codes isbnlib gives.
+LANGUAGES = {
+    "eng": "en", "fre": "fr", "ger": "de", "spa": "es", "por": "pt",
+    "ita": "it", "rus": "ru", "jpn": "ja", "chi": "zh", "dut": "nl",
+    "pol": "pl", "swe": "sv", "dan": "da", "nor": "no", "fin": "fi",
+    "cze": "cs", "gre": "el", "tur": "tr", "ara": "ar", "heb": "he",
+    "kor": "ko", "hin": "hi", "lat": "la", "hun": "hu", "rum": "ro"
+}
+
+
+def _open_dump(path: Path) -> TextIO:
+    """Open a dump as text, gunzipping it when it starts with the gzip magic."""
+    with open(path, "rb") as file:
+        compressed = file.read(2) == b"\x1f\x8b"
+    if compressed:
+        return io.TextIOWrapper(gzip.open(path), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _records(path: Path) -> Iterator[dict]:
+    """
+    JSON records of a dump, streamed. Takes JSON Lines and OpenLibrary's
+    tab-separated dumps (type, key, revision, last_modified, JSON).
+    """
+    with _open_dump(path) as dump:
+        for number, line in enumerate(dump, 1):
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            if not line.startswith("{"):
+                line = line.rsplit("\t", 1)[-1]
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                LOGGER.warning("[ISBN-INDEX] %s:%s is not valid JSON, "
+                               "skipped.", path.name, number)
+
+
+def default_index_path() -> Path:
+    return get_config().document_folder / "isbn.db"
+
+
+def normalize_isbn(isbn: str) -> int | None:
+    """The ISBN-13 of an ISBN-10 or ISBN-13, as the integer key, or None."""
+    digits = "".join(char for char in isbn if char.isdigit() or char in "xX")
+    if len(digits) == 10:
+        digits = isbn10_to_isbn13(digits)
+    if len(digits) != 13 or not digits.isdigit():
+        return None
+    return int(digits)
+
+
+class ISBNIndex:
+    """
+    Offline ISBN metadata, in a SQLite file keyed by the ISBN-13 as an
+    INTEGER PRIMARY KEY: a lookup is one B-tree search, whatever the size
+    of the index, and memory stays at SQLite's page cache. ISBN-10s are
+    stored and looked up through their ISBN-13.
+
+    Lookups are safe from several threads (one read-only connection each).
+    """
+
+    def __init__(self, path: Path) -> None:
+        if not path.exists():
+            raise FileNotFoundError(f"No ISBN index at {path}.")
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                  check_same_thread=False)
+            self._local.con = con
+            with self._lock:
+                self._connections.append(con)
+        return con
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            "SELECT count(*) FROM Edition").fetchone()[0]
+
+    def lookup(self, isbn: str) -> dict[str, Any] | None:
+        """Metadata for an ISBN, in the format of isbnlib.meta()."""
+        key = normalize_isbn(isbn)
+        if key is None:
+            return None
+        row = self._connection().execute(
+            """SELECT isbn, title, authors, publisher, year, lang
+               FROM Edition WHERE isbn = ?""", (key, )
+        ).fetchone()
+        return None if row is None else self._metadata(row)
+
+    def entries(self) -> Iterator[dict[str, Any]]:
+        """Metadata of every edition with a title, streamed."""
+        rows = self._connection().execute(
+            """SELECT isbn, title, authors, publisher, year, lang
+               FROM Edition WHERE title IS NOT NULL"""
+        )
+        for row in rows:
+            yield self._metadata(row)
+
+    @staticmethod
+    def _metadata(row: tuple) -> dict[str, Any]:
+        isbn, title, authors, publisher, year, lang = row
+        metadata = {"ISBN-13": str(isbn), "Title": title,
+                    "Authors": json.loads(authors) if authors else [],
+                    "Publisher": publisher or "", "Language": lang or ""}
+        if year:
+            metadata["Year"] = str(year)
+        return metadata
+
+    @classmethod
+    def build(
+        cls, editions: Path, path: Path, authors: Path | None = None,
+        on_progress: Callable[[int], None] | None = None
+    ) -> "ISBNIndex":
+        """
+        Build an index at `path` from an editions dump (JSON Lines or
+        OpenLibrary's TSV dump, plain or gzipped), streamed in batches.
+        Edition authors are names or OpenLibrary author keys; keys are
+        resolved through an optional `authors` dump. The index replaces
+        `path` only once complete. `on_progress` gets the editions read
+        so far, per batch.
+        """
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        con = sqlite3.connect(tmp_path)
+        try:
+            # Rebuilt from scratch on failure: no journal needed.
+            con.execute("PRAGMA journal_mode = OFF")
+            con.execute("PRAGMA synchronous = OFF")
+            con.execute("""CREATE TABLE Edition (
+                            isbn INTEGER PRIMARY KEY,
+                            title TEXT,
+                            authors TEXT,
+                            publisher TEXT,
+                            year INTEGER,
+                            lang TEXT
+                            )""")
+            con.execute("""CREATE TEMP TABLE Author (
+                            key TEXT PRIMARY KEY,
+                            name TEXT NOT NULL
+                            ) WITHOUT ROWID""")
+            if authors is not None:
+                cls._load_authors(con, authors)
+            count = cls._load_editions(con, editions, on_progress)
+            con.commit()
+            con.execute("DROP TABLE temp.Author")
+            con.execute("VACUUM")
+        except BaseException:
+            con.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        con.close()
+        os.replace(tmp_path, path)
+        LOGGER.info("[ISBN-INDEX] %s editions indexed in %s", count, path)
+        return cls(path)
+
+    @staticmethod
+    def _batches(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def _load_authors(cls, con: sqlite3.Connection, path: Path) -> None:
+        rows = ((record["key"], record["name"]) for record in _records(path)
+                if record.get("key") and record.get("name"))
+        for batch in cls._batches(rows, BATCH_SIZE):
+            con.executemany("INSERT OR REPLACE INTO temp.Author "
+                            "VALUES (?, ?)", batch)
+
+    @classmethod
+    def _load_editions(
+        cls, con: sqlite3.Connection, path: Path,
+        on_progress: Callable[[int], None] | None
+    ) -> int:
+        count = 0
+        for records in cls._batches(_records(path), BATCH_SIZE):
+            keys = {author["key"] for record in records
+                    for author in record.get("authors") or ()
+                    if isinstance(author, dict) and "key" in author}
+            names = cls._author_names(con, keys)
+
+            rows = []
+            for record in records:
+                rows.extend(cls._edition_rows(record, names))
+            con.executemany("INSERT OR REPLACE INTO Edition "
+                            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            count += len(records)
+            if on_progress is not None:
+                on_progress(count)
+        return count
+
+    @staticmethod
+    def _author_names(
+        con: sqlite3.Connection, keys: set[str]
+    ) -> dict[str, str]:
+        if not keys:
+            return {}
+        # One parameter for the whole batch: a bound variable per key
+        # would pass SQLite's variable limit on editions with many authors.
+        return dict(con.execute(
+            """SELECT key, name FROM temp.Author
+               WHERE key IN (SELECT value FROM json_each(?))""",
+            (json.dumps(list(keys)), )
+        ).fetchall())
+
+    @staticmethod
+    def _edition_rows(record: dict, names: dict[str, str]) -> list[tuple]:
+        isbns = {normalize_isbn(isbn)
+                 for field in ("isbn_13", "isbn_10", "isbn")
+                 for isbn in record.get(field) or ()}
+        isbns.discard(None)
+        if not isbns:
+            return []
+
+        authors = []
+        for author in record.get("authors") or ():
+            if isinstance(author, str):
+                authors.append(author)
+            elif not isinstance(author, dict):
+                continue
+            elif author.get("name"):
+                authors.append(author["name"])
+            elif author.get("key") in names:
+                authors.append(names[author["key"]])
+        if not authors and record.get("by_statement"):
+            authors.append(record["by_statement"])
+
+        title = record.get("title")
+        if title and record.get("subtitle"):
+            title = f"{title}: {record['subtitle']}"
+        publishers = record.get("publishers") or [None]
+        match = YEAR.search(str(record.get("publish_date", "")))
+        lang = None
+        for language in record.get("languages") or ():
+            if not isinstance(language, dict):
+                continue
+            code = language.get("key", "").rsplit("/", 1)[-1]
+            lang = LANGUAGES.get(code, code)
+            break
+
+        row = (title, json.dumps(authors) if authors else None,
+               publishers[0], int(match.group(1)) if match else None, lang)
+        return [(isbn, *row) for isbn in isbns]
@@ -0,0 +1,123 @@
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from .config import get_config
+
+FILE_FORMAT = ("%(asctime)s %(name)-22s %(levelname)-8s [%(lineno)-3s] "
+               "%(message)s")
+STREAM_FORMAT = "%(name)-22s %(levelname)-8s [%(lineno)-3s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+_listener: QueueListener | None = None
+_handler: QueueHandler | None = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "logger": record.name,
+            "level": record.levelname,
+            "line": record.lineno,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    Enqueues records as they are. The queue never leaves the process, so
+    the message arguments and tracebacks are formatted by the listener
+    thread instead of the thread that logs.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _NotPDFShelf(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not record.name.startswith("pdfshelf")
+
+
+def _file_handler(
+    name: str, formatter: logging.Formatter
+) -> RotatingFileHandler:
+    handler = RotatingFileHandler(get_config().config_folder / name,
+                                  maxBytes=2500000, backupCount=25)
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def setup_logging(
+    *, json_format: bool = False, dependencies: bool = False
+) -> QueueListener:
+    """
+    Attach the pdfshelf file and console handlers. Called by applications,
+    not on import, so using the library does not touch the filesystem.
+
+    Loggers only put records on a queue; a listener thread formats and
+    writes them, so logging never waits on the disk. `json_format` writes
+    the log file as JSON Lines. With `dependencies`, the records of other
+    libraries go to pdfshelf_dependencies.log through the same queue.
+    Handlers are attached once: later calls return the running listener.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return _listener
+
+    if json_format:
+        formatter: logging.Formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(FILE_FORMAT, DATE_FORMAT)
+
+    f_handler = _file_handler("pdfshelf.log", formatter)
+    f_handler.addFilter(logging.Filter("pdfshelf"))
+
+    s_handler = logging.StreamHandler()
+    s_handler.setLevel(logging.WARNING)
+    s_handler.setFormatter(logging.Formatter(STREAM_FORMAT))
+    handlers: list[logging.Handler] = [f_handler, s_handler]
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = _LocalQueueHandler(log_queue)
+    logger = logging.getLogger("pdfshelf")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(_handler)
+    # Handled once, here, and not again by handlers of the root logger.
+    logger.propagate = False
+
+    if dependencies:
+        d_handler = _file_handler("pdfshelf_dependencies.log", formatter)
+        d_handler.addFilter(_NotPDFShelf())
+        handlers.append(d_handler)
+        root = logging.getLogger()
+        root.setLevel(logging.DEBUG)
+        root.addHandler(_handler)
+
+    _listener = QueueListener(log_queue, *handlers,
+                              respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write the queued records, stop the listener and detach handlers."""
+    global _listener, _handler
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for logger in (logging.getLogger("pdfshelf"), logging.getLogger()):
+        logger.removeHandler(_handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _handler = None
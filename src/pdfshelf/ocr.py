@@ -0,0 +1,233 @@
+import abc
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+from pathlib import Path
+from multiprocessing.context import BaseContext
+from concurrent.futures import ProcessPoolExecutor
+from .archive import open_book, split_member
+from .cover import (
+    COVER_DPI, FileCoverExtractor, atomic_file, cover_exists
+)
+from .domain import Book, ParseResult, ParseStatus
+from .importer import ISBNParser
+from .utilities import lazy_import
+
+LOGGER = logging.getLogger(__name__)
+
+pdf2image = lazy_import("pdf2image")
+pypdf = lazy_import("pypdf")
+Image = lazy_import("PIL.Image")
+
+try:
+    pytesseract = lazy_import("pytesseract")
+except ModuleNotFoundError:  # OCR is optional.
+    pytesseract = None
+
+
+class OCRBackend(abc.ABC):
+    """Turns a page image into text. Subclass to plug in an OCR engine."""
+
+    @abc.abstractmethod
+    def image_to_text(self, image: "Image.Image") -> str:
+        ...
+
+
+class TesseractBackend(OCRBackend):
+    def __init__(self, lang: str = "eng", config: str = "") -> None:
+        if pytesseract is None:
+            raise ImportError("TesseractBackend requires pytesseract and "
+                              "the tesseract binary.")
+        self.lang = lang
+        self.config = config
+
+    def image_to_text(self, image: "Image.Image") -> str:
+        return pytesseract.image_to_string(image, lang=self.lang,
+                                           config=self.config)
+
+
+def candidate_pages(
+    page_count: int, front_pages: int, back_pages: int
+) -> list[int]:
+    """
+    Pages likely to hold the copyright notice: the first pages (title page
+    and its verso) and the last ones. 1-indexed, as pdf2image expects.
+    """
+    front = range(1, min(front_pages, page_count) + 1)
+    back = range(max(page_count - back_pages + 1, 1), page_count + 1)
+    return list(dict.fromkeys([*front, *back]))
+
+
+def _downscale(image: "Image.Image", dpi: int) -> "Image.Image":
+    """A cover raster, as a grayscale page at the OCR resolution."""
+    with image:
+        page = image.convert("L")
+    if dpi < COVER_DPI:
+        size = (max(round(page.width * dpi / COVER_DPI), 1),
+                max(round(page.height * dpi / COVER_DPI), 1))
+        with page:
+            return page.resize(size)
+    return page
+
+
+def _ocr_candidates(
+    backend: OCRBackend, parser: ISBNParser, filepath: Path, dpi: int,
+    front_pages: int, back_pages: int, cover_path: Path | None,
+    cover_stored: bool
+) -> tuple[str, str]:
+    """
+    Rasterize and OCR candidate pages one at a time until an ISBN shows.
+    With a `cover_path`, page one is the cover raster: read from it when
+    stored, else rendered at COVER_DPI and saved there, then downscaled.
+    """
+    # pdf2image only takes paths or bytes: an archive member is read into
+    # memory and rendered from there.
+    data = None
+    with open_book(filepath) as file:
+        page_count = len(pypdf.PdfReader(file).pages)
+        if split_member(filepath) is not None:
+            file.seek(0)
+            data = file.read()
+
+    def render(page: int, dpi: int, grayscale: bool) -> "Image.Image":
+        options = {"dpi": dpi, "first_page": page, "last_page": page,
+                   "grayscale": grayscale}
+        if data is None:
+            return pdf2image.convert_from_path(filepath, **options)[0]
+        return pdf2image.convert_from_bytes(data, **options)[0]
+
+    for page in candidate_pages(page_count, front_pages, back_pages):
+        if page == 1 and cover_path is not None:
+            if cover_stored:
+                image = Image.open(cover_path)
+            else:
+                image = render(1, COVER_DPI, grayscale=False)
+                with atomic_file(cover_path) as file:
+                    image.save(file, "JPEG")
+            image = _downscale(image, dpi)
+        else:
+            image = render(page, dpi, grayscale=True)
+
+        with image:
+            text = backend.image_to_text(image)
+        isbn10, isbn13 = parser.match_isbns(text)
+        if isbn10 or isbn13:
+            return isbn10, isbn13
+
+    return "", ""
+
+
+class OCRStage:
+    """
+    Fallback for scanned PDFs, whose ISBNParser result is NO_TEXT.
+
+    Only the copyright-page candidates are rasterized, at a low DPI. With
+    a `cover_extractor` (covers are extracted in the same import), page
+    one is shared with it: a stored PDF cover is reused, otherwise the
+    page is rendered at COVER_DPI, saved as the cover and handed to the
+    extractor, which runs later in an import. OCR reads it downscaled.
+    Work runs in a process pool bounded by `workers`, so a large scanned
+    collection can not flood the machine with OCR processes.
+    """
+
+    def __init__(
+        self, backend: OCRBackend | None = None,
+        parser: ISBNParser | None = None, *, workers: int = 2,
+        dpi: int = 150, front_pages: int = 4, back_pages: int = 2,
+        cover_extractor: FileCoverExtractor | None = None,
+        mp_context: BaseContext | None = None
+    ) -> None:
+        self.backend = TesseractBackend() if backend is None else backend
+        self.parser = ISBNParser() if parser is None else parser
+        self.workers = workers
+        self.dpi = dpi
+        self.front_pages = front_pages
+        self.back_pages = back_pages
+        self.cover_extractor = cover_extractor
+        if mp_context is None:
+            mp_context = multiprocessing.get_context("spawn")
+        self.context = mp_context
+
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def parse(self, filepath: Path) -> ParseResult:
+        stored = cover_exists(self._cover_path(filepath))
+        future = self._get_pool().submit(self._job(filepath, stored))
+        try:
+            isbn10, isbn13 = future.result()
+        except Exception as e:
+            return self._failed(filepath, e)
+        finally:
+            self._hand_cover(filepath, stored)
+        return self._result(filepath, isbn10, isbn13)
+
+    async def async_parse(self, filepath: Path) -> ParseResult:
+        loop = asyncio.get_running_loop()
+        stored = cover_exists(self._cover_path(filepath))
+        try:
+            isbn10, isbn13 = await loop.run_in_executor(
+                self._get_pool(), self._job(filepath, stored)
+            )
+        except Exception as e:
+            return self._failed(filepath, e)
+        finally:
+            self._hand_cover(filepath, stored)
+        return self._result(filepath, isbn10, isbn13)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=self.context)
+            return self._pool
+
+    def _cover_path(self, filepath: Path) -> Path | None:
+        if self.cover_extractor is None:
+            return None
+        return self.cover_extractor.get_pdf_cover_path(
+            Book.hash_filename(filepath.name)
+        )
+
+    def _job(self, filepath: Path, cover_stored: bool) -> functools.partial:
+        return functools.partial(
+            _ocr_candidates, self.backend, self.parser, filepath, self.dpi,
+            self.front_pages, self.back_pages, self._cover_path(filepath),
+            cover_stored
+        )
+
+    def _hand_cover(self, filepath: Path, cover_stored: bool) -> None:
+        """Hand a page one rendered by the job to the cover extractor."""
+        if not cover_stored and cover_exists(self._cover_path(filepath)):
+            self.cover_extractor.add_rendered(
+                Book.hash_filename(filepath.name)
+            )
+
+    def _result(self, filepath: Path, isbn10: str, isbn13: str) -> ParseResult:
+        if isbn10 or isbn13:
+            LOGGER.info("[OCR] ISBN found for %s", filepath.name)
+            return ParseResult(file=filepath, status=ParseStatus.OK,
+                               isbn10=isbn10, isbn13=isbn13)
+
+        LOGGER.warning("[OCR] No ISBN found for %s", filepath.name)
+        return ParseResult(file=filepath, status=ParseStatus.NO_ISBN,
+                           message="OCR found no ISBN.")
+
+    def _failed(self, filepath: Path, e: Exception) -> ParseResult:
+        LOGGER.error("[OCR-FAILED] %s: %s", filepath.name, e)
+        return ParseResult(file=filepath, status=ParseStatus.ERROR,
+                           message=f"OCR failed: {type(e).__name__}: {e}")
@@ -0,0 +1,408 @@
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import mimetypes
+from datetime import datetime
+from typing import Any
+from urllib.parse import quote, unquote
+from xml.sax.saxutils import escape, quoteattr
+from dataclasses import dataclass
+
+LOGGER = logging.getLogger(__name__)
+
+ATOM_NAVIGATION = "application/atom+xml;profile=opds-catalog;kind=navigation"
+ATOM_ACQUISITION = "application/atom+xml;profile=opds-catalog;kind=acquisition"
+OPDS2_TYPE = "application/opds+json"
+
+# Navigation facets: facet -> (Book column, column holds a JSON list).
+FACETS = {
+    "author": ("authors", True),
+    "publisher": ("publisher", False),
+    "tag": ("tags", True),
+    "year": ("year", False)
+}
+INDEX_TITLES = {"author": "Authors", "publisher": "Publishers",
+                "tag": "Tags", "year": "Years"}
+INDEX_PATHS = {f"{facet}s" for facet in FACETS}
+
+# Columns of a Book that show up in a feed. A change in any other column
+# does not touch a page.
+FEED_COLUMNS = """Book.book_id, Book.hash_id, Book.title, Book.authors,
+                  Book.year, Book.lang, Book.publisher, Book.isbn13,
+                  Book.ext, Book.tags, Book.added_date, Book.cover_path"""
+
+
+@dataclass(kw_only=True)
+class FeedPage:
+    """One pre-rendered page, in both OPDS 1.2 (Atom) and 2.0 (JSON)."""
+    atom: bytes
+    atom_type: str
+    json: bytes
+    etag: str
+
+
+class OPDSCatalog:
+    """
+    OPDS catalog of the active Books, navigable by author, publisher, tag
+    and year, plus "All books" and "Recently added".
+
+    Every page is rendered ahead of time and kept until it changes.
+    refresh() reads the feed columns of the Book table, diffs them with
+    the previous refresh and only re-renders the pages whose content
+    changed: the facet pages of inserted, updated and deleted Books (with
+    their old and new values), the index pages whose counts moved and the
+    pages of "All books" the change shifted. Feed URLs live under `prefix`
+    (OPDS 2.0 under `prefix + "2"`).
+    """
+
+    def __init__(
+        self, con: sqlite3.Connection, *, prefix: str = "/opds",
+        title: str = "PDFShelf", page_size: int = 50, recent: int = 50
+    ) -> None:
+        self.con = con
+        self.prefix = prefix
+        self.title = title
+        self.page_size = page_size
+        self.recent = recent
+
+        self.pages: dict[str, FeedPage] = {}
+        self._rows: dict[int, tuple] = {}
+        self._members: dict[tuple[str, Any], set[int]] = {}
+        self._page_items: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get_page(self, path: str) -> FeedPage | None:
+        """Page for a feed path, relative to the prefix ("" is the root)."""
+        # Facet values are percent-encoded in page keys; clients may not
+        # encode them the same way we did.
+        key = "/".join(quote(unquote(part), safe="")
+                       for part in path.strip("/").split("/"))
+        return self.pages.get(key)
+
+    def refresh(self) -> int:
+        """Bring the pages up to date. Returns the number re-rendered."""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        res = self.con.execute(
+            f"SELECT {FEED_COLUMNS} FROM Book WHERE Book.active == 1"
+        )
+        rows = {row[0]: tuple(row) for row in res.fetchall()}
+
+        changed = {book_id for book_id in rows.keys() | self._rows.keys()
+                   if rows.get(book_id) != self._rows.get(book_id)}
+        if not changed and self.pages:
+            return 0
+
+        dirty: set[tuple[str, Any]] = set()
+        for book_id in changed:
+            old_values = self._facet_values(self._rows.get(book_id))
+            new_values = self._facet_values(rows.get(book_id))
+            dirty |= old_values | new_values
+            for key in old_values - new_values:
+                self._members[key].discard(book_id)
+                if not self._members[key]:
+                    del self._members[key]
+            for key in new_values - old_values:
+                self._members.setdefault(key, set()).add(book_id)
+        self._rows = rows
+
+        rendered = 0
+        if "" not in self.pages:
+            rendered += self._render_root()
+
+        by_title = sorted(rows, key=lambda i: ((rows[i][2] or "").lower(), i))
+        rendered += self._render_group("all", "All books", by_title, changed)
+        by_date = sorted(rows, key=lambda i: (rows[i][10] or "", i),
+                         reverse=True)
+        rendered += self._render_group("new", "Recently added",
+                                       by_date[:self.recent], changed,
+                                       paginate=False)
+
+        for facet in FACETS:
+            dirty_values = {value for key, value in dirty if key == facet}
+            if not dirty_values and f"{facet}s" in self.pages:
+                continue
+            rendered += self._render_index(facet)
+            for value in dirty_values:
+                members = self._members.get((facet, value), set())
+                ids = sorted(members,
+                             key=lambda i: ((rows[i][2] or "").lower(), i))
+                rendered += self._render_group(
+                    self._facet_path(facet, value), str(value), ids, changed
+                )
+
+        LOGGER.info("[OPDS] %s changed books, %s pages rendered.",
+                    len(changed), rendered)
+        return rendered
+
+    @staticmethod
+    def _facet_values(row: tuple | None) -> set[tuple[str, Any]]:
+        if row is None:
+            return set()
+        columns = {"authors": row[3], "year": row[4], "publisher": row[6],
+                   "tags": row[9]}
+        values = set()
+        for facet, (column, is_list) in FACETS.items():
+            value = columns[column]
+            if value in (None, ""):
+                continue
+            for item in (json.loads(value) if is_list else [value]):
+                values.add((facet, item))
+        return values
+
+    @staticmethod
+    def _facet_path(facet: str, value: Any) -> str:
+        return f"{facet}/{quote(str(value), safe='')}"
+
+    def _href(self, path: str, page: int = 1, version: int = 1) -> str:
+        prefix = self.prefix if version == 1 else f"{self.prefix}2"
+        href = f"{prefix}/{path}" if path else prefix
+        return href if page == 1 else f"{href}/{page}"
+
+    def _pages_of(self, items: list, paginate: bool = True) -> list[list]:
+        if not paginate:
+            return [items]
+        return [items[i:i + self.page_size]
+                for i in range(0, len(items), self.page_size)] or [[]]
+
+    def _store(self, key: str, page: FeedPage | None) -> None:
+        if page is None:
+            self.pages.pop(key, None)
+            self._page_items.pop(key, None)
+        else:
+            self.pages[key] = page
+
+    def _render_group(
+        self, path: str, title: str, ids: list[int], changed: set[int],
+        paginate: bool = True
+    ) -> int:
+        """Acquisition pages of a list of Books, re-rendering the changed."""
+        if not ids and path not in ("all", "new"):
+            self._drop_pages(path, 1)
+            return 0
+
+        pages = self._pages_of(ids, paginate)
+        rendered = 0
+        for n, page_ids in enumerate(pages, start=1):
+            key = path if n == 1 else f"{path}/{n}"
+            has_next = n < len(pages)
+            items = (tuple(page_ids), has_next)
+            if (self._page_items.get(key) == items
+                    and changed.isdisjoint(page_ids)):
+                continue
+            self._page_items[key] = items
+            self._store(key, self._render_page(
+                path, title, n, has_next,
+                publications=[self._rows[i] for i in page_ids]
+            ))
+            rendered += 1
+        self._drop_pages(path, len(pages) + 1)
+        return rendered
+
+    def _render_index(self, facet: str) -> int:
+        counts = sorted(
+            ((value, len(ids)) for (key, value), ids in self._members.items()
+             if key == facet),
+            key=lambda item: (str(item[0]).lower(), )
+        )
+        path = f"{facet}s"
+        pages = self._pages_of(counts)
+        rendered = 0
+        for n, page_counts in enumerate(pages, start=1):
+            key = path if n == 1 else f"{path}/{n}"
+            has_next = n < len(pages)
+            items = (tuple(page_counts), has_next)
+            if self._page_items.get(key) == items:
+                continue
+            self._page_items[key] = items
+            navigation = [(f"{value} ({count})",
+                           self._facet_path(facet, value), count)
+                          for value, count in page_counts]
+            self._store(key, self._render_page(
+                path, INDEX_TITLES[facet], n, has_next, navigation=navigation
+            ))
+            rendered += 1
+        self._drop_pages(path, len(pages) + 1)
+        return rendered
+
+    def _drop_pages(self, path: str, first: int) -> None:
+        n = first
+        while True:
+            key = path if n == 1 else f"{path}/{n}"
+            if key not in self.pages:
+                return
+            self._store(key, None)
+            n += 1
+
+    def _render_root(self) -> int:
+        navigation = [("All books", "all", None),
+                      ("Recently added", "new", None)]
+        navigation += [(title, f"{facet}s", None)
+                       for facet, title in INDEX_TITLES.items()]
+        self._store("", self._render_page("", self.title, 1, False,
+                                          navigation=navigation))
+        return 1
+
+    def _render_page(
+        self, path: str, title: str, n: int, has_next: bool,
+        navigation: list[tuple[str, str, int | None]] | None = None,
+        publications: list[tuple] | None = None
+    ) -> FeedPage:
+        atom = self._render_atom(path, title, n, has_next, navigation,
+                                 publications).encode()
+        data = self._render_json(path, title, n, has_next, navigation,
+                                 publications)
+        body = json.dumps(data).encode()
+        etag = hashlib.blake2b(atom + body, digest_size=16).hexdigest()
+        return FeedPage(
+            atom=atom, json=body, etag=f'"{etag}"',
+            atom_type=ATOM_NAVIGATION if navigation is not None
+            else ATOM_ACQUISITION
+        )
+
+    def _links(self, path: str, n: int, has_next: bool, version: int):
+        links = [("self", self._href(path, n, version)),
+                 ("start", self._href("", 1, version))]
+        if path:
+            links.append(("up", self._href("", 1, version)))
+        if n > 1:
+            links.append(("previous", self._href(path, n - 1, version)))
+        if has_next:
+            links.append(("next", self._href(path, n + 1, version)))
+        return links
+
+    def _render_atom(
+        self, path: str, title: str, n: int, has_next: bool,
+        navigation: list | None, publications: list | None
+    ) -> str:
+        kind = ATOM_NAVIGATION if navigation is not None else ATOM_ACQUISITION
+        updated = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom" '
+            'xmlns:dc="http://purl.org/dc/terms/" '
+            'xmlns:opds="http://opds-spec.org/2010/catalog">',
+            f"<id>urn:pdfshelf:{escape(path or 'root')}:{n}</id>",
+            f"<title>{escape(title)}</title>",
+            f"<updated>{updated}</updated>"
+        ]
+        for rel, href in self._links(path, n, has_next, 1):
+            link_type = kind if rel in ("self", "previous", "next") \
+                else ATOM_NAVIGATION
+            parts.append(f"<link rel={quoteattr(rel)} href={quoteattr(href)} "
+                         f"type={quoteattr(link_type)}/>")
+
+        for entry_title, entry_path, count in navigation or []:
+            href = self._href(entry_path)
+            entry_type = (ATOM_NAVIGATION if entry_path in INDEX_PATHS
+                          else ATOM_ACQUISITION)
+            parts.append(
+                f"<entry><title>{escape(entry_title)}</title>"
+                f"<id>urn:pdfshelf:{escape(entry_path)}</id>"
+                f"<updated>{updated}</updated>"
+                f"<link rel=\"subsection\" href={quoteattr(href)} "
+                f"type={quoteattr(entry_type)}/></entry>"
+            )
+        for row in publications or []:
+            parts.append(self._atom_entry(row))
+
+        parts.append("</feed>")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _atom_entry(row: tuple) -> str:
+        (book_id, hash_id, title, authors, year, lang, publisher, isbn13,
+         ext, tags, added_date, cover_path) = row
+        added = (added_date or "1970-01-01 00:00:00")[:19].replace(" ", "T")
+        parts = [
+            "<entry>",
+            f"<title>{escape(title or hash_id)}</title>",
+            f"<id>urn:pdfshelf:book:{hash_id}</id>",
+            f"<updated>{added}Z</updated>"
+        ]
+        for author in json.loads(authors or "[]"):
+            parts.append(f"<author><name>{escape(author)}</name></author>")
+        if publisher:
+            parts.append(f"<dc:publisher>{escape(publisher)}</dc:publisher>")
+        if year:
+            parts.append(f"<dc:issued>{year}</dc:issued>")
+        if lang:
+            parts.append(f"<dc:language>{escape(lang)}</dc:language>")
+        if isbn13:
+            parts.append(f"<dc:identifier>urn:isbn:{escape(isbn13)}"
+                         "</dc:identifier>")
+        for tag in json.loads(tags or "[]"):
+            parts.append(f"<category term={quoteattr(tag)} "
+                         f"label={quoteattr(tag)}/>")
+        if cover_path:
+            href = quoteattr(f"/covers/{quote(cover_path.rsplit('/', 1)[-1])}")
+            parts.append(f'<link rel="http://opds-spec.org/image" '
+                         f'href={href} type="image/jpeg"/>')
+            parts.append(f'<link rel="http://opds-spec.org/image/thumbnail" '
+                         f'href={href} type="image/jpeg"/>')
+        file_type = mimetypes.guess_type(f"book{ext}")[0]
+        parts.append(f'<link rel="http://opds-spec.org/acquisition" '
+                     f'href="/books/{book_id}/file" '
+                     f'type={quoteattr(file_type or "application/octet-stream")}/>')
+        parts.append("</entry>")
+        return "".join(parts)
+
+    def _render_json(
+        self, path: str, title: str, n: int, has_next: bool,
+        navigation: list | None, publications: list | None
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "metadata": {"title": title, "currentPage": n},
+            "links": [{"rel": rel, "href": href, "type": OPDS2_TYPE}
+                      for rel, href in self._links(path, n, has_next, 2)]
+        }
+        if navigation is not None:
+            data["navigation"] = [
+                {"title": entry_title, "href": self._href(entry_path,
+                                                          version=2),
+                 "type": OPDS2_TYPE,
+                 **({"properties": {"numberOfItems": count}}
+                    if count is not None else {})}
+                for entry_title, entry_path, count in navigation
+            ]
+        else:
+            data["metadata"]["itemsPerPage"] = self.page_size
+            data["publications"] = [self._json_publication(row)
+                                    for row in publications]
+        return data
+
+    @staticmethod
+    def _json_publication(row: tuple) -> dict[str, Any]:
+        (book_id, hash_id, title, authors, year, lang, publisher, isbn13,
+         ext, tags, added_date, cover_path) = row
+        metadata: dict[str, Any] = {
+            "@type": "http://schema.org/Book",
+            "title": title or hash_id,
+            "identifier": (f"urn:isbn:{isbn13}" if isbn13
+                           else f"urn:pdfshelf:book:{hash_id}"),
+            "author": json.loads(authors or "[]"),
+            "subject": json.loads(tags or "[]"),
+            "modified": added_date
+        }
+        if publisher:
+            metadata["publisher"] = publisher
+        if year:
+            metadata["published"] = str(year)
+        if lang:
+            metadata["language"] = lang
+
+        file_type = mimetypes.guess_type(f"book{ext}")[0]
+        publication = {
+            "metadata": metadata,
+            "links": [{"rel": "http://opds-spec.org/acquisition",
+                       "href": f"/books/{book_id}/file",
+                       "type": file_type or "application/octet-stream"}]
+        }
+        if cover_path:
+            href = f"/covers/{quote(cover_path.rsplit('/', 1)[-1])}"
+            publication["images"] = [{"href": href, "type": "image/jpeg"}]
+        return publication
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from .archive import ARCHIVE_FORMATS, expand_archives
+from .cover import BookCover
+from .domain import Book, ParseResult, ParseStatus
+from .database import BookDBHandler
+from .importer import BookImporter, FORMATS
+from .profiling import profiled
+from .scanner import DirectoryScanner, ScannedFile
+
+Connection = sqlite3.Connection
+ConnectFunc = Callable[[], Connection]
+
+# Marks the end of a stage's input.
+_DONE: Any = object()
+
+
+class ImportPipeline:
+    """
+    Async import pipeline: parse -> metadata -> cover -> database.
+
+    Stages are connected by bounded asyncio.Queues, so a slow stage
+    (usually the network) applies backpressure to the ones before it
+    instead of letting parsed books pile up in memory. ISBN parsing is
+    offloaded to `executor` (a ThreadPoolExecutor by default; pass a
+    ProcessPoolExecutor for CPU-bound collections). All database writes go
+    through a single writer task that owns its own connection, opened with
+    `connect` on a dedicated thread. Each batch of `write_batch_size`
+    Books is its own transaction, and a partial batch is committed after
+    `write_interval` seconds, so readers see a slow import progress.
+    `on_progress` is called with every Book once it is done (written,
+    when there is a database).
+    """
+
+    def __init__(
+        self, importer: BookImporter, bookcover: BookCover | None = None,
+        connect: ConnectFunc | None = None, *, parse_workers: int = 4,
+        fetch_workers: int = 8, queue_size: int = 64,
+        cover_batch_size: int = 20, write_batch_size: int = 100,
+        write_interval: float = 2.0, executor: Executor | None = None,
+        on_progress: Callable[[Book], None] | None = None
+    ) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.importer = importer
+        self.bookcover = bookcover
+        self.connect = connect
+        self.parse_workers = parse_workers
+        self.fetch_workers = fetch_workers
+        self.queue_size = queue_size
+        self.cover_batch_size = cover_batch_size
+        self.write_batch_size = write_batch_size
+        self.write_interval = write_interval
+        self.executor = executor
+        self.on_progress = on_progress
+
+    async def import_from_folder(
+        self, folderpath: Path, scanner: DirectoryScanner | None = None,
+        archives: bool = False
+    ) -> list[Book]:
+        """
+        Import every supported file under folderpath. With `archives`, the
+        books inside its ZIP/CBZ archives too.
+        """
+        if not folderpath.is_dir():
+            self.logger.error("Folder: %s does not exists.", folderpath)
+            raise FileNotFoundError("This directory does not exist.")
+
+        if scanner is None:
+            scanner = DirectoryScanner(
+                FORMATS | ARCHIVE_FORMATS if archives else FORMATS)
+
+        folder = {"name": folderpath.name, "path": folderpath}
+        files = scanner.scan(folderpath)
+        if archives:
+            files = expand_archives(files, FORMATS)
+        return await self.import_files(files, folder)
+
+    @profiled
+    async def import_files(
+        self, files: Iterable[ScannedFile], folder: dict
+    ) -> list[Book]:
+        """
+        Import the scanned files of a folder. Books are returned in the
+        order the files were given.
+        """
+        parse_q = asyncio.Queue(self.queue_size)
+        fetch_q = asyncio.Queue(self.queue_size)
+        cover_q = asyncio.Queue(self.queue_size)
+        write_q = asyncio.Queue(self.queue_size)
+        results: dict[int, Book] = {}
+
+        parsers = [asyncio.create_task(self._parse_stage(parse_q, fetch_q))
+                   for _ in range(self.parse_workers)]
+        fetchers = [asyncio.create_task(self._fetch_stage(fetch_q, cover_q))
+                    for _ in range(self.fetch_workers)]
+        tasks = [
+            asyncio.create_task(self._produce(files, folder, parse_q)),
+            *parsers,
+            *fetchers,
+            asyncio.create_task(self._cover_stage(cover_q, write_q)),
+            asyncio.create_task(self._write_stage(write_q, results)),
+            asyncio.create_task(self._close(parsers, fetch_q,
+                                            self.fetch_workers)),
+            asyncio.create_task(self._close(fetchers, cover_q, 1)),
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return [results[i] for i in sorted(results)]
+
+    async def _produce(
+        self, files: Iterable[ScannedFile], folder: dict,
+        parse_q: asyncio.Queue
+    ) -> None:
+        for i, scanned in enumerate(files):
+            await parse_q.put((i, scanned.path, folder, scanned.size))
+
+        for _ in range(self.parse_workers):
+            await parse_q.put(_DONE)
+
+    @staticmethod
+    async def _close(
+        workers: list[asyncio.Task], next_q: asyncio.Queue, consumers: int
+    ) -> None:
+        """Signal the next stage once every worker of this stage is done."""
+        await asyncio.gather(*workers)
+        for _ in range(consumers):
+            await next_q.put(_DONE)
+
+    async def _parse_stage(
+        self, parse_q: asyncio.Queue, fetch_q: asyncio.Queue
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while (item := await parse_q.get()) is not _DONE:
+            i, file, folder, size = item
+            result = await loop.run_in_executor(
+                self.executor, self.importer.parser.parse, file
+            )
+            ocr = self.importer.ocr
+            if result.status == ParseStatus.NO_TEXT and ocr is not None:
+                result = await ocr.async_parse(file)
+            self.importer.record_parse_result(result)
+            await fetch_q.put((i, file, folder, size, result))
+
+    async def _fetch_stage(
+        self, fetch_q: asyncio.Queue, cover_q: asyncio.Queue
+    ) -> None:
+        while (item := await fetch_q.get()) is not _DONE:
+            i, file, folder, size, result = item
+            try:
+                metadata, _ = await asyncio.to_thread(
+                    self.importer.fetch_metadata, result
+                )
+            except Exception as e:
+                # A dead stage would leave the bounded queues blocked: the
+                # book is kept without metadata, like a failed parse.
+                self.logger.error("[FETCH-FAILED] %s", file.name,
+                                  exc_info=True)
+                self.importer.failures.append(ParseResult(
+                    file=file, status=ParseStatus.ERROR,
+                    message=f"Metadata fetch failed: "
+                            f"{type(e).__name__}: {e}"
+                ))
+                metadata = {}
+            book = self.importer.build_book(file, folder, metadata, size)
+            await cover_q.put((i, book))
+
+    async def _cover_stage(
+        self, cover_q: asyncio.Queue, write_q: asyncio.Queue
+    ) -> None:
+        done = False
+        while not done:
+            batch = [await cover_q.get()]
+            while (len(batch) < self.cover_batch_size
+                   and not cover_q.empty()):
+                batch.append(cover_q.get_nowait())
+
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+
+            if self.bookcover is not None and batch:
+                books = await self.bookcover.async_get_cover_for_books(
+                    [book for _, book in batch]
+                )
+                batch = [(i, book) for (i, _), book in zip(batch, books)]
+
+            for item in batch:
+                await write_q.put(item)
+
+        await write_q.put(_DONE)
+
+    async def _write_stage(
+        self, write_q: asyncio.Queue, results: dict[int, Book]
+    ) -> None:
+        if self.connect is None:
+            while (item := await write_q.get()) is not _DONE:
+                i, book = item
+                results[i] = book
+                self._report(book)
+            return
+
+        loop = asyncio.get_running_loop()
+        # sqlite3 connections are bound to the thread that created them.
+        with ThreadPoolExecutor(max_workers=1) as db_thread:
+            con = await loop.run_in_executor(db_thread, self.connect)
+            handler = BookDBHandler(con)
+            try:
+                batch = []
+                deadline = 0.0
+                while True:
+                    timeout = None
+                    if batch:
+                        timeout = max(0.0, deadline - loop.time())
+                    try:
+                        item = await asyncio.wait_for(write_q.get(), timeout)
+                    except asyncio.TimeoutError:
+                        await self._flush(db_thread, handler, batch)
+                        batch = []
+                        continue
+                    if item is _DONE:
+                        break
+
+                    i, book = item
+                    results[i] = book
+                    if not batch:
+                        deadline = loop.time() + self.write_interval
+                    batch.append(book)
+                    if len(batch) >= self.write_batch_size:
+                        await self._flush(db_thread, handler, batch)
+                        batch = []
+
+                if batch:
+                    await self._flush(db_thread, handler, batch)
+            finally:
+                await loop.run_in_executor(db_thread, con.close)
+
+    async def _flush(
+        self, db_thread: Executor, handler: BookDBHandler, batch: list[Book]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(db_thread, handler.insert_books, batch)
+        for book in batch:
+            self._report(book)
+
+    def _report(self, book: Book) -> None:
+        if self.on_progress is not None:
+            self.on_progress(book)
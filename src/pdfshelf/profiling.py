@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import inspect
+import logging
+import functools
+import threading
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+from .config import get_config
+
+LOGGER = logging.getLogger(__name__)
+
+# Set to anything but "" or "0" to profile every @profiled call.
+ENV_VAR = "PDFSHELF_PROFILE"
+# Seconds between two samples of the thread stacks.
+INTERVAL = 0.005
+# Frames kept per traced allocation, and allocations reported.
+TRACE_FRAMES = 10
+TOP_ALLOCATIONS = 30
+TOP_FUNCTIONS = 40
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+# Held by the running profile: runs never nest or overlap.
+_running = threading.Lock()
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def default_report_folder() -> Path:
+    return get_config().config_folder / "profiles"
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stacks of every other thread at a fixed interval, so work
+    done in thread pools is seen too (cProfile only sees its own thread).
+    Counts collapsed stacks: "thread;outer (file:line);...;inner".
+    """
+
+    def __init__(self, interval: float) -> None:
+        super().__init__(name="pdfshelf-profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while not self._done.wait(self.interval):
+            names = {thread.ident: thread.name
+                     for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} "
+                                 f"({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def _report_path(folder: Path, name: str) -> Path:
+    base = folder / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}"
+    path, n = base, 0
+    while True:
+        try:
+            path.mkdir(parents=True)
+            return path
+        except FileExistsError:
+            n += 1
+            path = base.with_name(f"{base.name}-{n}")
+
+
+@contextmanager
+def profile_run(
+    name: str, folder: Path | None = None, interval: float = INTERVAL
+) -> Iterator[Path | None]:
+    """
+    Profile the block and write a report folder: cProfile stats of the
+    calling thread (profile.pstats, and profile.txt by cumulative time),
+    wall-clock samples of every thread as collapsed stacks for flamegraph
+    tools (stacks.collapsed) and the allocations made during the block
+    (allocations.txt, from tracemalloc). Yields the report folder, or
+    None inside another run, which profiles the block already.
+    """
+    if not _running.acquire(blocking=False):
+        yield None
+        return
+
+    # Only imported when profiling.
+    import cProfile
+    import tracemalloc
+
+    try:
+        report = _report_path(folder or default_report_folder(), name)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+        sampler = _Sampler(interval)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+            _write_report(report, name, elapsed, profiler, sampler,
+                          before, after, peak)
+    finally:
+        _running.release()
+
+
+def _write_report(
+    report: Path, name: str, elapsed: float, profiler: Any,
+    sampler: _Sampler, before: Any, after: Any, peak: int
+) -> None:
+    import pstats
+    import tracemalloc
+
+    profiler.dump_stats(report / "profile.pstats")
+    with open(report / "profile.txt", "w") as file:
+        file.write(f"{name}: {elapsed:.3f}s wall clock, "
+                   f"{sampler.samples} samples\n")
+        stats = pstats.Stats(profiler, stream=file)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    with open(report / "stacks.collapsed", "w") as file:
+        for stack, count in sampler.stacks.most_common():
+            file.write(f"{stack} {count}\n")
+
+    ignored = (tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, __file__))
+    differences = after.filter_traces(ignored).compare_to(
+        before.filter_traces(ignored), "lineno")
+    with open(report / "allocations.txt", "w") as file:
+        file.write(f"{name}: peak traced memory {peak / 1024 ** 2:.1f} MiB"
+                   "\n")
+        for difference in differences[:TOP_ALLOCATIONS]:
+            file.write(f"{difference}\n")
+
+    LOGGER.info("[PROFILE] %s took %.3fs, report in %s", name, elapsed,
+                report)
+
+
+def profiled(func: F) -> F:
+    """
+    Profile each call (see profile_run) while profiling is enabled, by
+    PDFSHELF_PROFILE or enable(). Disabled, a call costs one flag check.
+    """
+    # Used in the report folder name, so without "<" and ">".
+    name = func.__qualname__.replace(".<locals>", "")
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not _enabled:
+                return await func(*args, **kwargs)
+            with profile_run(name):
+                return await func(*args, **kwargs)
+
+        return async_wrapper  # type: ignore[return-value]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        with profile_run(name):
+            return func(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
@@ -0,0 +1,262 @@
+import re
+import abc
+import json
+import sqlite3
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+Connection = sqlite3.Connection
+
+# Field -> SQL column. Queries join Book with Folder.
+COLUMNS = {
+    "book_id": "Book.book_id", "title": "Book.title", "year": "Book.year",
+    "lang": "Book.lang", "filename": "Book.filename", "ext": "Book.ext",
+    "storage_path": "Book.storage_path", "folder_id": "Book.folder_id",
+    "size": "Book.size", "added_date": "Book.added_date",
+    "hash_id": "Book.hash_id", "publisher": "Book.publisher",
+    "isbn13": "Book.isbn13", "parsed_isbn": "Book.parsed_isbn",
+    "active": "Book.active", "confirmed": "Book.confirmed",
+    "cover_path": "Book.cover_path", "authors": "Book.authors",
+    "tags": "Book.tags", "folder": "Folder.name", "folder_path": "Folder.path"
+}
+# Fields filtered through another table: (table, column, key). author and
+# tag are JSON lists, indexed one value per row in their lookup table.
+LOOKUPS = {"author": ("BookAuthor", "author", "book_id"),
+           "tag": ("BookTag", "tag", "book_id"),
+           "folder": ("Folder", "name", "folder_id")}
+# Filterable fields; =, IN, ranges and IS NULL on them use an index.
+FILTERS = ("book_id", "title", "year", "lang", "ext", "folder_id", "size",
+           "added_date", "hash_id", "publisher", "isbn13", "active",
+           "confirmed", "cover_path", "folder", "author", "tag")
+SORTS = ("book_id", "title", "year", "lang", "ext", "size", "added_date",
+         "publisher", "folder")
+NULLABLE = {"title", "year", "lang", "publisher", "isbn13", "cover_path"}
+
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=", "in", "not in", "between",
+             "contains", "is null", "is not null")
+
+
+class Expression(abc.ABC):
+    """A compiled-on-demand WHERE clause. Combine with &, | and ~."""
+
+    @abc.abstractmethod
+    def compile(self) -> tuple[str, list[Any]]:
+        ...
+
+    def __and__(self, other: "Expression") -> "Expression":
+        return Group("AND", (self, other))
+
+    def __or__(self, other: "Expression") -> "Expression":
+        return Group("OR", (self, other))
+
+    def __invert__(self) -> "Expression":
+        return Not(self)
+
+
+@dataclass(frozen=True)
+class Group(Expression):
+    op: str
+    parts: tuple[Expression, ...]
+
+    def compile(self) -> tuple[str, list[Any]]:
+        sql, params = [], []
+        for part in self.parts:
+            part_sql, part_params = part.compile()
+            sql.append(part_sql)
+            params.extend(part_params)
+        return "(" + f" {self.op} ".join(sql) + ")", params
+
+
+@dataclass(frozen=True)
+class Not(Expression):
+    part: Expression
+
+    def compile(self) -> tuple[str, list[Any]]:
+        sql, params = self.part.compile()
+        return f"NOT {sql}", params
+
+
+def _like(text: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", text) + "%"
+
+
+@dataclass(frozen=True)
+class Condition(Expression):
+    field: str
+    op: str
+    value: Any = None
+
+    def __post_init__(self) -> None:
+        if self.field not in FILTERS:
+            raise ValueError(f"Can not filter by {self.field!r}.")
+        if self.op not in OPERATORS:
+            raise ValueError(f"Unknown operator {self.op!r}.")
+        if self.op.endswith("null") and self.field not in NULLABLE:
+            raise ValueError(f"{self.field!r} is never null.")
+
+    def compile(self) -> tuple[str, list[Any]]:
+        if self.field in LOOKUPS:
+            table, column, key = LOOKUPS[self.field]
+            # A Book matches when any of its authors (tags) matches. A
+            # subquery rather than the join, so it can lead the plan.
+            sql, params = self._compare(column)
+            return (f"Book.{key} IN (SELECT {key} FROM {table} "
+                    f"WHERE {sql})"), params
+        return self._compare(COLUMNS[self.field])
+
+    def _compare(self, column: str) -> tuple[str, list[Any]]:
+        op, value = self.op, self.value
+        if op in ("is null", "is not null"):
+            return f"{column} {op.upper()}", []
+        if op in ("in", "not in"):
+            # One statement whatever the number of values.
+            return (f"{column} {op.upper()} "
+                    "(SELECT value FROM json_each(?))"), [json.dumps(value)]
+        if op == "between":
+            return f"{column} BETWEEN ? AND ?", list(value)
+        if op == "contains":
+            return f"{column} LIKE ? ESCAPE '\\'", [_like(value)]
+        return f"{column} {op} ?", [value]
+
+
+class F:
+    """
+    A filterable field: F("year") > 2010, F("ext").in_([".pdf"]),
+    F("author") == "Plato". author and tag match any value of the list.
+    """
+
+    def __init__(self, name: str) -> None:
+        if name not in FILTERS:
+            raise ValueError(f"Can not filter by {name!r}.")
+        self.name = name
+
+    def __eq__(self, value: Any) -> Condition:  # type: ignore[override]
+        if value is None:
+            return Condition(self.name, "is null")
+        return Condition(self.name, "=", value)
+
+    def __ne__(self, value: Any) -> Condition:  # type: ignore[override]
+        if value is None:
+            return Condition(self.name, "is not null")
+        return Condition(self.name, "!=", value)
+
+    def __lt__(self, value: Any) -> Condition:
+        return Condition(self.name, "<", value)
+
+    def __le__(self, value: Any) -> Condition:
+        return Condition(self.name, "<=", value)
+
+    def __gt__(self, value: Any) -> Condition:
+        return Condition(self.name, ">", value)
+
+    def __ge__(self, value: Any) -> Condition:
+        return Condition(self.name, ">=", value)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def in_(self, values: Iterable[Any]) -> Condition:
+        return Condition(self.name, "in", list(values))
+
+    def not_in(self, values: Iterable[Any]) -> Condition:
+        return Condition(self.name, "not in", list(values))
+
+    def between(self, low: Any, high: Any) -> Condition:
+        return Condition(self.name, "between", (low, high))
+
+    def contains(self, text: str) -> Condition:
+        """Substring match; unlike the other operators, not indexed."""
+        return Condition(self.name, "contains", text)
+
+
+@dataclass(kw_only=True, frozen=True)
+class BookQuery:
+    """
+    A query on Book (joined with its Folder), built step by step and
+    compiled to one parameterized statement. Values are always parameters
+    and IN lists are one JSON parameter, so a query shape always compiles
+    to the same SQL and hits the connection's prepared statement cache.
+
+        BookQuery().where(F("author") == "Plato", F("year") > 2010)
+                   .order_by("-year", "title").select("title", "year")
+    """
+
+    condition: Expression | None = None
+    ordering: tuple[str, ...] = ()
+    columns: tuple[str, ...] = ()
+    limit: int | None = None
+    offset: int = 0
+
+    def where(self, *conditions: Expression) -> "BookQuery":
+        """AND the conditions with the ones already set."""
+        if not conditions:
+            return self
+        parts = (self.condition, *conditions) if self.condition else conditions
+        condition = parts[0] if len(parts) == 1 else Group("AND", parts)
+        return dataclasses.replace(self, condition=condition)
+
+    def order_by(self, *fields: str) -> "BookQuery":
+        """Sort by fields, in order; a leading '-' sorts descending."""
+        for field in fields:
+            if field.lstrip("-") not in SORTS:
+                raise ValueError(f"Can not sort by {field!r}.")
+        return dataclasses.replace(self, ordering=self.ordering + fields)
+
+    def select(self, *fields: str) -> "BookQuery":
+        """Only load these fields (rows become dicts instead of Books)."""
+        for field in fields:
+            if field not in COLUMNS:
+                raise ValueError(f"Unknown field {field!r}.")
+        return dataclasses.replace(self, columns=fields)
+
+    def page(self, limit: int, offset: int = 0) -> "BookQuery":
+        return dataclasses.replace(self, limit=limit, offset=offset)
+
+    def _where(self) -> tuple[str, list[Any]]:
+        if self.condition is None:
+            return "", []
+        sql, params = self.condition.compile()
+        return f" WHERE {sql}", params
+
+    def compile(self) -> tuple[str, list[Any]]:
+        if self.columns:
+            projection = ", ".join(f"{COLUMNS[field]} AS {field}"
+                                   for field in self.columns)
+        else:
+            projection = "*"
+        where, params = self._where()
+        sql = (f"SELECT {projection} FROM Book "
+               "LEFT JOIN Folder ON Book.folder_id = Folder.folder_id"
+               + where)
+
+        if self.ordering:
+            terms = []
+            for field in self.ordering:
+                name = field.lstrip("-")
+                term = COLUMNS[name] + (" DESC" if field[0] == "-" else "")
+                if name in NULLABLE:
+                    term += " NULLS LAST"
+                terms.append(term)
+            sql += " ORDER BY " + ", ".join(terms)
+        if self.limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [self.limit, self.offset]
+        return sql, params
+
+    def compile_count(self) -> tuple[str, list[Any]]:
+        where, params = self._where()
+        return (f"SELECT count(*) FROM Book LEFT JOIN Folder "
+                f"ON Book.folder_id = Folder.folder_id{where}"), params
+
+
+def query_plan(con: Connection, query: BookQuery) -> list[str]:
+    """The EXPLAIN QUERY PLAN details of a query."""
+    sql, params = query.compile()
+    return [row[3] for row in
+            con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def uses_index(con: Connection, query: BookQuery) -> bool:
+    """Whether the query finds its Books without scanning Book."""
+    return not any(re.match(r"SCAN (Book|BookAuthor|BookTag)\b", detail)
+                   for detail in query_plan(con, query))
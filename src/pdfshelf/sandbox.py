@@ -0,0 +1,191 @@
+import copy
+import queue
+import logging
+import multiprocessing
+from pathlib import Path
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from .domain import ParseResult, ParseStatus
+from .importer import ISBNParser, ParserFunc
+
+try:
+    import resource
+except ImportError:  # Windows: no memory limits.
+    resource = None
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUTS = {".pdf": 60.0, ".epub": 30.0}
+# Storing the full text reads every page, so it gets its own budget.
+DEFAULT_TEXT_TIMEOUTS = {".pdf": 600.0, ".epub": 120.0}
+
+
+def _worker_main(
+    conn: Connection, parser: ISBNParser, memory_limit: int | None
+) -> None:
+    """
+    Handle the (command, path) requests sent through conn until None is
+    received: "parse" only looks for the ISBN, "text" fills the TextStore.
+    """
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    isbn_parser = copy.copy(parser)
+    isbn_parser.text_store = None
+    while (request := conn.recv()) is not None:
+        command, filepath = request
+        if command == "parse":
+            conn.send(isbn_parser.parse(filepath))
+        else:
+            conn.send(parser.store_text(filepath))
+
+
+class _Worker:
+    def __init__(self, context: BaseContext, parser: ISBNParser,
+                 memory_limit: int | None) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, parser, memory_limit),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SandboxedISBNParser:
+    """
+    Runs an ISBNParser in isolated worker processes, so a malformed file
+    that hangs pypdf or eats all memory only costs its own worker.
+
+    Each file gets a wall-clock timeout chosen by its format (`timeouts`)
+    and each worker runs under an address-space limit (`memory_limit`, in
+    bytes, POSIX only). A worker that times out or dies is killed and
+    replaced on the next request. Failures come back as ParseResults
+    instead of exceptions.
+
+    When the parser has a TextStore, the full text is stored after the
+    ISBN is parsed, under its own timeout (`text_timeouts`): a book that
+    takes long to extract keeps its ParseResult, only its text is missing.
+
+    Thread-safe: up to `workers` files are parsed at the same time, one
+    per calling thread (e.g. the ImportPipeline parse stage).
+    """
+
+    def __init__(
+        self, parser: ISBNParser | None = None, *, workers: int = 4,
+        timeouts: dict[str, float] | None = None,
+        text_timeouts: dict[str, float] | None = None,
+        memory_limit: int | None = 1024 ** 3,
+        mp_context: BaseContext | None = None
+    ) -> None:
+        self.parser = ISBNParser() if parser is None else parser
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.text_timeouts = {**DEFAULT_TEXT_TIMEOUTS,
+                              **(text_timeouts or {})}
+        self.memory_limit = memory_limit
+        if mp_context is None:
+            mp_context = multiprocessing.get_context("spawn")
+        self.context = mp_context
+
+        # Idle workers, or None for a slot whose worker is not started yet.
+        self._idle: queue.Queue[_Worker | None] = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(None)
+        self._workers = workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def get_format_parser(self, fileformat: str) -> ParserFunc:
+        self.parser.get_format_parser(fileformat)
+
+        def parse_function(filepath: Path) -> tuple[str, str]:
+            result = self.parse(filepath)
+            return result.isbn10, result.isbn13
+
+        return parse_function
+
+    def parse(self, filepath: Path) -> ParseResult:
+        # Raises FormatNotSupportedError in the caller, like ISBNParser.
+        self.parser.get_format_parser(filepath.suffix)
+        timeout = self.timeouts.get(filepath.suffix)
+
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                worker = _Worker(self.context, self.parser, self.memory_limit)
+
+            worker.conn.send(("parse", filepath))
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                worker = None
+                LOGGER.error("[PARSE-TIMEOUT] %s took more than %s seconds.",
+                             filepath.name, timeout)
+                return ParseResult(
+                    file=filepath, status=ParseStatus.TIMEOUT,
+                    message=f"No result after {timeout} seconds."
+                )
+
+            result = worker.conn.recv()
+            if (self.parser.text_store is not None and result.status
+                    in (ParseStatus.OK, ParseStatus.NO_ISBN)):
+                worker = self._store_text(worker, filepath)
+            return result
+        except (EOFError, OSError):
+            exitcode = None
+            if worker is not None:
+                worker.kill()
+                exitcode = worker.process.exitcode
+                worker = None
+            LOGGER.error("[PARSE-CRASHED] Worker died parsing %s (exit code "
+                         "%s).", filepath.name, exitcode)
+            return ParseResult(
+                file=filepath, status=ParseStatus.CRASHED,
+                message=f"Worker exited with code {exitcode}."
+            )
+        finally:
+            self._idle.put(worker)
+
+    def _store_text(self, worker: _Worker, filepath: Path) -> _Worker | None:
+        """Store the text of filepath; the worker, or None if it was killed."""
+        timeout = self.text_timeouts.get(filepath.suffix)
+        try:
+            worker.conn.send(("text", filepath))
+            if worker.conn.poll(timeout):
+                worker.conn.recv()
+                return worker
+            LOGGER.warning("[TEXT-TIMEOUT] Storing the text of %s took more "
+                           "than %s seconds.", filepath.name, timeout)
+        except (EOFError, OSError):
+            LOGGER.warning("[TEXT-CRASHED] Worker died storing the text of "
+                           "%s.", filepath.name)
+        worker.kill()
+        return None
+
+    def close(self) -> None:
+        """Stop every started worker."""
+        for _ in range(self._workers):
+            worker = self._idle.get()
+            if worker is not None:
+                worker.stop()
+        for _ in range(self._workers):
+            self._idle.put(None)
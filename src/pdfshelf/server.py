@@ -0,0 +1,559 @@
+import json
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import mimetypes
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit, parse_qsl, unquote, urlencode
+from .archive import file_size, open_member, split_member
+from .config import get_config
+from .database import DatabaseConnector, BookDBHandler
+from .domain import Book
+from .opds import OPDSCatalog, OPDS2_TYPE
+
+LOGGER = logging.getLogger(__name__)
+
+JSON_TYPE = "application/json; charset=utf-8"
+COVER_MAX_AGE = 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = "") -> None:
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def book_to_json(book: Book) -> dict[str, Any]:
+    """JSON-ready view of a Book, with a server URL for its cover."""
+    cover_filename = book.get_cover_filename()
+    return {
+        "book_id": book.book_id,
+        "hash_id": book.hash_id,
+        "title": book.title,
+        "authors": book.authors,
+        "year": book.year,
+        "lang": book.lang,
+        "publisher": book.publisher,
+        "isbn13": book.isbn13,
+        "parsed_isbn": book.parsed_isbn,
+        "folder": book.folder.name,
+        "filename": book.filename,
+        "ext": book.ext,
+        "storage_path": str(book.storage_path),
+        "size": book.size,
+        "tags": book.tags,
+        "added_date": book.added_date.isoformat(),
+        "active": book.active,
+        "confirmed": book.confirmed,
+        "cover": f"/covers/{cover_filename}" if cover_filename else None
+    }
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match.
+    return any(tag.strip().removeprefix("W/") == etag
+               for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """LRU cache of rendered JSON bodies, keyed by normalized request URL."""
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, body: bytes) -> tuple[str, bytes]:
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self._entries[key] = (etag, body)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return etag, body
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CatalogServer:
+    """
+    Read-only HTTP/1.1 catalog of the Book table, on asyncio streams.
+
+        GET /books?limit=&offset=&sort=&filter=&value=   paginated listing
+        GET /books?q=text&limit=&offset=                 search
+        GET /books/<book_id>
+        GET /books/<book_id>/file
+        GET /covers/<filename>
+        GET /opds, /opds2                                OPDS 1.2 and 2.0
+
+    Queries run on `readers` threads, each with its own read-only
+    connection. Rendered JSON is cached with an ETag (If-None-Match gets a
+    304) until the database changes: any commit, by this process or
+    another, bumps sqlite's `PRAGMA data_version`, which is checked before
+    every cached read; the same check marks the OPDS catalog for an
+    incremental refresh. Covers and book files are sent with
+    loop.sendfile, zero-copy where the platform allows it; books inside
+    archives are streamed from the archive in chunks.
+    """
+
+    def __init__(
+        self, db_path: Path | None = None, cover_folder: Path | None = None,
+        *, host: str = "127.0.0.1", port: int = 8080, readers: int = 4,
+        cache_size: int = 256, page_size: int = 50, max_page_size: int = 500,
+        opds: bool = True
+    ) -> None:
+        self.db_path = db_path
+        self.cover_folder = cover_folder
+        self.host = host
+        self.port = port
+        self.readers = readers
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.cache = ResponseCache(cache_size)
+        self.opds: OPDSCatalog | None = None
+        self._opds_enabled = opds
+        self._opds_stale = True
+        self._opds_lock = asyncio.Lock()
+
+        self._server: asyncio.AbstractServer | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._watch: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+
+    async def start(self) -> None:
+        if self.db_path is None:
+            self.db_path = DatabaseConnector.get_db_path()
+        if self.cover_folder is None:
+            self.cover_folder = get_config().cover_folder
+        # Read-only connections can not create the schema.
+        with DatabaseConnector():
+            pass
+
+        self._watch = self._connect()
+        self._data_version = self._get_data_version()
+        if self._opds_enabled:
+            con = self._connect()
+            self._readers.append(con)
+            self.opds = OPDSCatalog(con, page_size=self.page_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.readers,
+                                            thread_name_prefix="catalog")
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        LOGGER.info("[SERVER] Serving on http://%s:%s", self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for con in self._readers:
+            con.close()
+        self._readers.clear()
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+
+    def invalidate(self) -> None:
+        """Drop every cached response."""
+        self.cache.clear()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Closed by close() from the event loop thread.
+        return DatabaseConnector.connect_readonly(self.db_path,
+                                                  check_same_thread=False)
+
+    def _get_handler(self) -> BookDBHandler:
+        # One connection per reader thread.
+        handler = getattr(self._local, "handler", None)
+        if handler is None:
+            con = self._connect()
+            self._readers.append(con)
+            handler = BookDBHandler(con)
+            self._local.handler = handler
+        return handler
+
+    def _get_data_version(self) -> int:
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_data_version(self) -> None:
+        version = self._get_data_version()
+        if version != self._data_version:
+            LOGGER.debug("[SERVER] Database changed, %s cached responses "
+                         "dropped.", len(self.cache))
+            self._data_version = version
+            self._opds_stale = True
+            self.invalidate()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                try:
+                    method, target, version, headers = self._parse_head(head)
+                except ValueError:
+                    await self._send(writer, HTTPStatus.BAD_REQUEST,
+                                     keep_alive=False)
+                    break
+
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection") != "close")
+                await self._dispatch(writer, method, target, headers,
+                                     keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> tuple[str, str, str, dict[str, str]]:
+        request_line, *lines = head.decode("latin-1").split("\r\n")
+        method, target, version = request_line.split(" ")
+        headers = {}
+        for line in lines:
+            if line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def _dispatch(
+        self, writer: asyncio.StreamWriter, method: str, target: str,
+        headers: dict[str, str], keep_alive: bool
+    ) -> None:
+        head_only = method == "HEAD"
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+            url = urlsplit(target)
+            if url.path.startswith("/covers/"):
+                await self._send_cover(writer,
+                                       unquote(url.path[len("/covers/"):]),
+                                       headers, keep_alive, head_only)
+                return
+            if url.path.startswith("/books/") and url.path.endswith("/file"):
+                await self._send_book_file(writer, url.path, headers,
+                                           keep_alive, head_only)
+                return
+            if self.opds is not None and url.path.startswith("/opds"):
+                await self._send_opds(writer, url.path, headers, keep_alive,
+                                      head_only)
+                return
+
+            etag, body = await self._get_json(url.path, url.query)
+        except HTTPError as e:
+            body = json.dumps({"error": str(e)}).encode()
+            await self._send(writer, e.status, {"Content-Type": JSON_TYPE},
+                             body, keep_alive, head_only)
+            return
+        except Exception:
+            LOGGER.exception("[SERVER] %s %s failed", method, target)
+            await self._send(writer, HTTPStatus.INTERNAL_SERVER_ERROR,
+                             keep_alive=keep_alive)
+            return
+
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(etag, headers.get("if-none-match")):
+            await self._send(writer, HTTPStatus.NOT_MODIFIED,
+                             response_headers, keep_alive=keep_alive)
+            return
+
+        response_headers["Content-Type"] = JSON_TYPE
+        await self._send(writer, HTTPStatus.OK, response_headers, body,
+                         keep_alive, head_only)
+
+    async def _get_json(self, path: str, query: str) -> tuple[str, bytes]:
+        params = dict(parse_qsl(query))
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+
+        self._check_data_version()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        if path == "/books":
+            data = await loop.run_in_executor(self._executor,
+                                              self._list_books, params)
+        elif path.startswith("/books/"):
+            try:
+                book_id = int(path[len("/books/"):])
+            except ValueError:
+                raise HTTPError(HTTPStatus.NOT_FOUND)
+            data = await loop.run_in_executor(self._executor,
+                                              self._get_book, book_id)
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        return self.cache.put(key, json.dumps(data).encode())
+
+    def _list_books(self, params: dict[str, str]) -> dict[str, Any]:
+        try:
+            limit = min(int(params.get("limit", self.page_size)),
+                        self.max_page_size)
+            offset = int(params.get("offset", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid limit or offset.")
+        if limit < 1 or offset < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid limit or offset.")
+
+        handler = self._get_handler()
+        sorting_key = params.get("sort", "no_sorting")
+        filter_key = params.get("filter", "no_filter")
+        if sorting_key not in handler.SORTING:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid sort.")
+        if filter_key not in handler.FILTERING:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid filter.")
+
+        # One extra row tells whether there is a next page.
+        if "q" in params:
+            total = None
+            books = handler.search_books(params["q"], limit + 1, offset)
+        else:
+            value = params.get("value", "")
+            total = handler.count_books(filter_key, value)
+            books = handler.load_books(sorting_key, filter_key, value,
+                                       limit + 1, offset)
+
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next": offset + limit if len(books) > limit else None,
+            "books": [book_to_json(book) for book in books[:limit]]
+        }
+
+    def _get_book(self, book_id: int) -> dict[str, Any]:
+        return book_to_json(self._load_book(book_id))
+
+    async def _send_cover(
+        self, writer: asyncio.StreamWriter, filename: str,
+        headers: dict[str, str], keep_alive: bool, head_only: bool
+    ) -> None:
+        # A bare file name only: no separators, no "..", no hidden files.
+        if Path(filename).name != filename or filename.startswith("."):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        await self._send_file(writer, self.cover_folder / filename, headers,
+                              keep_alive, head_only,
+                              f"public, max-age={COVER_MAX_AGE}")
+
+    async def _send_book_file(
+        self, writer: asyncio.StreamWriter, path: str,
+        headers: dict[str, str], keep_alive: bool, head_only: bool
+    ) -> None:
+        try:
+            book_id = int(path[len("/books/"):-len("/file")])
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        self._check_data_version()
+        loop = asyncio.get_running_loop()
+        book = await loop.run_in_executor(self._executor, self._load_book,
+                                          book_id)
+        path = book.get_full_path()
+        split = await asyncio.to_thread(split_member, path)
+        if split is None:
+            await self._send_file(writer, path, headers, keep_alive,
+                                  head_only, "no-cache")
+        else:
+            await self._send_member(writer, path, split[0], headers,
+                                    keep_alive, head_only)
+
+    def _load_book(self, book_id: int) -> Book:
+        try:
+            return self._get_handler().load_book_by_id(book_id)
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Book not found.")
+
+    async def _send_opds(
+        self, writer: asyncio.StreamWriter, path: str,
+        headers: dict[str, str], keep_alive: bool, head_only: bool
+    ) -> None:
+        if path == "/opds2" or path.startswith("/opds2/"):
+            version, path = 2, path[len("/opds2"):]
+        elif path == "/opds" or path.startswith("/opds/"):
+            version, path = 1, path[len("/opds"):]
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        self._check_data_version()
+        # Requests arriving during a refresh wait for it instead of
+        # starting their own.
+        async with self._opds_lock:
+            if self._opds_stale:
+                self._opds_stale = False
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(self._executor,
+                                               self.opds.refresh)
+                except Exception:
+                    self._opds_stale = True
+                    raise
+
+        page = self.opds.get_page(path)
+        if page is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        response_headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+        if etag_matches(page.etag, headers.get("if-none-match")):
+            await self._send(writer, HTTPStatus.NOT_MODIFIED,
+                             response_headers, keep_alive=keep_alive)
+            return
+
+        if version == 1:
+            response_headers["Content-Type"] = page.atom_type
+            body = page.atom
+        else:
+            response_headers["Content-Type"] = OPDS2_TYPE
+            body = page.json
+        await self._send(writer, HTTPStatus.OK, response_headers, body,
+                         keep_alive, head_only)
+
+    async def _send_file(
+        self, writer: asyncio.StreamWriter, path: Path,
+        headers: dict[str, str], keep_alive: bool, head_only: bool,
+        cache_control: str
+    ) -> None:
+        # Off the event loop: a slow or network-mounted library would
+        # stall every connection.
+        try:
+            stat = await asyncio.to_thread(path.stat)
+        except OSError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        send_body = await self._send_file_head(
+            writer, path.name, stat.st_mtime_ns, stat.st_size, headers,
+            keep_alive, head_only, cache_control
+        )
+        if not send_body:
+            return
+
+        loop = asyncio.get_running_loop()
+        file = await asyncio.to_thread(open, path, "rb")
+        try:
+            await loop.sendfile(writer.transport, file, count=stat.st_size)
+        finally:
+            await asyncio.to_thread(file.close)
+
+    async def _send_member(
+        self, writer: asyncio.StreamWriter, path: Path, archive: Path,
+        headers: dict[str, str], keep_alive: bool, head_only: bool
+    ) -> None:
+        """
+        A book inside an archive has no file to sendfile: it is read in
+        chunks. The ETag follows the archive's mtime.
+        """
+        try:
+            stat = await asyncio.to_thread(archive.stat)
+            size = await asyncio.to_thread(file_size, path)
+        except OSError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        send_body = await self._send_file_head(
+            writer, path.name, stat.st_mtime_ns, size, headers, keep_alive,
+            head_only, "no-cache"
+        )
+        if not send_body:
+            return
+
+        member = open_member(path)
+        file = await asyncio.to_thread(member.__enter__)
+        try:
+            while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            await asyncio.to_thread(member.__exit__, None, None, None)
+
+    async def _send_file_head(
+        self, writer: asyncio.StreamWriter, name: str, mtime_ns: int,
+        size: int, headers: dict[str, str], keep_alive: bool,
+        head_only: bool, cache_control: str
+    ) -> bool:
+        """Send the headers of a file; whether its body should follow."""
+        etag = f'"{mtime_ns:x}-{size:x}"'
+        response_headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(mtime_ns / 1e9, usegmt=True),
+            "Cache-Control": cache_control
+        }
+        if etag_matches(etag, headers.get("if-none-match")):
+            await self._send(writer, HTTPStatus.NOT_MODIFIED,
+                             response_headers, keep_alive=keep_alive)
+            return False
+
+        content_type = mimetypes.guess_type(name)[0]
+        response_headers["Content-Type"] = (content_type
+                                            or "application/octet-stream")
+        response_headers["Content-Length"] = str(size)
+        await self._send(writer, HTTPStatus.OK, response_headers,
+                         keep_alive=keep_alive, head_only=True)
+        return not head_only
+
+    @staticmethod
+    async def _send(
+        writer: asyncio.StreamWriter, status: HTTPStatus,
+        headers: dict[str, str] | None = None, body: bytes = b"",
+        keep_alive: bool = True, head_only: bool = False
+    ) -> None:
+        headers = {} if headers is None else dict(headers)
+        headers.setdefault("Content-Length", str(len(body)))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        lines += [f"{key}: {value}" for key, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body and not head_only:
+            writer.write(body)
+        await writer.drain()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, **kwargs) -> None:
+    """Run a CatalogServer until interrupted."""
+    server = CatalogServer(host=host, port=port, **kwargs)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,165 @@
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+from typing import Iterable, TypeVar
+from .database import StatsDBHandler
+from .scanner import ScannedFile
+
+LOGGER = logging.getLogger(__name__)
+
+Connection = sqlite3.Connection
+T = TypeVar("T", Path, ScannedFile)
+
+
+def shard_of(path: Path, root: Path, shards: int) -> int:
+    """
+    Shard (0 to shards - 1) of a file, from a hash of its path relative
+    to the imported folder: the same on every machine and every run,
+    wherever the folder is mounted.
+    """
+    name = path.relative_to(root).as_posix().encode()
+    digest = hashlib.blake2b(name, digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def select_shard(
+    files: Iterable[T], root: Path, index: int, shards: int
+) -> list[T]:
+    """The files (paths or ScannedFiles) of shard `index` of `shards`."""
+    if not 0 <= index < shards:
+        raise ValueError(f"Shard {index} is not in 0 to {shards - 1}.")
+    return [file for file in files
+            if shard_of(getattr(file, "path", file), root, shards) == index]
+
+
+def default_shard_path(folder: Path, index: int, shards: int) -> Path:
+    return folder / f"shard-{index}-of-{shards}.db"
+
+
+def _columns(con: Connection, table: str, schema: str = "main") -> list[str]:
+    return [row[1] for row in con.execute(f"PRAGMA {schema}.table_info"
+                                          f"({table})")]
+
+
+def merge_shard(con: Connection, path: Path) -> dict[str, int]:
+    """
+    Merge a shard database (a library written by one worker of a sharded
+    import) into the library of `con`, in one transaction, with a few
+    INSERT ... SELECT over the attached shard instead of a Book at a time.
+
+    Folders are matched by name or path, and new ones added. Shard Books
+    get ids after the last Book of the library; those whose hash_id or
+    ISBN-13 is already there go to Duplicate, as on a regular import,
+    and so do the shard's own Duplicates, pointing at the merged Books.
+    Returns the rows added per table.
+    """
+    if not path.is_file():
+        raise FileNotFoundError(f"No shard at {path}.")
+    # ATTACH is not allowed inside a transaction.
+    if con.in_transaction:
+        con.commit()
+
+    cur = con.cursor()
+    cur.execute("ATTACH DATABASE ? AS shard", (str(path), ))
+    try:
+        for table in ("Folder", "Book", "Duplicate"):
+            if _columns(con, table, "shard") != _columns(con, table):
+                raise ValueError(f"{path} is not a PDFShelf library: "
+                                 f"{table} differs.")
+        counts = _merge(cur)
+        con.commit()
+    except BaseException:
+        LOGGER.error("Merging %s failed, rolling back!", path,
+                     exc_info=True)
+        con.rollback()
+        raise
+    finally:
+        cur.execute("DROP TABLE IF EXISTS temp.FolderMap")
+        cur.execute("DROP TABLE IF EXISTS temp.BookMap")
+        cur.execute("DETACH DATABASE shard")
+
+    LOGGER.info("[MERGED] %s: %s Folders, %s Books, %s Duplicates", path,
+                counts["Folder"], counts["Book"], counts["Duplicate"])
+    return counts
+
+
+def _merge(cur: sqlite3.Cursor) -> dict[str, int]:
+    con = cur.connection
+    book = [name for name in _columns(con, "Book")
+            if name not in ("book_id", "folder_id")]
+    duplicate = [name for name in _columns(con, "Duplicate")
+                 if name not in ("original_book_id", "folder_id")]
+    counts = {}
+
+    cur.execute("BEGIN")
+    cur.execute("""INSERT OR IGNORE INTO main.Folder
+                   (name, path, added_date, active)
+                   SELECT name, path, added_date, active
+                   FROM shard.Folder ORDER BY folder_id""")
+    counts["Folder"] = cur.rowcount
+    # Shard id -> library id.
+    cur.execute("""CREATE TEMP TABLE FolderMap (
+                    shard_id INTEGER PRIMARY KEY,
+                    folder_id INTEGER NOT NULL
+                    )""")
+    cur.execute("""INSERT INTO temp.FolderMap
+                   SELECT s.folder_id, coalesce(
+                              (SELECT m.folder_id FROM main.Folder m
+                               WHERE m.name = s.name),
+                              (SELECT m.folder_id FROM main.Folder m
+                               WHERE m.path = s.path))
+                   FROM shard.Folder s""")
+
+    # Shard id -> id of the new Book, or of the Book it duplicates.
+    cur.execute("""CREATE TEMP TABLE BookMap (
+                    shard_id INTEGER PRIMARY KEY,
+                    book_id INTEGER NOT NULL,
+                    duplicate INTEGER NOT NULL
+                    )""")
+    last = cur.execute("SELECT coalesce(max(book_id), 0) FROM main.Book"
+                       ).fetchone()[0]
+    cur.execute("""INSERT INTO temp.BookMap
+                   SELECT shard_id,
+                          coalesce(original, ? + row_number() OVER (
+                              PARTITION BY original IS NULL
+                              ORDER BY shard_id)),
+                          original IS NOT NULL
+                   FROM (SELECT s.book_id AS shard_id, coalesce(
+                             (SELECT b.book_id FROM main.Book b
+                              WHERE b.hash_id = s.hash_id),
+                             (SELECT b.book_id FROM main.Book b
+                              WHERE b.isbn13 = s.isbn13)) AS original
+                         FROM shard.Book s)""", (last, ))
+
+    with StatsDBHandler(con).bulk_load():
+        columns = ", ".join(book)
+        selected = ", ".join(f"s.{name}" for name in book)
+        cur.execute(f"""INSERT INTO main.Book (book_id, folder_id, {columns})
+                        SELECT m.book_id, f.folder_id, {selected}
+                        FROM shard.Book s
+                        JOIN temp.BookMap m ON m.shard_id = s.book_id
+                        JOIN temp.FolderMap f ON f.shard_id = s.folder_id
+                        WHERE NOT m.duplicate ORDER BY m.book_id""")
+        counts["Book"] = cur.rowcount
+
+        columns = ", ".join(duplicate)
+        selected = ", ".join(f"s.{name}" for name in duplicate)
+        cur.execute(f"""INSERT INTO main.Duplicate
+                        (original_book_id, folder_id, {columns})
+                        SELECT m.book_id, f.folder_id, {selected}
+                        FROM shard.Book s
+                        JOIN temp.BookMap m ON m.shard_id = s.book_id
+                        JOIN temp.FolderMap f ON f.shard_id = s.folder_id
+                        WHERE m.duplicate ORDER BY s.book_id""")
+        counts["Duplicate"] = cur.rowcount
+        cur.execute(f"""INSERT INTO main.Duplicate
+                        (original_book_id, folder_id, {columns})
+                        SELECT m.book_id, f.folder_id, {selected}
+                        FROM shard.Duplicate s
+                        JOIN temp.BookMap m
+                        ON m.shard_id = s.original_book_id
+                        JOIN temp.FolderMap f ON f.shard_id = s.folder_id
+                        ORDER BY s.rowid""")
+        counts["Duplicate"] += cur.rowcount
+    return counts
@@ -0,0 +1,137 @@
+import os
+import zlib
+import codecs
+from pathlib import Path
+from typing import Iterator
+from .config import get_config
+from .utilities import lazy_import
+
+try:
+    zstandard = lazy_import("zstandard")
+except ModuleNotFoundError:  # zlib is used instead.
+    zstandard = None
+
+# Separates pages (or EPUB documents) inside a stored text.
+PAGE_BREAK = "\f"
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = {"zstd": ".txt.zst", "zlib": ".txt.zz"}
+
+
+def default_store_path() -> Path:
+    return get_config().document_folder / "text"
+
+
+class TextWriter:
+    """
+    Streams the pages of one book into a compressed sidecar file. Pages are
+    compressed as they arrive, so memory does not grow with the book. The
+    file only appears under its final name once the writer is closed
+    without errors.
+    """
+
+    def __init__(self, path: Path, codec: str) -> None:
+        self.path = path
+        self.tmp_path = path.with_name(f"{path.name}.tmp")
+        self._file = open(self.tmp_path, "wb")
+        if codec == "zstd":
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self._compressor = zlib.compressobj(level=6)
+        self._pages = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        if ctx_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_page(self, text: str) -> None:
+        data = text.replace(PAGE_BREAK, " ")
+        if self._pages > 0:
+            data = PAGE_BREAK + data
+        self._file.write(self._compressor.compress(data.encode()))
+        self._pages += 1
+
+    def close(self) -> None:
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self) -> None:
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class TextStore:
+    """
+    Compressed per-book store of the text extracted during import, keyed by
+    Book.hash_id. Later stages (search indexing, near-duplicate detection,
+    re-parsing with a new regex) read it back instead of re-opening the
+    PDF/EPUB.
+
+    One sidecar file per book keeps writers independent, so sandboxed
+    parser processes can fill the store in parallel. Uses zstd when the
+    zstandard package is installed and zlib otherwise.
+    """
+
+    def __init__(self, folder: Path, codec: str | None = None) -> None:
+        if codec is None:
+            codec = "zlib" if zstandard is None else "zstd"
+        if codec not in EXTENSIONS:
+            raise ValueError(f"Unknown codec {codec}!")
+        if codec == "zstd" and zstandard is None:
+            raise ImportError("zstd codec requires the zstandard package.")
+
+        self.folder = folder
+        self.codec = codec
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def writer(self, hash_id: str) -> TextWriter:
+        return TextWriter(self.get_path(hash_id), self.codec)
+
+    def get_path(self, hash_id: str, codec: str | None = None) -> Path:
+        return self.folder / f"{hash_id}{EXTENSIONS[codec or self.codec]}"
+
+    def exists(self, hash_id: str) -> bool:
+        return self._find(hash_id) is not None
+
+    def delete(self, hash_id: str) -> None:
+        found = self._find(hash_id)
+        if found is not None:
+            found[0].unlink()
+
+    def iter_pages(self, hash_id: str) -> Iterator[str]:
+        """Yield the stored pages one at a time, decompressing lazily."""
+        found = self._find(hash_id)
+        if found is None:
+            raise KeyError(f"No text stored for {hash_id}!")
+
+        path, codec = found
+        if codec == "zstd":
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            decompressor = zlib.decompressobj()
+
+        # A chunk may end inside a UTF-8 sequence.
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                text = decoder.decode(decompressor.decompress(chunk))
+                *pages, pending = (pending + text).split(PAGE_BREAK)
+                yield from pages
+        yield pending + decoder.decode(b"", final=True)
+
+    def get_text(self, hash_id: str) -> str:
+        return PAGE_BREAK.join(self.iter_pages(hash_id))
+
+    def _find(self, hash_id: str) -> tuple[Path, str] | None:
+        """Stored files are found whichever codec wrote them."""
+        for codec in EXTENSIONS:
+            path = self.get_path(hash_id, codec)
+            if path.is_file():
+                return path, codec
+        return None
@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import functools
+import threading
+import unicodedata
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator
+from .config import get_config
+
+LOGGER = logging.getLogger(__name__)
+
+# Entries per executemany while building.
+BATCH_SIZE = 10000
+# Query trigrams are looked up rarest first, until their postings add up
+# to POSTINGS (but at least MIN_GRAMS of them): a match reads a bounded
+# slice of the index, however large it is and however common its words.
+POSTINGS = 5000
+MIN_GRAMS = 4
+# Entries sharing the most trigrams that are scored.
+CANDIDATES = 100
+# Best score from which a match is taken as the metadata of a book.
+MIN_SCORE = 0.5
+WORD = re.compile(r"[^\W_]+")
+CAMEL_CASE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+# Words of file names that are never part of a title.
+NOISE = frozenset({"ebook", "ebooks", "pdf", "epub", "isbn", "retail",
+                   "libgen"})
+
+
+def normalize(text: str) -> str:
+    """Lowercase words without accents or punctuation."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text
+                       if not unicodedata.combining(char))
+    return " ".join(WORD.findall(text.lower()))
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_trigrams(word: str) -> frozenset[str]:
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigrams(text: str) -> set[str]:
+    """Trigrams of each word, padded so short words and edges count."""
+    return set().union(*map(_word_trigrams, normalize(text).split()))
+
+
+def filename_title(filename: str) -> str:
+    """The words of a file name likely to be from its title."""
+    stem = CAMEL_CASE.sub(" ", Path(filename).stem)
+    # Long numbers are ISBNs or ids, not title words.
+    return " ".join(word for word in normalize(stem).split()
+                    if word not in NOISE
+                    and not (word.isdigit() and len(word) > 4))
+
+
+def similarity(query: set[str], entry: set[str]) -> float:
+    """
+    Mean of the Dice coefficient and the share of the query in the
+    entry, so a short file name can still match a long title.
+    """
+    if not query or not entry:
+        return 0.0
+    shared = len(query & entry)
+    return (2 * shared / (len(query) + len(entry)) + shared / len(query)) / 2
+
+
+def default_index_path() -> Path:
+    return get_config().document_folder / "titles.db"
+
+
+def library_entries(con: sqlite3.Connection) -> Iterator[dict[str, Any]]:
+    """Metadata of the active Books with a title, in isbnlib's format."""
+    rows = con.execute("""SELECT title, authors, publisher, year, lang, isbn13
+                          FROM Book WHERE title IS NOT NULL AND active""")
+    for title, authors, publisher, year, lang, isbn13 in rows:
+        entry = {"Title": title,
+                 "Authors": json.loads(authors) if authors else [],
+                 "Publisher": publisher or "", "Language": lang or ""}
+        if year:
+            entry["Year"] = str(year)
+        if isbn13:
+            entry["ISBN-13"] = isbn13
+        yield entry
+
+
+@dataclass(kw_only=True)
+class TitleMatch:
+    score: float
+    metadata: dict[str, Any]
+
+
+class TitleIndex:
+    """
+    Known titles and authors, searched by trigram similarity to find the
+    metadata of books without an ISBN from their file name or embedded
+    title. A SQLite file with an inverted index (trigram -> entries) and
+    the number of entries per trigram: a match reads the postings of its
+    rarest trigrams only, never the whole table.
+
+    Matches are safe from several threads (one read-only connection each).
+    """
+
+    def __init__(self, path: Path) -> None:
+        if not path.exists():
+            raise FileNotFoundError(f"No title index at {path}.")
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ctx_type, ctx_value, ctx_traceback):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                  check_same_thread=False)
+            self._local.con = con
+            with self._lock:
+                self._connections.append(con)
+        return con
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            "SELECT count(*) FROM Entry").fetchone()[0]
+
+    def match(self, *texts: str, limit: int = 5) -> list[TitleMatch]:
+        """
+        Entries most similar to any of the texts (e.g. the words of a file
+        name and an embedded title), best first.
+        """
+        queries = [grams for text in texts if (grams := trigrams(text))]
+        if not queries:
+            return []
+
+        con = self._connection()
+        counts = con.execute(
+            """SELECT gram, entries FROM GramCount
+               WHERE gram IN (SELECT value FROM json_each(?))""",
+            (json.dumps(sorted(set().union(*queries))), )
+        ).fetchall()
+        rarest, postings = [], 0
+        for gram, entries in sorted(counts, key=lambda row: row[1]):
+            if postings + entries > POSTINGS and len(rarest) >= MIN_GRAMS:
+                break
+            rarest.append(gram)
+            postings += entries
+        if not rarest:
+            return []
+
+        rows = con.execute(
+            """SELECT title, authors, publisher, year, lang, isbn13
+               FROM (SELECT entry_id, count(*) AS shared FROM Gram
+                     WHERE gram IN (SELECT value FROM json_each(?))
+                     GROUP BY entry_id ORDER BY shared DESC LIMIT ?)
+               JOIN Entry USING (entry_id)""",
+            (json.dumps(rarest), CANDIDATES)
+        ).fetchall()
+
+        matches: dict[tuple, TitleMatch] = {}
+        for title, authors, publisher, year, lang, isbn13 in rows:
+            authors = json.loads(authors) if authors else []
+            title_grams = trigrams(title)
+            grams = (title_grams, title_grams.union(*map(trigrams, authors)))
+            score = max(similarity(query, entry)
+                        for query in queries for entry in grams)
+            # Editions of a title share it: keep the best one.
+            key = (normalize(title), tuple(authors))
+            if key in matches and matches[key].score >= score:
+                continue
+            metadata = {"Title": title, "Authors": authors,
+                        "Publisher": publisher or "", "Language": lang or ""}
+            if year:
+                metadata["Year"] = str(year)
+            if isbn13:
+                metadata["ISBN-13"] = isbn13
+            matches[key] = TitleMatch(score=score, metadata=metadata)
+
+        ranked = sorted(matches.values(), key=lambda m: m.score, reverse=True)
+        return ranked[:limit]
+
+    def best(self, *texts: str) -> TitleMatch | None:
+        """The best match of the texts, if it scores at least MIN_SCORE."""
+        matches = self.match(*texts, limit=1)
+        if matches and matches[0].score >= MIN_SCORE:
+            return matches[0]
+        return None
+
+    @classmethod
+    def build(
+        cls, entries: Iterable[dict[str, Any]], path: Path,
+        on_progress: Callable[[int], None] | None = None
+    ) -> "TitleIndex":
+        """
+        Build an index at `path` from metadata in isbnlib's format (see
+        library_entries and ISBNIndex.entries), streamed in batches. The
+        index replaces `path` only once complete. `on_progress` gets the
+        entries read so far, per batch.
+        """
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        con = sqlite3.connect(tmp_path)
+        try:
+            # Rebuilt from scratch on failure: no journal needed.
+            con.execute("PRAGMA journal_mode = OFF")
+            con.execute("PRAGMA synchronous = OFF")
+            con.execute("""CREATE TABLE Entry (
+                            entry_id INTEGER PRIMARY KEY,
+                            title TEXT NOT NULL,
+                            authors TEXT,
+                            publisher TEXT,
+                            year INTEGER,
+                            lang TEXT,
+                            isbn13 TEXT
+                            )""")
+            # Postings are appended unordered, then sorted into Gram once.
+            con.execute("""CREATE TEMP TABLE Posting (
+                            gram TEXT NOT NULL,
+                            entry_id INTEGER NOT NULL
+                            )""")
+            count = cls._load_entries(con, entries, on_progress)
+            con.execute("""CREATE TABLE Gram (
+                            gram TEXT NOT NULL,
+                            entry_id INTEGER NOT NULL,
+                            PRIMARY KEY (gram, entry_id)
+                            ) WITHOUT ROWID""")
+            con.execute("""INSERT INTO Gram SELECT gram, entry_id
+                           FROM temp.Posting ORDER BY gram, entry_id""")
+            con.execute("""CREATE TABLE GramCount (
+                            gram TEXT PRIMARY KEY,
+                            entries INTEGER NOT NULL
+                            ) WITHOUT ROWID""")
+            con.execute("""INSERT INTO GramCount
+                           SELECT gram, count(*) FROM Gram GROUP BY gram""")
+            con.commit()
+            con.execute("DROP TABLE temp.Posting")
+            con.execute("VACUUM")
+        except BaseException:
+            con.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        con.close()
+        os.replace(tmp_path, path)
+        LOGGER.info("[TITLE-INDEX] %s titles indexed in %s", count, path)
+        return cls(path)
+
+    @staticmethod
+    def _load_entries(
+        con: sqlite3.Connection, entries: Iterable[dict[str, Any]],
+        on_progress: Callable[[int], None] | None
+    ) -> int:
+        insert = "INSERT INTO Entry VALUES (?, ?, ?, ?, ?, ?, ?)"
+        count = 0
+        rows, postings = [], []
+        for entry in entries:
+            title = entry.get("Title")
+            if not title:
+                continue
+            count += 1
+            authors = entry.get("Authors") or []
+            year = entry.get("Year")
+            rows.append((count, title,
+                         json.dumps(authors) if authors else None,
+                         entry.get("Publisher") or None,
+                         int(year) if year else None,
+                         entry.get("Language") or None,
+                         entry.get("ISBN-13") or None))
+            postings.extend((gram, count) for gram in
+                            trigrams(" ".join([title, *authors])))
+
+            if len(rows) == BATCH_SIZE:
+                con.executemany(insert, rows)
+                con.executemany("INSERT INTO temp.Posting VALUES (?, ?)",
+                                postings)
+                rows, postings = [], []
+                if on_progress is not None:
+                    on_progress(count)
+
+        con.executemany(insert, rows)
+        con.executemany("INSERT INTO temp.Posting VALUES (?, ?)", postings)
+        if on_progress is not None:
+            on_progress(count)
+        return count
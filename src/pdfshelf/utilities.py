@@ -1,8 +1,38 @@
+import sys
+import importlib.util
+from types import ModuleType
 from datetime import datetime
 from typing import Any
 from pdfshelf.domain import Book, Folder
 
 
+class _LazyModule(ModuleType):
+    """Stand-in that imports the real module on first attribute access."""
+
+    def __getattr__(self, attr: str) -> Any:
+        # The import system serializes concurrent imports of a module, so
+        # parser threads touching the same dependency at once are safe
+        # (importlib.util.LazyLoader is not, before Python 3.12).
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(vars(module))
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module that is only executed on first attribute access, so
+    heavy optional dependencies (pypdf, ebooklib, pdf2image...) do not slow
+    down every `import pdfshelf.<module>`.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+
+    return _LazyModule(name)
+
+
 def validade_isbn10(isbn: str) -> bool:
     """Checks if a number sequence is a valid ISBN-10. Ref: https://en.wikipedia.org/wiki/ISBN"""
     s = 0
@@ -37,6 +67,14 @@ def validate_isbn13(isbn: str) -> bool:
     return is_valid
 
 
+def isbn10_to_isbn13(isbn: str) -> str:
+    """The ISBN-13 (978 prefix) of an ISBN-10. The input is not validated."""
+    body = "978" + isbn[:9]
+    s = sum(int(char) * (1 if i % 2 == 0 else 3)
+            for i, char in enumerate(body))
+    return body + str((10 - s % 10) % 10)
+
+
 class _Auto:
     """
     Sentinel value indicating an automatic default will be used.
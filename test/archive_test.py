@@ -0,0 +1,134 @@
+import os
+import zipfile
+import pytest
+from pathlib import Path
+from ebooklib import epub
+from pdfshelf.archive import (
+    expand_archives, file_size, open_book, open_member, scan_archive,
+    split_member
+)
+from pdfshelf.cover import FileCoverExtractor
+from pdfshelf.domain import ParseStatus
+from pdfshelf.importer import BookImporter, ISBNParser, MetadataFetcher
+from pdfshelf.scanner import DirectoryScanner
+from pdfshelf.utilities import book_factory, folder_factory
+
+JPEG = b"\xff\xd8\xff\xe0fake-jpeg\xff\xd9"
+
+
+@pytest.fixture
+def test_data():
+    return Path(os.path.dirname(os.path.abspath(__file__))) / "test_data"
+
+
+@pytest.fixture
+def archive(tmp_path, test_data):
+    """
+    books/set.zip: the EPUB stored, the PDF deflated, in a subfolder,
+    next to a file that is not a book.
+    """
+    path = tmp_path / "books" / "set.zip"
+    path.parent.mkdir()
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.write(test_data / "craft-isbn-13.epub", "craft-isbn-13.epub",
+                 compress_type=zipfile.ZIP_STORED)
+        zf.write(test_data / "think_python_2_no_isbn.pdf",
+                 "python/think_python_2_no_isbn.pdf",
+                 compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("readme.txt", "not a book")
+    return path
+
+
+class TestMembers:
+
+    def test_scan(self, archive, test_data) -> None:
+        files = scan_archive(archive, {".pdf", ".epub"})
+        assert [(f.path, f.size) for f in files] == [
+            (archive / "craft-isbn-13.epub",
+             os.path.getsize(test_data / "craft-isbn-13.epub")),
+            (archive / "python" / "think_python_2_no_isbn.pdf",
+             os.path.getsize(test_data / "think_python_2_no_isbn.pdf"))
+        ]
+
+        (archive.parent / "broken.cbz").write_bytes(b"not a zip")
+        scanner = DirectoryScanner({".pdf", ".epub", ".zip", ".cbz"})
+        expanded = expand_archives(scanner.scan(archive.parent),
+                                   {".pdf", ".epub"})
+        assert sorted(f.path for f in expanded) == \
+            sorted(f.path for f in files)
+
+    def test_split_and_size(self, archive, test_data) -> None:
+        member = archive / "python" / "think_python_2_no_isbn.pdf"
+        assert split_member(member) == \
+            (archive, "python/think_python_2_no_isbn.pdf")
+        assert split_member(test_data / "corrupted.pdf") is None
+        assert file_size(member) == \
+            os.path.getsize(test_data / "think_python_2_no_isbn.pdf")
+        with pytest.raises(FileNotFoundError):
+            file_size(archive / "missing.pdf")
+
+    @pytest.mark.parametrize("name, source", [
+        ("craft-isbn-13.epub", "craft-isbn-13.epub"),
+        ("python/think_python_2_no_isbn.pdf", "think_python_2_no_isbn.pdf")
+    ])
+    def test_open_member(self, archive, test_data, name, source) -> None:
+        expected = (test_data / source).read_bytes()
+        with open_member(archive / name) as member:
+            assert member.seekable()
+            member.seek(-4, os.SEEK_END)
+            assert member.read() == expected[-4:]
+            member.seek(0)
+            assert member.read() == expected
+
+        with pytest.raises(FileNotFoundError):
+            with open_book(archive / "missing.pdf"):
+                pass
+
+
+class TestArchiveImport:
+
+    def test_parse_members(self, archive) -> None:
+        parser = ISBNParser()
+        result = parser.parse(archive / "craft-isbn-13.epub")
+        assert result.isbn13 == "978-1-4116-8297-9"
+
+        result = parser.parse(archive / "python" /
+                              "think_python_2_no_isbn.pdf")
+        assert result.status == ParseStatus.NO_ISBN
+
+    def test_import_from_folder(self, archive) -> None:
+        importer = BookImporter(MetadataFetcher(offline=True), ISBNParser())
+        assert importer.import_from_folder(archive.parent) == []
+
+        books = importer.import_from_folder(archive.parent, archives=True)
+        assert [book.storage_path for book in books] == [
+            Path("set.zip/craft-isbn-13.epub"),
+            Path("set.zip/python/think_python_2_no_isbn.pdf")
+        ]
+        assert books[0].get_full_path() == archive / "craft-isbn-13.epub"
+
+        book = importer.import_from_file(archive / "craft-isbn-13.epub")
+        assert book.folder.path == archive.parent
+        assert book.storage_path == Path("set.zip/craft-isbn-13.epub")
+
+    def test_epub_cover(self, tmp_path) -> None:
+        document = epub.EpubBook()
+        document.set_identifier("id")
+        document.set_title("Cover test")
+        document.set_cover("images/cover.jpg", JPEG)
+        chapter = epub.EpubHtml(title="One", file_name="one.xhtml",
+                                content="<p>One</p>")
+        document.add_item(chapter)
+        document.spine = [chapter]
+        epub.write_epub(tmp_path / "book.epub", document)
+        with zipfile.ZipFile(tmp_path / "comics.cbz", "w") as zf:
+            zf.write(tmp_path / "book.epub", "book.epub")
+
+        folder = folder_factory(path=str(tmp_path))
+        book = book_factory(filename="book.epub", ext=".epub",
+                            storage_path="comics.cbz/book.epub",
+                            folder=folder)
+        extractor = FileCoverExtractor(tmp_path)
+        book = extractor.get_format_parser(".epub")(book)
+
+        assert book.cover_path.read_bytes() == JPEG
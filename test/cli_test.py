@@ -0,0 +1,281 @@
+import io
+import os
+import pickle
+import sqlite3
+import zipfile
+import pytest
+from pathlib import Path
+from pdfshelf import cli
+from pdfshelf.database import DatabaseConnector
+from pdfshelf.importer import MetadataFetcher
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "pdfshelf.db"
+    monkeypatch.setattr(DatabaseConnector, "DB_PATH", path)
+    monkeypatch.setattr("pdfshelf.log.setup_logging",
+                        lambda **options: None)
+    return path
+
+
+@pytest.fixture
+def setup_db(db_path, rootdir):
+    with DatabaseConnector() as con:
+        with open(Path(rootdir) / "test_data" / "dummy_data.pkl", "rb") as inp:
+            data = pickle.load(inp)
+
+        for book in data["books"]:
+            values = """NULL, :title, :authors, :year, :lang, :filename, :ext,
+                        :storage_path, :folder_id, :size, :tags, :added_date,
+                        :hash_id, :publisher, :isbn13, :parsed_isbn, :active,
+                        :confirmed, :cover_path"""
+            con.execute(f"INSERT INTO Book VALUES({values})", book)
+        for folder in data["folders"]:
+            values = "NULL, :name, :path, :added_date, :active"
+            con.execute(f"INSERT INTO Folder VALUES({values})", folder)
+        con.commit()
+        return data
+
+
+class TestReadCommands:
+
+    def test_list(self, setup_db, capsys) -> None:
+        assert cli.main(["list", "--sort", "title", "--limit", "3"]) == 0
+        assert len(capsys.readouterr().out.splitlines()) == 3
+
+    def test_list_filter(self, setup_db, capsys) -> None:
+        ext = setup_db["books"][0]["ext"]
+        cli.main(["list", "--filter", "ext", ext])
+        expected = [b for b in setup_db["books"] if b["ext"] == ext]
+        assert len(capsys.readouterr().out.splitlines()) == len(expected)
+        with pytest.raises(SystemExit):
+            cli.main(["list", "--filter", "colour", "red"])
+        assert "invalid key 'colour'" in capsys.readouterr().err
+
+    def test_list_where(self, setup_db, capsys) -> None:
+        assert cli.main(["list", "--where", "ext", "in", '[".epub"]',
+                         "--where", "year", ">=", "2018",
+                         "--order=-year"]) == 0
+        expected = [b for b in setup_db["books"] if b["ext"] == ".epub"
+                    and b["year"] is not None and b["year"] >= 2018]
+        assert len(capsys.readouterr().out.splitlines()) == len(expected)
+        assert cli.main(["list", "--where", "authors", "=", "x"]) == 2
+
+    def test_covers(self, setup_db, db_path, tmp_path, monkeypatch,
+                    capsys) -> None:
+        from pdfshelf import cover
+        from pdfshelf.database import BookDBHandler
+
+        def get_cover_for_books(self, books):
+            for book in books:
+                book.cover_path = tmp_path / f"cover_{book.book_id}.jpg"
+            return books
+
+        ledger = cover.CoverLedger
+        monkeypatch.setattr(cover, "CoverLedger",
+                            lambda: ledger(tmp_path / "covers.db"))
+        monkeypatch.setattr(cover.BookCover, "get_cover_for_books",
+                            get_cover_for_books)
+        writes = []
+        update_books = BookDBHandler.update_books
+        monkeypatch.setattr(
+            BookDBHandler, "update_books",
+            lambda self, updates: writes.append(
+                update_books(self, updates)
+            )
+        )
+        with sqlite3.connect(db_path) as con:
+            con.execute("UPDATE Book SET cover_path = 'x.jpg' "
+                        "WHERE book_id = 1")
+            missing = con.execute("SELECT count(*) FROM Book "
+                                  "WHERE cover_path IS NULL").fetchone()[0]
+
+        assert cli.main(["covers", "--batch-size", "5"]) == 0
+        assert f"{missing} books without cover" in capsys.readouterr().out
+        # One write per batch.
+        assert len(writes) == -(-missing // 5)
+        with sqlite3.connect(db_path) as con:
+            assert con.execute("SELECT count(*) FROM Book WHERE "
+                               "cover_path IS NULL").fetchone()[0] == 0
+            assert con.execute("SELECT cover_path FROM Book WHERE "
+                               "book_id = 1").fetchone()[0] == "x.jpg"
+
+    def test_search(self, setup_db, capsys) -> None:
+        title = setup_db["books"][0]["title"]
+        assert cli.main(["search", title]) == 0
+        assert title[:40] in capsys.readouterr().out
+
+    def test_search_no_match(self, setup_db) -> None:
+        assert cli.main(["search", "no-such-book-xyz"]) == 1
+
+    def test_stats(self, setup_db, capsys) -> None:
+        assert cli.main(["stats"]) == 0
+        out = capsys.readouterr().out
+        assert f"Books:          {len(setup_db['books'])}" in out
+        assert cli.main(["stats", "--by", "folder"]) == 0
+
+    def test_check(self, setup_db, capsys) -> None:
+        # The files of the dummy library do not exist.
+        assert cli.main(["check", "--no-relink"]) == 1
+        out = capsys.readouterr().out
+        assert "[MISSING] Book 1 " in out
+        assert f"{len(setup_db['books'])} books checked" in out
+
+    def test_relocate(self, setup_db, tmp_path, capsys) -> None:
+        # The files of the dummy library are nowhere.
+        assert cli.main(["relocate", "1", str(tmp_path)]) == 1
+        assert cli.main(["relocate", "1", str(tmp_path),
+                         "--sample", "0"]) == 0
+        assert f"relocated to {tmp_path}" in capsys.readouterr().out
+
+    def test_delete_restore_purge(self, setup_db, db_path, capsys) -> None:
+        with sqlite3.connect(db_path) as con:
+            con.execute("UPDATE Book SET active = 1")
+            con.execute("UPDATE Folder SET active = 1")
+
+        assert cli.main(["delete", "1", "2", "--soft"]) == 0
+        assert cli.main(["restore", "2"]) == 0
+        assert cli.main(["purge"]) == 0
+        assert "Purged 0 folders and 1 books." in capsys.readouterr().out
+
+        with sqlite3.connect(db_path) as con:
+            ids = [row[0] for row in con.execute("SELECT book_id FROM Book")]
+        assert 1 not in ids and 2 in ids
+
+    def test_export_load(self, setup_db, db_path, tmp_path, capsys) -> None:
+        export = tmp_path / "export"
+        assert cli.main(["export", str(export), "--format", "jsonl"]) == 0
+        assert f"Book: {len(setup_db['books'])} rows" in \
+            capsys.readouterr().out
+
+        assert cli.main(["load", str(export)]) == 1
+        assert cli.main(["load", str(export), "--replace"]) == 0
+        with sqlite3.connect(db_path) as con:
+            books = con.execute("SELECT count(*) FROM Book").fetchone()[0]
+        assert books == len(setup_db["books"])
+
+
+class TestImportCommand:
+
+    def test_dry_run_writes_nothing(self, db_path, rootdir, capsys) -> None:
+        folder = Path(rootdir) / "test_data"
+        assert cli.main(["import", str(folder), "--dry-run"]) == 0
+
+        out = capsys.readouterr().out
+        assert "6 new files" in out
+        with sqlite3.connect(db_path) as con:
+            assert con.execute("SELECT count(*) FROM Book").fetchone()[0] == 0
+
+    def test_import_and_skip_known_files(
+        self, db_path, rootdir, monkeypatch, capsys
+    ) -> None:
+        monkeypatch.setattr(MetadataFetcher, "from_isbn",
+                            lambda self, isbn10, isbn13: ({}, False))
+        folder = Path(rootdir) / "test_data"
+        args = ["import", str(folder), "--no-sandbox", "--parse-workers", "2"]
+        assert cli.main(args) == 0
+
+        with sqlite3.connect(db_path) as con:
+            assert con.execute("SELECT count(*) FROM Book").fetchone()[0] == 6
+        assert "[CORRUPTED]" in capsys.readouterr().out
+
+        cli.main(args + ["--dry-run"])
+        assert "0 new files" in capsys.readouterr().out
+
+    def test_store_text_and_delete(
+        self, db_path, rootdir, tmp_path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(MetadataFetcher, "from_isbn",
+                            lambda self, isbn10, isbn13: ({}, False))
+        monkeypatch.setattr("pdfshelf.textstore.default_store_path",
+                            lambda: tmp_path / "text")
+        folder = Path(rootdir) / "test_data"
+        assert cli.main(["import", str(folder), "--no-sandbox",
+                         "--store-text"]) == 0
+
+        with sqlite3.connect(db_path) as con:
+            book_id, hash_id = con.execute(
+                "SELECT book_id, hash_id FROM Book WHERE ext = '.epub'"
+            ).fetchone()
+        stored = list((tmp_path / "text").glob(f"{hash_id}.*"))
+        assert len(stored) == 1
+
+        assert cli.main(["delete", str(book_id)]) == 0
+        assert not stored[0].exists()
+
+    def test_sharded_import_and_merge(
+        self, db_path, rootdir, tmp_path, monkeypatch, capsys
+    ) -> None:
+        monkeypatch.setattr(MetadataFetcher, "from_isbn",
+                            lambda self, isbn10, isbn13: ({}, False))
+        folder = Path(rootdir) / "test_data"
+        shards = [tmp_path / f"shard-{i}.db" for i in range(2)]
+        for i, shard in enumerate(shards):
+            assert cli.main(["import", str(folder), "--no-sandbox",
+                             "--shard", f"{i}/2", "--shard-db",
+                             str(shard)]) == 0
+        with pytest.raises(SystemExit):
+            cli.main(["import", str(folder), "--shard", "2/2"])
+        # Shard workers never open the library.
+        assert not db_path.exists()
+
+        capsys.readouterr()
+        assert cli.main(["merge", *map(str, shards)]) == 0
+        assert "new folders" in capsys.readouterr().out
+        with sqlite3.connect(db_path) as con:
+            assert con.execute("SELECT count(*) FROM Book").fetchone()[0] == 6
+        assert cli.main(["merge", str(tmp_path / "missing.db")]) == 1
+
+    def test_ocr_flag(self, db_path, rootdir, monkeypatch, capsys) -> None:
+        from pdfshelf import ocr
+
+        folder = str(Path(rootdir) / "test_data")
+        monkeypatch.setattr(ocr, "pytesseract", None)
+        assert cli.main(["import", folder, "--ocr"]) == 2
+        assert "--ocr: TesseractBackend requires pytesseract" in \
+            capsys.readouterr().err
+
+        closed = []
+        monkeypatch.setattr(ocr, "pytesseract", object())
+        monkeypatch.setattr(ocr.OCRStage, "close",
+                            lambda self: closed.append(self.dpi))
+        monkeypatch.setattr(MetadataFetcher, "from_isbn",
+                            lambda self, isbn10, isbn13: ({}, False))
+        assert cli.main(["import", folder, "--no-sandbox", "--ocr",
+                         "--ocr-dpi", "100"]) == 0
+        assert closed == [100]
+
+    def test_dry_run_archives(self, db_path, rootdir, tmp_path,
+                              capsys) -> None:
+        with zipfile.ZipFile(tmp_path / "set.zip", "w") as zf:
+            zf.write(Path(rootdir) / "test_data" / "craft-isbn-13.epub",
+                     "epubs/craft-isbn-13.epub")
+        assert cli.main(["import", str(tmp_path), "--dry-run"]) == 0
+        assert "0 new files" in capsys.readouterr().out
+        assert cli.main(["import", str(tmp_path), "--dry-run",
+                         "--archives"]) == 0
+        out = capsys.readouterr().out
+        assert "1 new files" in out
+        assert str(Path("set.zip/epubs/craft-isbn-13.epub")) in out
+
+    def test_missing_folder(self, db_path, tmp_path) -> None:
+        assert cli.main(["import", str(tmp_path / "missing")]) == 1
+
+
+class TestProgressReporter:
+
+    def test_reports_rate_and_eta(self) -> None:
+        stream = io.StringIO()
+        progress = cli.ProgressReporter(10, "import", stream, interval=0)
+        progress.update(4)
+        progress.finish()
+
+        lines = stream.getvalue().splitlines()
+        assert lines[-1].startswith("import: 4/10 |")
+        assert "/s | ETA" in lines[-1]
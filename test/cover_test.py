@@ -1,7 +1,15 @@
 import os
+import types
+import threading
 import pytest
 from pathlib import Path
-from pdfshelf.cover import FileCoverExtractor, OLCoverFetcher, BookCover
+from concurrent.futures import ThreadPoolExecutor
+from ebooklib import epub
+from pdfshelf import cover
+from pdfshelf.cover import (
+    FileCoverExtractor, OLCoverFetcher, BookCover, CoverLedger, write_cover,
+    map_cover
+)
 from pdfshelf.importer import book_from_file, books_from_folder
 from pdfshelf.config import COVER_FOLDER
 from pdfshelf.utilities import book_factory, folder_factory
@@ -103,3 +111,202 @@ class TestBookCover:
 
         for filename in folder_path.iterdir():
             print("FS-> ", filename)
+
+
+JPEG = b"\xff\xd8" + b"jpeg" * 40000 + b"\xff\xd9"
+
+
+class TestCoverFiles:
+
+    def test_write_is_atomic(self, tmp_path) -> None:
+        path = tmp_path / "cover.jpg"
+        path.write_bytes(b"old")
+
+        def broken():
+            yield b"new"
+            raise OSError("connection reset")
+
+        with pytest.raises(OSError):
+            write_cover(path, broken())
+        assert path.read_bytes() == b"old"
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_concurrent_writes(self, tmp_path) -> None:
+        # Two books with the same file name share their cover path.
+        path = tmp_path / "cover.jpg"
+        barrier = threading.Barrier(2, timeout=10)
+
+        def chunks(body: bytes):
+            yield body[:10]
+            barrier.wait()
+            yield body[10:]
+
+        with ThreadPoolExecutor(2) as pool:
+            written = list(pool.map(lambda body: write_cover(path,
+                                                             chunks(body)),
+                                    [JPEG, JPEG[::-1]]))
+        assert written == [True, True]
+        assert path.read_bytes() in (JPEG, JPEG[::-1])
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_unchanged_cover_is_kept(self, tmp_path) -> None:
+        path = tmp_path / "cover.jpg"
+        assert write_cover(path, [JPEG[:1000], JPEG[1000:]])
+        inode = path.stat().st_ino
+
+        assert not write_cover(path, [JPEG])
+        assert path.stat().st_ino == inode
+        assert write_cover(path, [JPEG[::-1]])
+
+    def test_map_cover(self, tmp_path) -> None:
+        path = tmp_path / "cover.jpg"
+        path.write_bytes(JPEG)
+        with map_cover(path) as view:
+            assert view[:2] == b"\xff\xd8"
+            assert view.nbytes == len(JPEG)
+
+        (tmp_path / "empty.jpg").touch()
+        with map_cover(tmp_path / "empty.jpg") as view:
+            assert view.nbytes == 0
+
+
+class TestStreamedCovers:
+
+    def test_epub_cover(self, tmp_path) -> None:
+        document = epub.EpubBook()
+        document.set_identifier("id")
+        document.set_title("Cover test")
+        document.set_cover("images/cover.jpg", JPEG)
+        chapter = epub.EpubHtml(title="One", file_name="one.xhtml",
+                                content="<p>One</p>")
+        document.add_item(chapter)
+        document.spine = [chapter]
+        epub.write_epub(tmp_path / "book.epub", document)
+
+        folder = folder_factory(path=str(tmp_path))
+        book = book_factory(filename="book.epub", ext=".epub",
+                            storage_path="book.epub", folder=folder)
+        extractor = FileCoverExtractor(tmp_path)
+        book = extractor.get_format_parser(".epub")(book)
+
+        assert book.cover_path.read_bytes() == JPEG
+
+    def test_stored_cover_is_not_downloaded(self, tmp_path,
+                                            fake_openlibrary) -> None:
+        book = book_factory(cover_path=None)
+
+        fetcher = OLCoverFetcher(tmp_path, rate_limiting=1, waiting_time=0)
+        book = fetcher.fetch([book])[0]
+        assert book.cover_path.read_bytes() == JPEG
+        assert len(fake_openlibrary.calls) == 1
+
+        book.cover_path = None
+        book = fetcher.fetch([book])[0]
+        assert book.cover_path is not None
+        assert len(fake_openlibrary.calls) == 1
+
+        OLCoverFetcher(tmp_path, refresh=True).fetch([book])
+        assert len(fake_openlibrary.calls) == 2
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, headers: dict | None = None,
+                 body: bytes = b"") -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, size):
+        return [self.body[i:i + size] for i in range(0, len(self.body), size)]
+
+
+class FakeOpenLibrary:
+    """Has a cover for every ISBN but MISSING, with a fixed ETag."""
+
+    MISSING = "9780000000000"
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def get(self, url, headers=None, **kwargs):
+        headers = headers or {}
+        self.calls.append((url, headers))
+        if self.MISSING in url:
+            return FakeResponse(404)
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {"ETag": '"v1"',
+                                  "Last-Modified": "Sun, 01 Jan 2023 "
+                                                   "00:00:00 GMT"}, JPEG)
+
+
+@pytest.fixture
+def fake_openlibrary(monkeypatch):
+    fake = FakeOpenLibrary()
+    requests = types.SimpleNamespace(get=fake.get,
+                                     exceptions=cover.requests.exceptions)
+    monkeypatch.setattr(cover, "requests", requests)
+    return fake
+
+
+class TestFetchFailures:
+
+    def test_unwritable_cover_folder(self, tmp_path,
+                                     fake_openlibrary) -> None:
+        fetcher = OLCoverFetcher(tmp_path / "missing")
+        book = fetcher.fetch([book_factory(cover_path=None)])[0]
+        assert book.cover_path is None
+
+
+class TestCoverLedger:
+
+    @pytest.fixture
+    def books(self):
+        return [book_factory(cover_path=None),
+                book_factory(cover_path=None, isbn13=FakeOpenLibrary.MISSING,
+                             filename="missing.pdf")]
+
+    def test_repeat_run_makes_no_requests(self, tmp_path, books,
+                                          fake_openlibrary) -> None:
+        with CoverLedger(tmp_path / "lookups.db") as ledger:
+            books = OLCoverFetcher(tmp_path, ledger=ledger).fetch(books)
+        assert books[0].cover_path is not None
+        assert books[1].cover_path is None
+        assert len(fake_openlibrary.calls) == 2
+
+        with CoverLedger(tmp_path / "lookups.db") as ledger:
+            assert ledger.is_missing(FakeOpenLibrary.MISSING, "L")
+            OLCoverFetcher(tmp_path, ledger=ledger).fetch(books)
+        assert len(fake_openlibrary.calls) == 2
+
+    def test_refresh_is_conditional(self, tmp_path, books,
+                                    fake_openlibrary) -> None:
+        ledger = CoverLedger(tmp_path / "lookups.db")
+        OLCoverFetcher(tmp_path, ledger=ledger).fetch(books[:1])
+        path = books[0].cover_path
+        mtime = path.stat().st_mtime_ns
+
+        books[0].cover_path = None
+        OLCoverFetcher(tmp_path, refresh=True, ledger=ledger).fetch(books[:1])
+        _, headers = fake_openlibrary.calls[-1]
+        assert headers["If-None-Match"] == '"v1"'
+        assert "If-Modified-Since" in headers
+        assert books[0].cover_path == path
+        assert path.stat().st_mtime_ns == mtime
+        ledger.close()
+
+    def test_not_found_expires(self, tmp_path, books,
+                               fake_openlibrary) -> None:
+        ledger = CoverLedger(tmp_path / "lookups.db", not_found_ttl=0)
+        fetcher = OLCoverFetcher(tmp_path, ledger=ledger)
+        fetcher.fetch(books[1:])
+        fetcher.fetch(books[1:])
+        assert len(fake_openlibrary.calls) == 2
+        ledger.close()
@@ -6,7 +6,11 @@ import pickle
 from datetime import datetime
 from pathlib import Path
 from typing import Any
-from pdfshelf.database import BookDBHandler, DatabaseConnector, FolderDBHandler
+from pdfshelf.cleanup import FileCleaner
+from pdfshelf.database import (
+    BookDBHandler, DatabaseConnector, FolderDBHandler, StatsDBHandler
+)
+from pdfshelf.textstore import TextStore
 from pdfshelf.domain import Book, Folder
 from pdfshelf.config import default_document_folder
 
@@ -398,6 +402,78 @@ class TestBookDBHandlerInsert:
         assert result == None
 
 
+class TestConcurrency:
+
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        path = tmp_path / "pdfshelf.db"
+        con = sqlite3.connect(path)
+        DatabaseConnector.configure(con)
+        DatabaseConnector.create_tables(con)
+        con.close()
+        return path
+
+    def test_new_database(self, tmp_path) -> None:
+        with DatabaseConnector(tmp_path / "new.db") as con:
+            assert con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+            assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_wal_mode(self, db_path) -> None:
+        con = DatabaseConnector.connect_readonly(db_path)
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        with pytest.raises(sqlite3.OperationalError):
+            con.execute("DELETE FROM Book")
+        con.close()
+
+    def test_reader_during_write(self, db_path) -> None:
+        writer = sqlite3.connect(db_path)
+        BookDBHandler(writer).insert_books([book_factory(hash_id="a")])
+        writer.execute("BEGIN")
+        writer.execute("UPDATE Book SET title = 'Uncommitted'")
+
+        reader = DatabaseConnector.connect_readonly(db_path)
+        assert reader.execute("SELECT title FROM Book").fetchone()[0] == \
+            "TheBookTM"
+        writer.commit()
+        assert reader.execute("SELECT title FROM Book").fetchone()[0] == \
+            "Uncommitted"
+        reader.close()
+        writer.close()
+
+    def test_snapshot(self, db_path) -> None:
+        writer = sqlite3.connect(db_path)
+        handler = BookDBHandler(writer)
+        handler.insert_books([book_factory(hash_id="a", isbn13="1")])
+
+        with DatabaseConnector.snapshot(db_path) as con:
+            handler.insert_books([book_factory(hash_id="b", isbn13="2")])
+            assert con.execute("SELECT count(*) FROM Book").fetchone()[0] \
+                == 1
+
+        with DatabaseConnector.snapshot(db_path) as con:
+            assert con.execute("SELECT count(*) FROM Book").fetchone()[0] \
+                == 2
+        writer.close()
+
+    def test_insert_in_batches(self, db_path) -> None:
+        writer = sqlite3.connect(db_path)
+        books = [book_factory(hash_id=str(i), isbn13=str(i),
+                              filename=f"book_{i}.pdf") for i in range(5)]
+
+        def check(filename):
+            if filename == "book_4.pdf":
+                raise ValueError(filename)
+
+        writer.create_function("check_book", 1, check)
+        writer.execute("""CREATE TEMP TRIGGER fail BEFORE INSERT ON Book
+                          BEGIN SELECT check_book(NEW.filename); END""")
+        BookDBHandler(writer).insert_books(books, batch_size=2)
+
+        count = writer.execute("SELECT count(*) FROM Book").fetchone()[0]
+        assert count == 4
+        writer.close()
+
+
 class TestBookDBHandlerLoad:
     @pytest.mark.usefixtures("setup_db")
     def test_load_book_by_id(self, db_handler) -> None:
@@ -700,6 +776,52 @@ class TestBookDBHandlerUpdate:
         assert book.publisher == content["publisher"]
         assert res == True
 
+    @pytest.mark.usefixtures("setup_db")
+    def test_update_books(self, db_handler) -> None:
+        results = db_handler.update_books([
+            (1, {"tags": '["Python"]'}),
+            (4, {"tags": '["Python"]'}),
+            (5, {"publisher": "Packt", "year": 2021}),
+            (6, {}),
+            (7, {"geezers": 52}),
+            (9999, {"tags": '["Python"]'})
+        ])
+
+        assert results == {1: True, 4: True, 5: True, 6: False, 7: False,
+                           9999: False}
+        assert db_handler.load_book_by_id(book_id=1).tags == ["Python"]
+        assert db_handler.load_book_by_id(book_id=4).tags == ["Python"]
+        book = db_handler.load_book_by_id(book_id=5)
+        assert (book.publisher, book.year) == ("Packt", 2021)
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_update_books_protected_changes_nothing(self, db_handler) -> None:
+        title = db_handler.load_book_by_id(book_id=1).title
+        with pytest.raises(ValueError):
+            db_handler.update_books([(1, {"title": "New title"}),
+                                     (4, {"size": 1500})])
+
+        assert db_handler.load_book_by_id(book_id=1).title == title
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_update_books_failed_rows(self, db_con, db_handler) -> None:
+        # As left by insert_books.
+        db_con.isolation_level = None
+        title = db_handler.load_book_by_id(book_id=4).title
+        db_con.execute("""CREATE TRIGGER fail BEFORE UPDATE ON Book
+                          WHEN NEW.book_id = 4
+                          BEGIN SELECT RAISE(ABORT, 'failed'); END""")
+        results = db_handler.update_books([(1, {"title": "New title"}),
+                                           (4, {"title": "New title"}),
+                                           (5, {"title": "New title"}),
+                                           (6, {"tags": '["Python"]'})])
+
+        assert results == {1: True, 4: False, 5: True, 6: True}
+        assert db_handler.load_book_by_id(book_id=1).title == "New title"
+        assert db_handler.load_book_by_id(book_id=4).title == title
+        assert db_handler.load_book_by_id(book_id=5).title == "New title"
+        assert not db_con.in_transaction
+
 
 class TestBookDBHandlerDelete:
 
@@ -727,6 +849,148 @@ class TestBookDBHandlerDelete:
         assert count == 11
 
 
+def insert_duplicate(db_con, original_book_id: int, folder_id: int,
+                     cover_path: str | None = None) -> None:
+    db_con.execute(
+        """INSERT INTO Duplicate (original_book_id, filename, ext,
+                                  storage_path, folder_id, size, added_date,
+                                  hash_id, cover_path)
+           VALUES (?, 'copy.pdf', '.pdf', 'copy.pdf', ?, 1.0, '2022-01-01',
+                   'abc', ?)""",
+        (original_book_id, folder_id, cover_path)
+    )
+    db_con.commit()
+
+
+def count(db_con, table: str, where: str = "1") -> int:
+    return db_con.execute(
+        f"SELECT count(*) FROM {table} WHERE {where}"
+    ).fetchone()[0]
+
+
+class TestBulkDelete:
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_delete_books_cascades(self, db_con, db_handler, tmp_path):
+        cover = tmp_path / "cover_1.jpg"
+        cover.touch()
+        duplicate_cover = tmp_path / "cover_dup.jpg"
+        duplicate_cover.touch()
+        db_handler.update_book(1, {"cover_path": str(cover)})
+        insert_duplicate(db_con, 1, 2, str(duplicate_cover))
+        insert_duplicate(db_con, 4, 2)
+
+        assert db_handler.delete_books([1, 2, 3, 9999]) == 3
+
+        assert count(db_con, "Book") == 10
+        assert count(db_con, "Duplicate") == 1
+        assert not cover.exists()
+        assert not duplicate_cover.exists()
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_shared_cover_is_kept(self, db_handler, tmp_path):
+        cover = tmp_path / "cover.jpg"
+        cover.touch()
+        db_handler.update_books([(1, {"cover_path": str(cover)}),
+                                 (4, {"cover_path": str(cover)})])
+
+        db_handler.delete_books([1])
+        assert cover.exists()
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_soft_delete_restore_purge(self, db_con, db_handler):
+        db_handler.restore_books(range(1, 14))
+        assert db_handler.delete_books([1, 2], soft=True) == 2
+        assert count(db_con, "Book", "active == 0") == 2
+
+        assert db_handler.restore_books([2]) == 1
+        assert count(db_con, "Book", "active == 0") == 1
+
+        assert db_handler.purge_books() == 1
+        assert count(db_con, "Book") == 12
+        assert count(db_con, "Book", "book_id == 1") == 0
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_delete_folders(self, db_con, folder_db_handler):
+        insert_duplicate(db_con, 1, 2)
+        insert_duplicate(db_con, 5, 1)
+
+        assert folder_db_handler.delete_folders([2, 3]) == 2
+
+        assert count(db_con, "Folder") == 1
+        assert count(db_con, "Book", "folder_id != 1") == 0
+        # The copy in folder 2 and the one of a book in folder 2 are gone.
+        assert count(db_con, "Duplicate") == 0
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_soft_delete_folders(self, db_con, db_handler,
+                                 folder_db_handler):
+        db_handler.restore_books(range(1, 14))
+        folder_db_handler.delete_folders([2], soft=True)
+        assert count(db_con, "Book", "folder_id == 2 AND active == 1") == 0
+        assert not folder_db_handler.load_folder_by_id(2).active
+
+        folder_db_handler.restore_folders([2])
+        assert count(db_con, "Book", "folder_id == 2 AND active == 0") == 0
+
+        folder_db_handler.delete_folders([2], soft=True)
+        assert folder_db_handler.purge_folders() == 1
+        assert count(db_con, "Folder") == 2
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_restore_folder_keeps_deleted_books(self, db_con, db_handler,
+                                                folder_db_handler):
+        db_handler.restore_books(range(1, 14))
+        ids = [row[0] for row in db_con.execute(
+            "SELECT book_id FROM Book WHERE folder_id = 2 ORDER BY 1")]
+        db_handler.delete_books(ids[:1], soft=True)
+        folder_db_handler.delete_folders([2], soft=True)
+
+        folder_db_handler.restore_folders([2])
+        inactive = db_con.execute(
+            "SELECT book_id FROM Book WHERE folder_id = 2 AND active = 0")
+        assert [row[0] for row in inactive] == ids[:1]
+        assert count(db_con, "FolderDeletedBook") == 0
+
+        folder_db_handler.delete_folders([2], soft=True)
+        assert folder_db_handler.purge_folders() == 1
+        assert count(db_con, "FolderDeletedBook") == 0
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_background_cleanup(self, db_handler, tmp_path):
+        cover = tmp_path / "cover.jpg"
+        cover.touch()
+        db_handler.update_book(1, {"cover_path": str(cover)})
+        book = db_handler.load_book_by_id(1)
+        store = TextStore(tmp_path / "text", codec="zlib")
+        with store.writer(book.hash_id) as writer:
+            writer.write_page("text")
+
+        with FileCleaner(store) as cleaner:
+            db_handler.delete_books([1], cleaner=cleaner)
+
+        assert cleaner.removed == 2
+        assert not cover.exists()
+        assert not store.exists(book.hash_id)
+
+    def test_vacuum(self, tmp_path):
+        con = sqlite3.connect(tmp_path / "pdfshelf.db")
+        DatabaseConnector.create_tables(con)
+        assert con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+        con.execute("CREATE TABLE filler (data BLOB)")
+        con.executemany("INSERT INTO filler VALUES (?)",
+                        [(b"x" * 4000, )] * 200)
+        con.commit()
+        con.execute("DELETE FROM filler")
+        con.commit()
+        assert con.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+        DatabaseConnector.vacuum(con)
+        assert con.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        con.close()
+
+
 class TestFolderDBHandlerInsert:
 
     @pytest.mark.usefixtures("setup_db")
@@ -877,6 +1141,77 @@ class TestFolderDBHandlerUpdate:
             folder_db_handler.update_folder(folder_id=3,
                                             content={"folder_id": 5})
 
+    @pytest.mark.usefixtures("setup_db")
+    def test_update_folders(self, folder_db_handler) -> None:
+        results = folder_db_handler.update_folders([
+            (1, {"name": "folder-0X"}),
+            (2, {"name": "folder-0Y"}),
+            (9999, {"name": "folder-0Z"})
+        ])
+
+        assert results == {1: True, 2: True, 9999: False}
+        assert folder_db_handler.load_folder_by_id(2).name == "folder-0Y"
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_update_folders_not_null(self, folder_db_handler) -> None:
+        results = folder_db_handler.update_folders([
+            (1, {"name": "folder-0X"}),
+            (2, {"name": None}),
+            (3, {"name": "folder-0Z"})
+        ])
+
+        assert results == {1: True, 2: False, 3: True}
+        assert folder_db_handler.load_folder_by_id(2).name is not None
+        assert folder_db_handler.load_folder_by_id(3).name == "folder-0Z"
+
+
+class TestFolderDBHandlerRelocate:
+
+    @pytest.fixture
+    def moved_folder(self, tmp_path, db_con, db_handler) -> Path:
+        DatabaseConnector.create_tables(db_con)
+        old, new = tmp_path / "old", tmp_path / "new"
+        folder = folder_factory(name="books", path=str(old))
+        books = []
+        for i in range(10):
+            storage_path = f"sub/book_{i}.pdf"
+            (new / "sub").mkdir(parents=True, exist_ok=True)
+            (new / storage_path).write_bytes(b"x" * i)
+            books.append(book_factory(
+                folder=folder, filename=f"book_{i}.pdf", isbn13=None,
+                storage_path=storage_path, size=i,
+                cover_path=f"/old/covers/cover_{i}.jpg"
+            ))
+        books[0].cover_path = Path("/old/covers2/cover_0.jpg")
+        db_handler.insert_books(books)
+        return new
+
+    def test_relocate(self, db_con, folder_db_handler, db_handler,
+                      moved_folder) -> None:
+        assert folder_db_handler.relocate_folder(
+            1, moved_folder, covers=(Path("/old/covers"), Path("/new/covers"))
+        )
+        for book in db_handler.load_books():
+            assert book.get_full_path().exists()
+        covers = [row[0] for row in db_con.execute(
+            "SELECT cover_path FROM Book ORDER BY book_id")]
+        # Only paths under the old folder, not those merely starting alike.
+        assert covers[0] == "/old/covers2/cover_0.jpg"
+        assert covers[1:] == [f"/new/covers/cover_{i}.jpg"
+                              for i in range(1, 10)]
+
+    def test_relocate_files_not_there(self, folder_db_handler,
+                                      moved_folder) -> None:
+        (moved_folder / "sub" / "book_3.pdf").write_bytes(b"changed")
+        with pytest.raises(FileNotFoundError):
+            folder_db_handler.relocate_folder(1, moved_folder, sample=10)
+        assert folder_db_handler.load_folder_by_id(1).path.name == "old"
+
+        with pytest.raises(FileNotFoundError):
+            folder_db_handler.relocate_folder(1, moved_folder / "missing")
+        with pytest.raises(ValueError):
+            folder_db_handler.relocate_folder(9999, moved_folder)
+
 
 class TestFolderDBHandlerDelete:
     @pytest.mark.usefixtures("setup_db")
@@ -916,3 +1251,79 @@ class TestFolderDBHandlerDelete:
         assert success_2 == True
         assert book_count == 7
         assert folder_count == 1
+
+
+def recount(db_con, dimension: str) -> tuple[list, list]:
+    """Breakdown computed straight from Book, to check BookStats against."""
+    stats = StatsDBHandler(db_con)
+    before = stats.breakdown(dimension)
+    stats.rebuild()
+    after = stats.breakdown(dimension)
+    return before, after
+
+
+class TestStatsDBHandler:
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_summary(self, db_con) -> None:
+        books, size = db_con.execute(
+            "SELECT count(*), sum(size) FROM Book").fetchone()
+        summary = StatsDBHandler(db_con).summary()
+
+        assert summary["books"] == books
+        assert summary["bytes"] == pytest.approx(size)
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_breakdown_follows_writes(self, db_con, db_handler) -> None:
+        db_handler.insert_books([book_factory(ext=".epub", isbn13=None,
+                                              cover_path=None)])
+        db_handler.update_book(1, {"publisher": "Other"})
+        db_con.execute("UPDATE Book SET ext = '.epub', folder_id = 2 "
+                       "WHERE book_id = 6")
+        db_handler.update_books([(2, {"cover_path": None}),
+                                 (3, {"publisher": None})])
+        db_con.execute("UPDATE Book SET isbn13 = '' WHERE book_id = 7")
+        db_handler.delete_books([4, 5])
+
+        for dimension in ("ext", "publisher", "folder", "year", "lang",
+                          "confirmed", "active"):
+            before, after = recount(db_con, dimension)
+            for row in after:
+                row["bytes"] = pytest.approx(row["bytes"])
+            assert before == after
+
+        summary = StatsDBHandler(db_con).summary()
+        assert summary["books"] == count(db_con, "Book")
+        assert summary["missing_cover"] == count(
+            db_con, "Book", "coalesce(cover_path, '') = ''")
+        assert summary["missing_isbn"] == count(
+            db_con, "Book", "coalesce(isbn13, '') = ''")
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_emptied_values_are_hidden(self, db_con, db_handler) -> None:
+        stats = StatsDBHandler(db_con)
+        db_handler.insert_books([book_factory(publisher="Only One")])
+        assert "Only One" in [row["value"]
+                              for row in stats.breakdown("publisher")]
+
+        book_id = db_con.execute(
+            "SELECT max(book_id) FROM Book").fetchone()[0]
+        db_handler.delete_books([book_id])
+        assert "Only One" not in [row["value"]
+                                  for row in stats.breakdown("publisher")]
+
+    @pytest.mark.usefixtures("setup_db")
+    def test_folder_sizes(self, db_con) -> None:
+        rows = StatsDBHandler(db_con).folder_sizes()
+        expected = db_con.execute(
+            """SELECT folder_id, count(*) FROM Book
+               WHERE folder_id IN (SELECT folder_id FROM Folder)
+               GROUP BY folder_id""").fetchall()
+
+        assert {row["folder_id"]: row["books"] for row in rows} == \
+            {row[0]: row[1] for row in expected}
+
+    def test_unknown_dimension(self, db_con) -> None:
+        DatabaseConnector.create_tables(db_con)
+        with pytest.raises(ValueError):
+            StatsDBHandler(db_con).breakdown("title")
@@ -0,0 +1,114 @@
+import os
+import json
+import pickle
+import sqlite3
+import pytest
+from pathlib import Path
+from pdfshelf.database import DatabaseConnector, StatsDBHandler
+from pdfshelf.export import (
+    export_library, import_library, available_formats, TABLES
+)
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def target():
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    DatabaseConnector.create_tables(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def source(rootdir):
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    DatabaseConnector.create_tables(con)
+    with open(Path(rootdir) / "test_data" / "dummy_data.pkl", "rb") as inp:
+        data = pickle.load(inp)
+
+    for book in data["books"]:
+        values = """NULL, :title, :authors, :year, :lang, :filename, :ext,
+                    :storage_path, :folder_id, :size, :tags, :added_date,
+                    :hash_id, :publisher, :isbn13, :parsed_isbn, :active,
+                    :confirmed, :cover_path"""
+        con.execute(f"INSERT INTO Book VALUES({values})", book)
+    for folder in data["folders"]:
+        values = "NULL, :name, :path, :added_date, :active"
+        con.execute(f"INSERT INTO Folder VALUES({values})", folder)
+    con.execute("""INSERT INTO Duplicate
+                   SELECT book_id, title, authors, year, lang, filename, ext,
+                          storage_path, folder_id, size, tags, added_date,
+                          hash_id || '-dup', publisher, isbn13, parsed_isbn,
+                          cover_path
+                   FROM Book WHERE book_id = 1""")
+    con.commit()
+    yield con
+    con.close()
+
+
+def dump(con: sqlite3.Connection) -> dict[str, list[tuple]]:
+    return {table: [tuple(row) for row in
+                    con.execute(f"SELECT * FROM {table} ORDER BY rowid")]
+            for table in TABLES}
+
+
+class TestExportImport:
+
+    @pytest.mark.parametrize("fmt", ["jsonl", "parquet", "arrow"])
+    def test_round_trip(self, source, target, tmp_path, fmt) -> None:
+        if fmt not in available_formats():
+            pytest.skip("pyarrow is not installed")
+
+        counts = export_library(source, tmp_path, fmt, chunk_rows=4)
+        assert counts["Book"] == 13
+        assert not list(tmp_path.glob("*.tmp"))
+
+        seen = []
+        assert import_library(
+            target, tmp_path, chunk_rows=4,
+            on_progress=lambda t, n: seen.append(n)
+        ) == counts
+        assert max(seen) == 4
+        assert dump(target) == dump(source)
+        assert StatsDBHandler(target).summary() == \
+            StatsDBHandler(source).summary()
+
+    def test_jsonl_is_one_object_per_row(self, source, tmp_path) -> None:
+        export_library(source, tmp_path, "jsonl")
+        lines = (tmp_path / "Book.jsonl").read_text().splitlines()
+        assert len(lines) == 13
+        assert json.loads(lines[0])["book_id"] == 1
+
+    def test_import_refuses_non_empty(self, source, tmp_path) -> None:
+        export_library(source, tmp_path, "jsonl")
+        with pytest.raises(ValueError):
+            import_library(source, tmp_path)
+
+        source.execute("UPDATE Book SET title = 'Changed'")
+        source.commit()
+        import_library(source, tmp_path, replace=True)
+        assert source.execute("SELECT count(*) FROM Book "
+                              "WHERE title = 'Changed'").fetchone()[0] == 0
+
+    def test_failed_import_rolls_back(self, source, target, tmp_path) -> None:
+        export_library(source, tmp_path, "jsonl")
+        with open(tmp_path / "Duplicate.jsonl", "a") as file:
+            file.write(json.dumps({"original_book_id": 1}) + "\n")
+
+        with pytest.raises(sqlite3.IntegrityError):
+            import_library(target, tmp_path)
+        assert target.execute("SELECT count(*) FROM Book").fetchone()[0] == 0
+
+        # The statistics triggers are back after the rollback.
+        target.execute("""INSERT INTO Book (filename, ext, storage_path,
+                          folder_id, size, added_date, hash_id, active,
+                          confirmed)
+                          VALUES ('a', '.pdf', 'a', 1, 10, '2023', 'h', 1,
+                                  0)""")
+        assert StatsDBHandler(target).summary()["books"] == 1
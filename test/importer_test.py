@@ -3,7 +3,10 @@ import pytest
 from typing import Any
 from pathlib import Path
 from isbnlib import ISBNLibException
-from pdfshelf.importer import BookImporter, MetadataFetcher, ISBNParser
+from pdfshelf.importer import (
+    BookImporter, MetadataFetcher, ISBNParser, ParseContext
+)
+from pdfshelf.domain import ParseStatus
 from pdfshelf.exceptions import FormatNotSupportedError
 
 
@@ -115,6 +118,21 @@ class TestBookImporter:
         with pytest.raises(FormatNotSupportedError):
             importer.import_from_file(Path(tmp_file))
 
+    def test_failures_are_recorded(self, rootdir) -> None:
+        fetcher = MockMetadataFetcher()
+        parser = ISBNParser()
+        importer = BookImporter(fetcher, parser)
+
+        importer.import_from_file(
+            Path(rootdir) / "test_data" / "corrupted.pdf"
+        )
+        importer.import_from_file(
+            Path(rootdir) / "test_data" / "think_python_2_no_isbn.pdf"
+        )
+
+        statuses = [failure.status for failure in importer.failures]
+        assert statuses == [ParseStatus.CORRUPTED, ParseStatus.NO_ISBN]
+
 
 class TestPDFISBNParser:
     def test_get_book_from_file_pdf_isbn13(self, rootdir) -> None:
@@ -234,6 +252,16 @@ class TestEPUBISBNParser:
         assert book.ext == ".epub"
         assert book.parsed_isbn == expected_isbn
 
+    def test_epub_without_identifier(self) -> None:
+        class NoIdentifierEpub:
+            def get_metadata(self, namespace, name):
+                return []
+
+        parser = ISBNParser()
+        ctx = ParseContext(filepath=Path("book.epub"),
+                           document=NoIdentifierEpub())
+        assert parser._epub_identifier_step(ctx) == ("", "")
+
     def test_get_book_from_file_api_failed(self, rootdir, mocker) -> None:
         test_file = os.path.join(
             rootdir, 'test_data/how_to_code_in_python_isbn13.pdf')
@@ -0,0 +1,132 @@
+import sqlite3
+import zipfile
+import pytest
+from datetime import datetime
+from pathlib import Path
+from pdfshelf.database import BookDBHandler, DatabaseConnector
+from pdfshelf.domain import Book, Folder
+from pdfshelf.integrity import Finding, IntegrityChecker, file_checksum
+
+
+def make_book(folder: Path, name: str, content: bytes) -> Book:
+    path = folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return Book.from_raw_data({
+        "title": name, "authors": [], "year": None, "lang": None,
+        "publisher": None, "isbn13": None, "parsed_isbn": None,
+        "folder": Folder.from_raw_data({
+            "name": folder.name, "path": folder,
+            "added_date": datetime.now(), "folder_id": None, "active": True
+        }),
+        "filename": path.name, "ext": path.suffix,
+        "storage_path": path.relative_to(folder), "size": len(content),
+        "tags": [], "cover_path": None, "book_id": None, "hash_id": None,
+        "added_date": datetime.now(), "active": True, "confirmed": False
+    })
+
+
+@pytest.fixture
+def library(tmp_path):
+    folder = tmp_path / "books"
+    books = [make_book(folder, f"book_{i}.pdf", f"content {i}".encode())
+             for i in range(5)]
+    with DatabaseConnector(tmp_path / "pdfshelf.db") as con:
+        BookDBHandler(con).insert_books(books)
+        yield con, folder
+
+
+def findings(con: sqlite3.Connection) -> list[tuple]:
+    return [tuple(row) for row in con.execute(
+        "SELECT book_id, finding FROM IntegrityFinding ORDER BY book_id")]
+
+
+class TestIntegrityChecker:
+
+    def test_clean_library(self, library) -> None:
+        con, _ = library
+        assert IntegrityChecker(con, content_hash=True,
+                                batch_size=2).check() == []
+        checksums = con.execute("SELECT count(*) FROM BookChecksum")
+        assert checksums.fetchone()[0] == 5
+
+    def test_missing_changed_and_cover(self, library, tmp_path) -> None:
+        con, folder = library
+        progress = []
+        checker = IntegrityChecker(con, content_hash=True, relink=False,
+                                   batch_size=2, on_progress=progress.append)
+        checker.check()
+
+        (folder / "book_0.pdf").unlink()
+        (folder / "book_1.pdf").write_bytes(b"cut")
+        # Same size, other content: only the checksum sees it.
+        (folder / "book_2.pdf").write_bytes(b"CONTENT 2")
+        con.execute("UPDATE Book SET cover_path = ? WHERE book_id = 4",
+                    (str(tmp_path / "cover_4.jpg"), ))
+        con.commit()
+
+        issues = checker.check()
+        assert [(i.book_id, i.finding) for i in issues] == [
+            (1, Finding.MISSING), (2, Finding.CHANGED),
+            (3, Finding.CHANGED), (4, Finding.COVER_MISSING)]
+        assert issues[1].actual_size == len(b"cut")
+        assert sum(progress) == 10
+        assert findings(con) == [(1, "missing"), (2, "changed"),
+                                 (3, "changed"), (4, "cover_missing")]
+        assert checker.load_findings() == issues
+
+        # Without content hashes, only the size is compared.
+        issues = IntegrityChecker(con, relink=False).check()
+        assert [i.book_id for i in issues] == [1, 2, 4]
+
+    def test_relink_by_checksum(self, library, tmp_path) -> None:
+        con, folder = library
+        IntegrityChecker(con, content_hash=True).check()
+        other = tmp_path / "other"
+        make_book(other, "renamed/moved.pdf", b"content 0")
+        con.execute("""INSERT INTO Folder (name, path, added_date, active)
+                       VALUES ('other', ?, '2024-01-01', 1)""", (str(other), ))
+        con.commit()
+        (folder / "book_0.pdf").unlink()
+
+        issue, = IntegrityChecker(con).check()
+        assert issue.finding == Finding.RELINKED
+        assert issue.new_path == other / "renamed" / "moved.pdf"
+        book = BookDBHandler(con).load_book_by_id(1)
+        assert book.get_full_path() == issue.new_path
+        assert IntegrityChecker(con).check() == []
+
+    def test_relink_by_name(self, library) -> None:
+        con, folder = library
+        (folder / "sub").mkdir()
+        (folder / "book_1.pdf").rename(folder / "sub" / "book_1.pdf")
+        # Same size and no checksum, but another name: not relinked.
+        (folder / "book_2.pdf").rename(folder / "sub" / "book_9.pdf")
+
+        issues = IntegrityChecker(con).check()
+        assert [(i.book_id, i.finding) for i in issues] == [
+            (2, Finding.RELINKED), (3, Finding.MISSING)]
+
+    def test_archived_books(self, library) -> None:
+        con, folder = library
+        IntegrityChecker(con, content_hash=True).check()
+        with zipfile.ZipFile(folder / "set.zip", "w") as zf:
+            for name in ("book_3.pdf", "book_4.pdf"):
+                zf.write(folder / name, f"old/{name}")
+                (folder / name).unlink()
+
+        issues = IntegrityChecker(con, content_hash=True).check()
+        assert [(i.book_id, i.finding, i.new_path) for i in issues] == [
+            (4, Finding.RELINKED, folder / "set.zip" / "old" / "book_3.pdf"),
+            (5, Finding.RELINKED, folder / "set.zip" / "old" / "book_4.pdf")]
+        assert IntegrityChecker(con, content_hash=True).check() == []
+
+    def test_deleted_books(self, library) -> None:
+        con, folder = library
+        (folder / "book_0.pdf").unlink()
+        IntegrityChecker(con, content_hash=True).check()
+        con.execute("DELETE FROM Book WHERE book_id = 1")
+        con.commit()
+        assert findings(con) == []
+        assert file_checksum(folder / "book_1.pdf") == con.execute(
+            "SELECT sha256 FROM BookChecksum WHERE book_id = 2").fetchone()[0]
@@ -0,0 +1,114 @@
+import gzip
+import json
+import sqlite3
+import pytest
+from pdfshelf.importer import MetadataFetcher
+from pdfshelf.isbnindex import ISBNIndex, normalize_isbn
+
+EDITIONS = [
+    {"key": "/books/OL1M", "title": "No Starch Python",
+     "subtitle": "A Crash Course", "isbn_10": ["1593275994"],
+     "publishers": ["No Starch Press"], "publish_date": "November 2015",
+     "languages": [{"key": "/languages/eng"}],
+     "authors": [{"key": "/authors/OL1A"}]},
+    {"key": "/books/OL2M", "title": "Le Petit Prince",
+     "isbn_13": ["978-2-07-040850-4"], "publish_date": "1999",
+     "languages": [{"key": "/languages/fre"}],
+     "by_statement": "Antoine de Saint-Exupéry"},
+    {"key": "/books/OL3M", "title": "No ISBN"},
+]
+AUTHORS = [{"key": "/authors/OL1A", "name": "Eric Matthes"}]
+
+
+def write_dump(path, records, record_type):
+    with gzip.open(path, "wt", encoding="utf-8") as dump:
+        for record in records:
+            dump.write(f"{record_type}\t{record['key']}\t1\t2023-01-01\t"
+                       f"{json.dumps(record)}\n")
+        dump.write("not json\n")
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    editions = write_dump(tmp_path / "editions.txt.gz", EDITIONS,
+                          "/type/edition")
+    authors = write_dump(tmp_path / "authors.txt.gz", AUTHORS,
+                         "/type/author")
+    index = ISBNIndex.build(editions, tmp_path / "isbn.db", authors)
+    yield index
+    index.close()
+
+
+class TestISBNIndex:
+
+    def test_build(self, index, tmp_path) -> None:
+        assert len(index) == 2
+        assert not (tmp_path / "isbn.db.tmp").exists()
+
+    def test_lookup(self, index) -> None:
+        metadata = index.lookup("9781593275990")
+        assert metadata == {
+            "ISBN-13": "9781593275990",
+            "Title": "No Starch Python: A Crash Course",
+            "Authors": ["Eric Matthes"], "Publisher": "No Starch Press",
+            "Language": "en", "Year": "2015"
+        }
+        assert index.lookup("1593275994") == metadata
+
+        metadata = index.lookup("2070408507")
+        assert metadata["Authors"] == ["Antoine de Saint-Exupéry"]
+        assert metadata["Language"] == "fr"
+        assert index.lookup("9780000000002") is None
+        assert index.lookup("garbage") is None
+
+    def test_jsonl(self, tmp_path) -> None:
+        path = tmp_path / "editions.jsonl"
+        path.write_text("\n".join(json.dumps(e) for e in EDITIONS))
+        with ISBNIndex.build(path, tmp_path / "isbn.db") as index:
+            assert index.lookup("1593275994")["Authors"] == []
+
+    def test_many_authors(self, tmp_path, monkeypatch) -> None:
+        connect = sqlite3.connect
+
+        def old_build_connect(*args, **kwargs):
+            con = connect(*args, **kwargs)
+            con.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            return con
+
+        # More author keys in one batch than older SQLite builds have
+        # bound variables.
+        monkeypatch.setattr(sqlite3, "connect", old_build_connect)
+        authors = [{"key": f"/authors/OL{i}A", "name": f"Author {i}"}
+                   for i in range(1200)]
+        edition = {**EDITIONS[0],
+                   "authors": [{"key": a["key"]} for a in authors]}
+        editions = write_dump(tmp_path / "editions.txt.gz", [edition],
+                              "/type/edition")
+        dump = write_dump(tmp_path / "authors.txt.gz", authors,
+                          "/type/author")
+        with ISBNIndex.build(editions, tmp_path / "isbn.db", dump) as index:
+            assert len(index.lookup("1593275994")["Authors"]) == 1200
+
+    def test_normalize_isbn(self) -> None:
+        assert normalize_isbn("1-59327-599-4") == 9781593275990
+        assert normalize_isbn("123") is None
+
+
+class TestMetadataFetcherOffline:
+
+    def test_index_first(self, index, monkeypatch) -> None:
+        def meta(isbn):
+            raise AssertionError("network used")
+
+        monkeypatch.setattr("pdfshelf.importer.isbnlib.meta", meta)
+        fetcher = MetadataFetcher(index)
+        metadata, found = fetcher.from_isbn("1593275994", "")
+        assert found
+        assert metadata["parsed_isbn"] == "1593275994"
+
+    def test_offline_only(self, index, monkeypatch) -> None:
+        monkeypatch.setattr("pdfshelf.importer.isbnlib.meta",
+                            lambda isbn: pytest.fail("network used"))
+        fetcher = MetadataFetcher(index, offline=True)
+        assert fetcher.from_isbn("", "9780000000002") == ({}, False)
@@ -0,0 +1,72 @@
+import json
+import logging
+import threading
+import pytest
+from types import SimpleNamespace
+from pdfshelf import log
+
+
+class ThreadName:
+    """Formats as the name of the thread that formats it."""
+
+    def __str__(self) -> str:
+        return threading.current_thread().name
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(log, "get_config",
+                        lambda: SimpleNamespace(config_folder=tmp_path))
+    root = logging.getLogger()
+    level = root.level
+    yield tmp_path
+    log.stop_logging()
+    root.setLevel(level)
+    logging.getLogger("pdfshelf").propagate = True
+
+
+class TestSetupLogging:
+
+    def test_queued_records(self, folder) -> None:
+        listener = log.setup_logging()
+        assert log.setup_logging() is listener
+        logger = logging.getLogger("pdfshelf.test")
+        # The library's NullHandler and one queue handler.
+        assert len(logging.getLogger("pdfshelf").handlers) == 2
+
+        logger.debug("[TEST] %s", ThreadName())
+        log.stop_logging()
+        assert all(isinstance(handler, logging.NullHandler) for handler
+                   in logging.getLogger("pdfshelf").handlers)
+        line = (folder / "pdfshelf.log").read_text()
+        assert "[TEST]" in line
+        # Formatted by the listener, not by the logging thread.
+        assert threading.current_thread().name not in line
+
+    def test_json(self, folder) -> None:
+        log.setup_logging(json_format=True)
+        logger = logging.getLogger("pdfshelf.test")
+        logger.info("%s books", 3)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.error("failed", exc_info=True)
+        log.stop_logging()
+
+        lines = (folder / "pdfshelf.log").read_text().splitlines()
+        first, second = map(json.loads, lines)
+        assert first["message"] == "3 books"
+        assert first["level"] == "INFO"
+        assert first["logger"] == "pdfshelf.test"
+        assert "ValueError: boom" in second["exception"]
+
+    def test_dependencies(self, folder) -> None:
+        log.setup_logging(dependencies=True)
+        logging.getLogger("pdfshelf.test").info("ours")
+        logging.getLogger("urllib3").info("theirs")
+        log.stop_logging()
+
+        ours = (folder / "pdfshelf.log").read_text()
+        theirs = (folder / "pdfshelf_dependencies.log").read_text()
+        assert "ours" in ours and "theirs" not in ours
+        assert "theirs" in theirs and "ours" not in theirs
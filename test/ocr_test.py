@@ -0,0 +1,163 @@
+import pytest
+import zipfile
+import multiprocessing
+from pathlib import Path
+from PIL import Image
+from pdfshelf.cover import FileCoverExtractor
+from pdfshelf.domain import Book, ParseStatus
+from pdfshelf.importer import BookImporter, MetadataFetcher, ISBNParser
+from pdfshelf.ocr import OCRBackend, OCRStage, candidate_pages
+
+
+class MockMetadataFetcher(MetadataFetcher):
+    def __init__(self):
+        pass
+
+    def from_isbn(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        return {"parsed_isbn": isbn13 or isbn10 or None}, True
+
+
+class WidthOCRBackend(OCRBackend):
+    """Reads an ISBN only from images of a given width."""
+
+    def __init__(self, width: int):
+        self.width = width
+
+    def image_to_text(self, image: Image.Image) -> str:
+        if image.size[0] == self.width:
+            return "Copyright 2020\nISBN 978-0-9997730-1-7"
+        return "Chapter 1"
+
+
+class FailingOCRBackend(OCRBackend):
+    def image_to_text(self, image: Image.Image) -> str:
+        raise RuntimeError("tesseract crashed")
+
+
+def fake_convert_from_path(filepath, dpi=200, first_page=1, last_page=1,
+                           grayscale=False):
+    # 10 pixels wide per page number at 150 DPI.
+    return [Image.new("L" if grayscale else "RGB",
+                      (round(first_page * dpi / 15), 10))]
+
+
+@pytest.fixture
+def scanned_pdf(tmp_path):
+    path = tmp_path / "scanned_book.pdf"
+    pages = [Image.new("RGB", (100, 150), "white") for _ in range(8)]
+    pages[0].save(path, "PDF", save_all=True, append_images=pages[1:])
+    return path
+
+
+@pytest.fixture
+def cover_extractor(tmp_path):
+    cover_folder = tmp_path / "cover"
+    cover_folder.mkdir()
+    return FileCoverExtractor(cover_folder)
+
+
+@pytest.fixture
+def fork(mocker):
+    # Patches are inherited by forked pool workers.
+    mocker.patch("pdfshelf.ocr.pdf2image.convert_from_path",
+                 side_effect=fake_convert_from_path)
+    mocker.patch("pdfshelf.ocr.pdf2image.convert_from_bytes",
+                 side_effect=fake_convert_from_path)
+    return multiprocessing.get_context("fork")
+
+
+class TestOCRStage:
+
+    def test_candidate_pages(self) -> None:
+        assert candidate_pages(100, 4, 2) == [1, 2, 3, 4, 99, 100]
+        assert candidate_pages(3, 4, 2) == [1, 2, 3]
+        assert candidate_pages(0, 4, 2) == []
+
+    def test_scanned_pdf_has_no_text(self, scanned_pdf) -> None:
+        result = ISBNParser().parse(scanned_pdf)
+        assert result.status == ParseStatus.NO_TEXT
+
+    def test_import_with_ocr(self, scanned_pdf, cover_extractor,
+                             fork) -> None:
+        with OCRStage(WidthOCRBackend(30), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            importer = BookImporter(MockMetadataFetcher(), ISBNParser(), ocr)
+            book = importer.import_from_file(scanned_pdf)
+
+        assert book.parsed_isbn == "978-0-9997730-1-7"
+        assert importer.failures == []
+
+    def test_archive_member(self, scanned_pdf, cover_extractor,
+                            fork) -> None:
+        archive = scanned_pdf.with_name("scans.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.write(scanned_pdf, "scans/scanned_book.pdf")
+
+        with OCRStage(WidthOCRBackend(30), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            result = ocr.parse(archive / "scans" / "scanned_book.pdf")
+
+        assert result.status == ParseStatus.OK
+        assert result.isbn13 == "978-0-9997730-1-7"
+
+    def test_ocr_without_isbn(self, scanned_pdf, cover_extractor,
+                              fork) -> None:
+        with OCRStage(WidthOCRBackend(1000), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            result = ocr.parse(scanned_pdf)
+
+        assert result.status == ParseStatus.NO_ISBN
+
+    def test_reuses_cover_rasterization(self, scanned_pdf, cover_extractor,
+                                        fork) -> None:
+        cover_path = cover_extractor.get_pdf_cover_path(
+            Book.hash_filename(scanned_pdf.name)
+        )
+        Image.new("RGB", (200, 200)).save(cover_path, "JPEG")
+
+        # Read at the OCR resolution: 200 pixels at COVER_DPI are 150.
+        with OCRStage(WidthOCRBackend(150), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            result = ocr.parse(scanned_pdf)
+
+        assert result.status == ParseStatus.OK
+        assert result.isbn13 == "978-0-9997730-1-7"
+
+    def test_hands_page_one_to_cover_extractor(
+        self, scanned_pdf, cover_extractor, fork, mocker
+    ) -> None:
+        with OCRStage(WidthOCRBackend(30), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            importer = BookImporter(MockMetadataFetcher(), ISBNParser(), ocr)
+            book = importer.import_from_file(scanned_pdf)
+
+        render = mocker.patch("pdfshelf.cover.pdf2image.convert_from_path",
+                              side_effect=fake_convert_from_path)
+        extract = cover_extractor.get_format_parser(".pdf")
+        book = extract(book)
+        assert render.call_count == 0
+        with Image.open(book.cover_path) as cover:
+            # Rendered at COVER_DPI, in color.
+            assert cover.size == (13, 10)
+            assert cover.mode == "RGB"
+
+        # Only handed over once: later extractions render page one.
+        extract(book)
+        assert render.call_count == 1
+
+    def test_no_cover_without_extractor(self, scanned_pdf, tmp_path,
+                                        fork) -> None:
+        with OCRStage(WidthOCRBackend(30), mp_context=fork) as ocr:
+            assert ocr.parse(scanned_pdf).status == ParseStatus.OK
+        assert sorted(path.name for path in tmp_path.iterdir()) == \
+            ["scanned_book.pdf"]
+
+    def test_backend_error(self, scanned_pdf, cover_extractor, fork) -> None:
+        with pytest.raises(TypeError):
+            OCRBackend()
+        with OCRStage(FailingOCRBackend(), cover_extractor=cover_extractor,
+                      mp_context=fork) as ocr:
+            result = ocr.parse(scanned_pdf)
+
+        assert result.status == ParseStatus.ERROR
+        assert "RuntimeError" in result.message
@@ -0,0 +1,123 @@
+import json
+import sqlite3
+import pytest
+from datetime import datetime
+from pathlib import Path
+from xml.etree import ElementTree
+from pdfshelf.database import DatabaseConnector, BookDBHandler
+from pdfshelf.domain import Book, Folder
+from pdfshelf.opds import OPDSCatalog, ATOM_ACQUISITION
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+
+
+def make_book(i: int, authors: list[str], publisher: str = "Pub",
+              tags: list[str] | None = None) -> Book:
+    return Book(
+        title=f"Book {i:03}", authors=authors, year=2000 + i % 3, lang="en",
+        publisher=publisher, isbn13=None, parsed_isbn=None,
+        folder=Folder(name="books", path=Path("/books")),
+        filename=f"book_{i}.pdf", ext=".pdf",
+        storage_path=Path(f"book_{i}.pdf"), size=1000.0,
+        tags=tags or [], cover_path=None, added_date=datetime(2023, 1, 1, 0, i)
+    )
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    DatabaseConnector.create_tables(con)
+    BookDBHandler(con).insert_books(
+        [make_book(i, ["Plato"] if i % 2 else ["Aristotle", "Plato"],
+                   tags=["philosophy"]) for i in range(7)]
+    )
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def catalog(con):
+    catalog = OPDSCatalog(con, page_size=3)
+    catalog.refresh()
+    return catalog
+
+
+def entry_titles(atom: bytes) -> list[str]:
+    feed = ElementTree.fromstring(atom)
+    return [entry.find(f"{ATOM}title").text
+            for entry in feed.findall(f"{ATOM}entry")]
+
+
+class TestOPDSCatalog:
+
+    def test_navigation(self, catalog) -> None:
+        root = catalog.get_page("")
+        assert "Authors" in entry_titles(root.atom)
+
+        assert entry_titles(catalog.get_page("authors").atom) == [
+            "Aristotle (4)", "Plato (7)"
+        ]
+        page = catalog.get_page("author/Aristotle")
+        assert page.atom_type == ATOM_ACQUISITION
+        assert entry_titles(page.atom) == ["Book 000", "Book 002", "Book 004"]
+        assert catalog.get_page("author/Aristotle/2") is not None
+
+    def test_pagination_links(self, catalog) -> None:
+        feed = ElementTree.fromstring(catalog.get_page("all/2").atom)
+        links = {link.get("rel"): link.get("href")
+                 for link in feed.findall(f"{ATOM}link")}
+        assert links["previous"] == "/opds/all"
+        assert links["next"] == "/opds/all/3"
+        assert catalog.get_page("all/4") is None
+
+    def test_opds2(self, catalog) -> None:
+        data = json.loads(catalog.get_page("author/Plato").json)
+        assert len(data["publications"]) == 3
+        assert data["publications"][0]["metadata"]["author"] == [
+            "Aristotle", "Plato"
+        ]
+        assert data["publications"][0]["links"][0]["type"] == \
+            "application/pdf"
+
+    def test_no_change_renders_nothing(self, catalog) -> None:
+        assert catalog.refresh() == 0
+
+    def test_update_only_renders_touched_pages(self, con, catalog) -> None:
+        untouched = catalog.get_page("author/Aristotle")
+        con.execute("UPDATE Book SET publisher = 'Other' WHERE book_id = 7")
+        con.commit()
+
+        rendered = catalog.refresh()
+        # The pages listing the book: all/3, new, author/Aristotle/2,
+        # author/Plato/3, tag/philosophy/3, year/2000 and publisher/Other;
+        # the publishers index (counts) and publisher/Pub/2 (lost its next
+        # link, as the Pub/3 page went away).
+        assert rendered == 9
+        assert catalog.get_page("author/Aristotle") is untouched
+        assert entry_titles(catalog.get_page("publisher/Other").atom) == [
+            "Book 006"
+        ]
+
+    def test_delete_drops_empty_pages(self, con, catalog) -> None:
+        con.execute("DELETE FROM Book WHERE authors LIKE '%Aristotle%'")
+        con.commit()
+        catalog.refresh()
+
+        assert catalog.get_page("author/Aristotle") is None
+        assert catalog.get_page("author/Aristotle/2") is None
+        assert entry_titles(catalog.get_page("authors").atom) == [
+            "Plato (3)"
+        ]
+        assert len(entry_titles(catalog.get_page("all").atom)) == 3
+        assert catalog.get_page("all/2") is None
+
+    def test_encoded_values(self, con, catalog) -> None:
+        BookDBHandler(con).insert_books(
+            [make_book(50, ["Ana Maria / São"], publisher="A&B")]
+        )
+        catalog.refresh()
+
+        assert catalog.get_page("author/Ana%20Maria%20%2F%20S%C3%A3o")
+        assert catalog.get_page("publisher/A%26B")
+        assert b"A&amp;B" in catalog.get_page("publishers").atom
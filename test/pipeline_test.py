@@ -0,0 +1,172 @@
+import time
+import asyncio
+import sqlite3
+import pytest
+from pathlib import Path
+from pdfshelf.cover import BookCover
+from pdfshelf.database import DatabaseConnector
+from pdfshelf.domain import Book, ParseStatus
+from pdfshelf.importer import BookImporter, MetadataFetcher, ISBNParser
+from pdfshelf.pipeline import ImportPipeline
+from pdfshelf.scanner import ScannedFile
+
+
+class MockMetadataFetcher(MetadataFetcher):
+    def __init__(self):
+        pass
+
+    def from_isbn(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        return {"Title": "Mocking a PDF", "ISBN-13": None}, True
+
+
+class MockISBNParser(ISBNParser):
+    def __init__(self):
+        pass
+
+    def _epub_parser(self, filepath: Path) -> tuple[str, str]:
+        return "", ""
+
+    def _pdf_parser(self, filepath: Path) -> tuple[str, str]:
+        return "", ""
+
+
+class SlowISBNParser(MockISBNParser):
+    def _pdf_parser(self, filepath: Path) -> tuple[str, str]:
+        time.sleep(0.02)
+        return "", ""
+
+
+class BrokenMetadataFetcher(MockMetadataFetcher):
+    def from_isbn(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        raise RuntimeError("unexpected response")
+
+
+class MockBookCover(BookCover):
+    def __init__(self):
+        self.batches = []
+
+    async def async_get_cover_for_books(self, books: list[Book]) -> list[Book]:
+        self.batches.append(len(books))
+        for book in books:
+            book.cover_path = Path(f"/covers/{book.hash_id}.jpg")
+        return books
+
+
+@pytest.fixture
+def library(tmp_path):
+    folder = tmp_path / "library"
+    (folder / "sub").mkdir(parents=True)
+    for i in range(10):
+        (folder / f"book_{i}.pdf").write_bytes(b"x" * i)
+    (folder / "sub" / "other.epub").write_bytes(b"epub")
+    (folder / "notes.txt").write_text("not a book")
+    return folder
+
+
+@pytest.fixture
+def importer():
+    return BookImporter(MockMetadataFetcher(), MockISBNParser())
+
+
+class TestImportPipeline:
+
+    def test_import_from_folder(self, library, importer) -> None:
+        pipeline = ImportPipeline(importer, parse_workers=2, queue_size=2)
+        books = asyncio.run(pipeline.import_from_folder(library))
+
+        assert len(books) == 11
+        assert all(book.title == "Mocking a PDF" for book in books)
+        assert {book.ext for book in books} == {".pdf", ".epub"}
+
+    def test_keeps_input_order(self, library, importer) -> None:
+        files = [ScannedFile(path=library / f"book_{i}.pdf", size=i)
+                 for i in range(10)]
+        folder = {"name": "library", "path": library}
+        pipeline = ImportPipeline(importer, parse_workers=4, fetch_workers=4)
+        books = asyncio.run(pipeline.import_files(files, folder))
+
+        assert [book.filename for book in books] == [
+            f"book_{i}.pdf" for i in range(10)
+        ]
+        assert [book.size for book in books] == list(range(10))
+
+    def test_fetch_errors_are_recorded(self, library) -> None:
+        importer = BookImporter(BrokenMetadataFetcher(), MockISBNParser())
+        pipeline = ImportPipeline(importer, parse_workers=2, fetch_workers=2,
+                                  queue_size=2)
+        books = asyncio.run(asyncio.wait_for(
+            pipeline.import_from_folder(library), 30))
+
+        assert len(books) == 11
+        assert all(book.title is None for book in books)
+        errors = [failure for failure in importer.failures
+                  if failure.status == ParseStatus.ERROR]
+        assert len(errors) == 11
+        assert "RuntimeError" in errors[0].message
+
+    def test_missing_folder(self, importer, tmp_path) -> None:
+        pipeline = ImportPipeline(importer)
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(pipeline.import_from_folder(tmp_path / "missing"))
+
+    def test_cover_stage(self, library, importer) -> None:
+        bookcover = MockBookCover()
+        pipeline = ImportPipeline(importer, bookcover, cover_batch_size=4)
+        books = asyncio.run(pipeline.import_from_folder(library))
+
+        assert all(book.cover_path is not None for book in books)
+        assert sum(bookcover.batches) == 11
+        assert max(bookcover.batches) <= 4
+
+    def test_writer_stage(self, library, importer, tmp_path) -> None:
+        db_path = tmp_path / "pdfshelf.db"
+
+        def connect():
+            con = sqlite3.connect(db_path)
+            con.row_factory = sqlite3.Row
+            DatabaseConnector.create_tables(con)
+            return con
+
+        pipeline = ImportPipeline(importer, connect=connect,
+                                  write_batch_size=3)
+
+        async def run_inside_loop():
+            return await pipeline.import_from_folder(library)
+
+        books = asyncio.run(run_inside_loop())
+
+        con = sqlite3.connect(db_path)
+        book_count = con.execute("SELECT count(*) FROM Book").fetchone()[0]
+        con.close()
+        assert len(books) == 11
+        assert book_count == 11
+
+    def test_partial_batches_are_committed(self, library, tmp_path) -> None:
+        db_path = tmp_path / "pdfshelf.db"
+
+        def connect():
+            con = sqlite3.connect(db_path)
+            con.row_factory = sqlite3.Row
+            DatabaseConnector.configure(con)
+            DatabaseConnector.create_tables(con)
+            return con
+
+        connect().close()
+        reader = DatabaseConnector.connect_readonly(db_path,
+                                                    check_same_thread=False)
+        seen = []
+
+        def on_progress(book):
+            seen.append(
+                reader.execute("SELECT count(*) FROM Book").fetchone()[0]
+            )
+
+        importer = BookImporter(MockMetadataFetcher(), SlowISBNParser())
+        pipeline = ImportPipeline(importer, connect=connect, parse_workers=1,
+                                  write_batch_size=100, write_interval=0.05,
+                                  on_progress=on_progress)
+        asyncio.run(pipeline.import_from_folder(library))
+        reader.close()
+
+        assert seen[-1] == 11
+        assert seen[0] < 11
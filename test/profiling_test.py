@@ -0,0 +1,65 @@
+import time
+import pstats
+import asyncio
+import pytest
+from types import SimpleNamespace
+from pdfshelf import profiling
+from pdfshelf.profiling import profile_run, profiled
+
+
+def busy_work() -> list[str]:
+    end = time.perf_counter() + 0.05
+    words = []
+    while time.perf_counter() < end:
+        words.append("x" * 100)
+    return words
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "get_config",
+                        lambda: SimpleNamespace(config_folder=tmp_path))
+    yield tmp_path / "profiles"
+    profiling.enable(False)
+
+
+class TestProfiling:
+
+    def test_disabled(self, folder) -> None:
+        profiling.enable(False)
+        assert profiled(busy_work)()
+        assert not folder.exists()
+
+    def test_report(self, folder) -> None:
+        profiling.enable()
+        assert profiled(busy_work)()
+        report, = folder.iterdir()
+        assert report.name.endswith("-busy_work")
+        assert {path.name for path in report.iterdir()} == {
+            "profile.pstats", "profile.txt", "stacks.collapsed",
+            "allocations.txt"
+        }
+        stats = pstats.Stats(str(report / "profile.pstats"))
+        assert any(name == "busy_work" for _, _, name in stats.stats)
+        assert "busy_work (profiling_test.py" in \
+            (report / "stacks.collapsed").read_text()
+        assert "peak traced memory" in \
+            (report / "allocations.txt").read_text()
+
+    def test_nested(self, folder) -> None:
+        with profile_run("outer", folder) as outer:
+            with profile_run("inner", folder) as inner:
+                busy_work()
+        assert outer is not None and inner is None
+        assert list(folder.iterdir()) == [outer]
+
+    def test_async(self, folder) -> None:
+        @profiled
+        async def work() -> int:
+            await asyncio.sleep(0)
+            return len(busy_work())
+
+        profiling.enable()
+        assert asyncio.run(work()) > 0
+        report, = folder.iterdir()
+        assert report.name.endswith("-TestProfiling.test_async.work")
@@ -0,0 +1,144 @@
+import json
+import pickle
+import sqlite3
+import pytest
+from pathlib import Path
+from pdfshelf.database import BookDBHandler, DatabaseConnector
+from pdfshelf.query import (
+    F, FILTERS, NULLABLE, BookQuery, Expression, uses_index
+)
+
+
+@pytest.fixture
+def books():
+    path = Path(__file__).parent / "test_data" / "dummy_data.pkl"
+    with open(path, "rb") as inp:
+        return pickle.load(inp)["books"]
+
+
+@pytest.fixture
+def db_con(books):
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    DatabaseConnector.create_tables(con)
+    for book in books:
+        values = """NULL, :title, :authors, :year, :lang, :filename, :ext,
+                    :storage_path, :folder_id, :size, :tags, :added_date,
+                    :hash_id, :publisher, :isbn13, :parsed_isbn, :active,
+                    :confirmed, :cover_path"""
+        con.execute(f"INSERT INTO Book VALUES({values})", book)
+    con.commit()
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def handler(db_con):
+    return BookDBHandler(db_con)
+
+
+def titles(rows) -> set[str]:
+    return {row.title if hasattr(row, "title") else row["title"]
+            for row in rows}
+
+
+class TestBookQuery:
+
+    def test_filters_match_python(self, handler, books) -> None:
+        query = BookQuery().where(F("year") >= 2018, F("ext") == ".epub")
+        expected = {b["title"] for b in books
+                    if b["year"] and b["year"] >= 2018 and b["ext"] == ".epub"}
+        assert titles(handler.find_books(query)) == expected
+        assert handler.count_matching(query) == len(expected)
+
+    def test_lists(self, handler, books) -> None:
+        query = BookQuery().where(F("tag") == "Data science",
+                                  F("author").in_(["Alvaro Fuentes",
+                                                   "Bart Baesens"]))
+        expected = {b["title"] for b in books
+                    if "Data science" in json.loads(b["tags"])
+                    and {"Alvaro Fuentes", "Bart Baesens"}
+                    & set(json.loads(b["authors"]))}
+        assert len(expected) == 2
+        assert titles(handler.find_books(query)) == expected
+
+    def test_or_not(self, handler, books) -> None:
+        condition = (F("year") < 2016) | ~(F("lang") == "en")
+        expected = {b["title"] for b in books
+                    if (b["year"] is not None and b["year"] < 2016)
+                    or (b["lang"] is not None and b["lang"] != "en")}
+        result = handler.find_books(BookQuery().where(condition))
+        assert titles(result) == expected
+
+    def test_order_page_select(self, handler, books) -> None:
+        query = (BookQuery().where(F("year") != None)  # noqa: E711
+                 .order_by("-year", "title").select("title", "year", "tags")
+                 .page(3, 1))
+        rows = handler.find_books(query)
+        expected = sorted((b for b in books if b["year"] is not None),
+                          key=lambda b: (-b["year"], b["title"]))[1:4]
+        assert [row["title"] for row in rows] == [b["title"]
+                                                  for b in expected]
+        assert isinstance(rows[0]["tags"], list)
+        assert set(rows[0]) == {"title", "year", "tags"}
+
+    def test_in_list_compiles_to_one_statement(self) -> None:
+        one = BookQuery().where(F("ext").in_([".pdf"])).compile()
+        two = BookQuery().where(F("ext").in_([".pdf", ".epub"])).compile()
+        assert one[0] == two[0]
+        assert one[1] != two[1]
+
+    def test_contains_escapes(self, handler, db_con) -> None:
+        db_con.execute("UPDATE Book SET title = '100% Python' "
+                       "WHERE book_id = 1")
+        query = BookQuery().where(F("title").contains("100%"))
+        assert titles(handler.find_books(query)) == {"100% Python"}
+
+    def test_unknown_fields(self) -> None:
+        with pytest.raises(ValueError):
+            F("authors")
+        with pytest.raises(ValueError):
+            BookQuery().order_by("authors")
+        with pytest.raises(ValueError):
+            BookQuery().select("nope")
+        with pytest.raises(ValueError):
+            F("ext") == None  # noqa: E711
+
+    def test_expression_needs_compile(self) -> None:
+        class Incomplete(Expression):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    @pytest.mark.parametrize("field", FILTERS)
+    def test_filters_use_an_index(self, db_con, field) -> None:
+        conditions = [F(field) == 1, F(field).in_([1, 2]),
+                      F(field).between(1, 2)]
+        if field in NULLABLE:
+            conditions.append(F(field) == None)  # noqa: E711
+        for condition in conditions:
+            query = BookQuery().where(condition).order_by("title")
+            assert uses_index(db_con, query), condition
+        query = BookQuery().where((F(field) == 1) | (F("year") > 2000))
+        assert uses_index(db_con, query)
+
+
+class TestLookupTables:
+
+    def test_follow_updates_and_deletes(self, handler, db_con) -> None:
+        def authors_of(book_id):
+            return {row[0] for row in db_con.execute(
+                "SELECT author FROM BookAuthor WHERE book_id = ?",
+                (book_id, ))}
+
+        assert authors_of(1) == {"Prateek Joshi"}
+        db_con.execute("""UPDATE Book SET authors = '["A", "B"]'
+                          WHERE book_id = 1""")
+        assert authors_of(1) == {"A", "B"}
+        db_con.execute("UPDATE Book SET authors = 'not json' "
+                       "WHERE book_id = 1")
+        assert authors_of(1) == set()
+        db_con.execute("DELETE FROM Book WHERE book_id = 2")
+        assert db_con.execute("SELECT count(*) FROM BookTag "
+                              "WHERE book_id = 2").fetchone()[0] == 0
@@ -0,0 +1,93 @@
+import os
+import time
+import pytest
+import multiprocessing
+from pathlib import Path
+from pdfshelf.domain import Book, ParseStatus
+from pdfshelf.exceptions import FormatNotSupportedError
+from pdfshelf.importer import ISBNParser
+from pdfshelf.sandbox import SandboxedISBNParser
+from pdfshelf.textstore import TextStore
+
+
+class HangingISBNParser(ISBNParser):
+    def _pdf_parser(self, filepath: Path) -> tuple[str, str]:
+        if filepath.name == "hang.pdf":
+            time.sleep(60)
+        if filepath.name == "crash.pdf":
+            os._exit(3)
+        return "", "9780999773017"
+
+
+class SlowTextISBNParser(ISBNParser):
+    def _pdf_text_step(self, ctx) -> tuple[str, str]:
+        if ctx.text_writer is not None:
+            time.sleep(60)
+        return super()._pdf_text_step(ctx)
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def fork():
+    # Test modules are not importable by name in spawned children.
+    return multiprocessing.get_context("fork")
+
+
+class TestSandboxedISBNParser:
+
+    def test_timeout_replaces_worker(self, fork) -> None:
+        with SandboxedISBNParser(HangingISBNParser(), workers=1,
+                                 timeouts={".pdf": 0.5},
+                                 mp_context=fork) as parser:
+            result = parser.parse(Path("hang.pdf"))
+            assert result.status == ParseStatus.TIMEOUT
+
+            result = parser.parse(Path("fine.pdf"))
+            assert result.status == ParseStatus.OK
+            assert result.isbn13 == "9780999773017"
+
+    def test_crashed_worker(self, fork) -> None:
+        with SandboxedISBNParser(HangingISBNParser(), workers=1,
+                                 mp_context=fork) as parser:
+            result = parser.parse(Path("crash.pdf"))
+            assert result.status == ParseStatus.CRASHED
+            assert "3" in result.message
+
+            assert parser.parse(Path("fine.pdf")).status == ParseStatus.OK
+
+    def test_corrupted_and_no_isbn(self, rootdir, fork) -> None:
+        data = Path(rootdir) / "test_data"
+        with SandboxedISBNParser(workers=2, mp_context=fork) as parser:
+            corrupted = parser.parse(data / "corrupted.pdf")
+            no_isbn = parser.parse(data / "think_python_2_no_isbn.pdf")
+
+        assert corrupted.status == ParseStatus.CORRUPTED
+        assert no_isbn.status == ParseStatus.NO_ISBN
+
+    def test_format_not_supported(self, fork) -> None:
+        with SandboxedISBNParser(workers=1, mp_context=fork) as parser:
+            with pytest.raises(FormatNotSupportedError):
+                parser.parse(Path("file.txt"))
+
+    def test_text_has_its_own_timeout(self, rootdir, tmp_path, fork) -> None:
+        store = TextStore(tmp_path / "text", codec="zlib")
+        path = Path(rootdir) / "test_data" / "think_python_2_no_isbn.pdf"
+        with SandboxedISBNParser(ISBNParser(text_store=store), workers=1,
+                                 mp_context=fork) as parser:
+            assert parser.parse(path).status == ParseStatus.NO_ISBN
+        assert store.exists(Book.hash_filename(path.name))
+
+        slow = tmp_path / "slow.pdf"
+        slow.write_bytes(path.read_bytes())
+        with SandboxedISBNParser(SlowTextISBNParser(text_store=store),
+                                 workers=1, timeouts={".pdf": 5.0},
+                                 text_timeouts={".pdf": 0.5},
+                                 mp_context=fork) as parser:
+            # The ISBN parse is not charged for the slow text extraction.
+            assert parser.parse(slow).status == ParseStatus.NO_ISBN
+            assert parser.parse(path).status == ParseStatus.NO_ISBN
+        assert not store.exists(Book.hash_filename(slow.name))
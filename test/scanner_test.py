@@ -0,0 +1,77 @@
+import os
+import pytest
+from pathlib import Path
+from pdfshelf.importer import FORMATS
+from pdfshelf.scanner import DirectoryScanner
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "library"
+    files = [
+        "a.pdf", "b.epub", "notes.txt",
+        "python/c.pdf", "python/drafts/d.pdf",
+        "math/e.epub", "math/algebra/f.pdf", "math/algebra/g.mobi",
+    ]
+    for name in files:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * len(name))
+    return root
+
+
+def scanned_names(scanner: DirectoryScanner, root: Path) -> set[str]:
+    return {scanned.path.relative_to(root).as_posix()
+            for scanned in scanner.scan(root)}
+
+
+class TestDirectoryScanner:
+
+    def test_scan_all_formats(self, tree) -> None:
+        scanner = DirectoryScanner(FORMATS)
+        assert scanned_names(scanner, tree) == {
+            "a.pdf", "b.epub", "python/c.pdf", "python/drafts/d.pdf",
+            "math/e.epub", "math/algebra/f.pdf"
+        }
+
+    def test_sizes_come_from_scan(self, tree) -> None:
+        scanner = DirectoryScanner(FORMATS)
+        for scanned in scanner.scan(tree):
+            assert scanned.size == os.path.getsize(scanned.path)
+
+    def test_max_depth(self, tree) -> None:
+        assert scanned_names(DirectoryScanner(FORMATS, max_depth=0),
+                             tree) == {"a.pdf", "b.epub"}
+        assert scanned_names(DirectoryScanner(FORMATS, max_depth=1),
+                             tree) == {"a.pdf", "b.epub", "python/c.pdf",
+                                       "math/e.epub"}
+
+    def test_include_exclude(self, tree) -> None:
+        scanner = DirectoryScanner(FORMATS, include=["*.pdf"],
+                                   exclude=["python/drafts"])
+        assert scanned_names(scanner, tree) == {
+            "a.pdf", "python/c.pdf", "math/algebra/f.pdf"
+        }
+
+    def test_parallel_matches_sequential(self, tree) -> None:
+        sequential = scanned_names(DirectoryScanner(FORMATS), tree)
+        parallel = scanned_names(DirectoryScanner(FORMATS, workers=4), tree)
+        assert parallel == sequential
+
+    def test_symlink_policy(self, tree) -> None:
+        os.symlink(tree / "math", tree / "python" / "math_link")
+        os.symlink(tree, tree / "math" / "loop")
+
+        skipping = DirectoryScanner(FORMATS)
+        assert "python/math_link/e.epub" not in scanned_names(skipping, tree)
+
+        following = DirectoryScanner(FORMATS, follow_symlinks=True)
+        names = scanned_names(following, tree)
+        # math is reached once, either directly or through the link,
+        # and the loop back to the root is not followed.
+        assert len([n for n in names if n.endswith("e.epub")]) == 1
+        assert not any("loop" in n for n in names)
+
+    def test_missing_root(self, tmp_path) -> None:
+        scanner = DirectoryScanner(FORMATS)
+        assert list(scanner.scan(tmp_path / "missing")) == []
@@ -0,0 +1,251 @@
+import os
+import json
+import pickle
+import sqlite3
+import zipfile
+import asyncio
+import threading
+import pytest
+from pathlib import Path
+from pdfshelf.database import DatabaseConnector
+from pdfshelf.server import CatalogServer, etag_matches
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def db_path(tmp_path, rootdir, monkeypatch):
+    path = tmp_path / "pdfshelf.db"
+    monkeypatch.setattr(DatabaseConnector, "DB_PATH", path)
+    with DatabaseConnector() as con:
+        with open(Path(rootdir) / "test_data" / "dummy_data.pkl", "rb") as inp:
+            data = pickle.load(inp)
+
+        for book in data["books"]:
+            values = """NULL, :title, :authors, :year, :lang, :filename, :ext,
+                        :storage_path, :folder_id, :size, :tags, :added_date,
+                        :hash_id, :publisher, :isbn13, :parsed_isbn, :active,
+                        :confirmed, :cover_path"""
+            con.execute(f"INSERT INTO Book VALUES({values})", book)
+        for folder in data["folders"]:
+            values = "NULL, :name, :path, :added_date, :active"
+            con.execute(f"INSERT INTO Folder VALUES({values})", folder)
+        con.commit()
+    return path
+
+
+@pytest.fixture
+def cover_folder(tmp_path):
+    folder = tmp_path / "cover"
+    folder.mkdir()
+    (folder / "cover_1.jpg").write_bytes(b"\xff\xd8" + b"jpeg" * 50000)
+    return folder
+
+
+async def request(
+    port: int, target: str, headers: dict[str, str] | None = None,
+    method: str = "GET"
+) -> tuple[int, dict[str, str], bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {target} HTTP/1.1", "Host: localhost",
+             "Connection: close"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    response = await reader.read()
+    writer.close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode().split("\r\n")
+    response_headers = {}
+    for line in header_lines:
+        key, value = line.split(":", 1)
+        response_headers[key.lower()] = value.strip()
+    return int(status_line.split()[1]), response_headers, body
+
+
+def run_with_server(db_path, cover_folder, test):
+    async def main():
+        server = CatalogServer(db_path, cover_folder, port=0)
+        await server.start()
+        try:
+            await test(server)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+class TestCatalogServer:
+
+    def test_pagination(self, db_path, cover_folder) -> None:
+        async def test(server):
+            status, _, body = await request(server.port, "/books?limit=2")
+            page = json.loads(body)
+            assert status == 200
+            assert len(page["books"]) == 2
+            assert page["next"] == 2
+
+            _, _, body = await request(
+                server.port, f"/books?limit=2&offset={page['total'] - 1}"
+            )
+            last = json.loads(body)
+            assert len(last["books"]) == 1
+            assert last["next"] is None
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_filter_and_search(self, db_path, cover_folder) -> None:
+        with sqlite3.connect(db_path) as con:
+            ext, title = con.execute(
+                "SELECT ext, title FROM Book WHERE title IS NOT NULL"
+            ).fetchone()
+            ext_count = con.execute("SELECT count(*) FROM Book WHERE ext = ?",
+                                    (ext, )).fetchone()[0]
+
+        async def test(server):
+            _, _, body = await request(server.port,
+                                       f"/books?filter=ext&value={ext}")
+            assert json.loads(body)["total"] == ext_count
+
+            _, _, body = await request(server.port, f"/books?q={title[:8]}")
+            assert title in [b["title"] for b in json.loads(body)["books"]]
+
+            status, _, _ = await request(server.port, "/books?sort=nope")
+            assert status == 400
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_etag_and_invalidation(self, db_path, cover_folder) -> None:
+        async def test(server):
+            _, headers, body = await request(server.port, "/books/1")
+            etag = headers["etag"]
+            assert json.loads(body)["book_id"] == 1
+
+            status, _, body = await request(server.port, "/books/1",
+                                            {"If-None-Match": etag})
+            assert status == 304
+            assert body == b""
+
+            with sqlite3.connect(db_path) as con:
+                con.execute("UPDATE Book SET title = 'Changed' "
+                            "WHERE book_id = 1")
+
+            status, headers, body = await request(server.port, "/books/1",
+                                                  {"If-None-Match": etag})
+            assert status == 200
+            assert headers["etag"] != etag
+            assert json.loads(body)["title"] == "Changed"
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_missing_book(self, db_path, cover_folder) -> None:
+        async def test(server):
+            status, _, _ = await request(server.port, "/books/9999")
+            assert status == 404
+            status, _, _ = await request(server.port, "/books", method="POST")
+            assert status == 405
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_cover(self, db_path, cover_folder) -> None:
+        async def test(server):
+            status, headers, body = await request(server.port,
+                                                  "/covers/cover_1.jpg")
+            assert status == 200
+            assert body == (cover_folder / "cover_1.jpg").read_bytes()
+            assert headers["content-type"] == "image/jpeg"
+            assert "max-age" in headers["cache-control"]
+
+            status, _, _ = await request(server.port, "/covers/cover_1.jpg",
+                                         {"If-None-Match": headers["etag"]})
+            assert status == 304
+
+            status, _, _ = await request(server.port,
+                                         "/covers/..%2Fpdfshelf.db")
+            assert status == 404
+            status, _, _ = await request(server.port, "/covers/../pdfshelf.db")
+            assert status == 404
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_file_io_off_the_loop(self, db_path, cover_folder,
+                                  monkeypatch) -> None:
+        threads = []
+        stat = Path.stat
+
+        def recording_stat(path, **kwargs):
+            if path.name == "cover_1.jpg":
+                threads.append(threading.get_ident())
+            return stat(path, **kwargs)
+
+        monkeypatch.setattr(Path, "stat", recording_stat)
+
+        async def test(server):
+            status, _, _ = await request(server.port, "/covers/cover_1.jpg")
+            assert status == 200
+            assert threads and threading.get_ident() not in threads
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_book_file_in_archive(self, db_path, cover_folder,
+                                  tmp_path) -> None:
+        data = b"%PDF-1.4" + b"page" * 50000
+        with zipfile.ZipFile(tmp_path / "set.zip", "w") as zf:
+            zf.writestr("a/stored.pdf", data, zipfile.ZIP_STORED)
+            zf.writestr("a/deflated.pdf", data, zipfile.ZIP_DEFLATED)
+        with sqlite3.connect(db_path) as con:
+            con.execute("UPDATE Folder SET path = ? WHERE folder_id = 1",
+                        (str(tmp_path),))
+            con.execute("""UPDATE Book SET storage_path = 'set.zip/a/' ||
+                           CASE book_id WHEN 1 THEN 'stored.pdf'
+                           ELSE 'deflated.pdf' END
+                           WHERE book_id IN (1, 2) AND folder_id = 1""")
+
+        async def test(server):
+            for book_id in (1, 2):
+                status, headers, body = await request(
+                    server.port, f"/books/{book_id}/file")
+                assert status == 200
+                assert body == data
+                assert headers["content-type"] == "application/pdf"
+                assert headers["content-length"] == str(len(data))
+
+            status, _, _ = await request(server.port, "/books/2/file",
+                                         {"If-None-Match": headers["etag"]})
+            assert status == 304
+
+        run_with_server(db_path, cover_folder, test)
+
+    def test_opds(self, db_path, cover_folder) -> None:
+        async def test(server):
+            status, headers, body = await request(server.port, "/opds")
+            assert status == 200
+            assert "kind=navigation" in headers["content-type"]
+            assert b"/opds/authors" in body
+
+            status, headers, body = await request(server.port,
+                                                  "/opds2/authors")
+            assert headers["content-type"] == "application/opds+json"
+            before = json.loads(body)["navigation"]
+
+            with sqlite3.connect(db_path) as con:
+                con.execute("""UPDATE Book SET authors = '["New Author"]'
+                               WHERE book_id = 1""")
+
+            _, _, body = await request(server.port, "/opds2/authors")
+            titles = [n["title"] for n in json.loads(body)["navigation"]]
+            assert titles != [n["title"] for n in before]
+            assert "New Author (1)" in titles
+
+            status, _, _ = await request(server.port, "/opds/nothing")
+            assert status == 404
+
+        run_with_server(db_path, cover_folder, test)
+
+
+def test_etag_matches() -> None:
+    assert etag_matches('"a"', '"b", W/"a"')
+    assert etag_matches('"a"', "*")
+    assert not etag_matches('"a"', None)
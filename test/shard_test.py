@@ -0,0 +1,135 @@
+import os
+import sys
+import shutil
+import sqlite3
+import subprocess
+import pytest
+from datetime import datetime
+from pathlib import Path
+import pdfshelf
+from pdfshelf.database import BookDBHandler, DatabaseConnector, StatsDBHandler
+from pdfshelf.domain import Book, Folder
+from pdfshelf.shard import merge_shard, select_shard, shard_of
+
+
+def make_book(filename: str, folder: str, isbn13: str | None = None) -> Book:
+    return Book.from_raw_data({
+        "title": filename, "authors": ["Plato"], "year": 2021, "lang": "en",
+        "publisher": None, "isbn13": isbn13, "parsed_isbn": isbn13,
+        "folder": Folder.from_raw_data({
+            "name": folder, "path": f"/books/{folder}",
+            "added_date": datetime.now(), "folder_id": None, "active": True
+        }),
+        "filename": filename, "ext": ".pdf",
+        "storage_path": f"{folder}/{filename}", "size": 100.0,
+        "tags": [], "cover_path": None, "book_id": None, "hash_id": None,
+        "added_date": datetime.now(), "active": True, "confirmed": False
+    })
+
+
+def write_shard(path: Path, books: list[Book]) -> Path:
+    with DatabaseConnector(path) as con:
+        BookDBHandler(con).insert_books(books)
+    return path
+
+
+@pytest.fixture
+def rootdir():
+    return Path(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def library(tmp_path):
+    with DatabaseConnector(tmp_path / "pdfshelf.db") as con:
+        yield con
+
+
+def count(con: sqlite3.Connection, table: str) -> int:
+    return con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+class TestSharding:
+
+    def test_partition(self, rootdir, tmp_path) -> None:
+        folder = rootdir / "test_data"
+        files = sorted(folder.iterdir())
+        shards = [select_shard(files, folder, i, 3) for i in range(3)]
+        assert sorted(sum(shards, [])) == files
+
+        # The same on another machine, wherever the folder is mounted.
+        moved = shutil.copytree(folder, tmp_path / "mnt" / "books")
+        for path in files:
+            assert shard_of(moved / path.name, moved, 3) == \
+                shard_of(path, folder, 3)
+
+        with pytest.raises(ValueError):
+            select_shard(files, folder, 3, 3)
+
+
+class TestMergeShard:
+
+    def test_merge(self, library, tmp_path) -> None:
+        BookDBHandler(library).insert_books([make_book("a.pdf", "old")])
+        shard = write_shard(tmp_path / "shard.db", [
+            make_book("b.pdf", "new"),
+            make_book("c.pdf", "old", isbn13="9781593275990"),
+            # A duplicate of c.pdf, within the shard.
+            make_book("d.pdf", "new", isbn13="9781593275990"),
+            # A duplicate of the library's a.pdf.
+            make_book("a.pdf", "new")
+        ])
+
+        counts = merge_shard(library, shard)
+        assert counts == {"Folder": 1, "Book": 2, "Duplicate": 2}
+        rows = library.execute(
+            """SELECT book_id, filename, Folder.name FROM Book
+               JOIN Folder USING (folder_id) ORDER BY book_id""").fetchall()
+        assert [tuple(row) for row in rows] == [
+            (1, "a.pdf", "old"), (2, "b.pdf", "new"), (3, "c.pdf", "old")]
+        duplicates = library.execute(
+            """SELECT original_book_id, filename FROM Duplicate
+               ORDER BY original_book_id""").fetchall()
+        assert [tuple(row) for row in duplicates] == [
+            (1, "a.pdf"), (3, "d.pdf")]
+
+        assert StatsDBHandler(library).summary()["books"] == 3
+        authors = library.execute("SELECT count(*) FROM BookAuthor "
+                                  "WHERE author = 'Plato'").fetchone()[0]
+        assert authors == 3
+        # Merged again, every Book is a duplicate.
+        assert merge_shard(library, shard)["Duplicate"] == 4
+        assert count(library, "Book") == 3
+
+    def test_not_a_shard(self, library, tmp_path) -> None:
+        path = tmp_path / "other.db"
+        with sqlite3.connect(path) as con:
+            con.execute("CREATE TABLE Book (book_id INTEGER PRIMARY KEY)")
+        with pytest.raises(ValueError):
+            merge_shard(library, path)
+        with pytest.raises(FileNotFoundError):
+            merge_shard(library, tmp_path / "missing.db")
+        assert count(library, "Book") == 0
+
+    def test_local_processes(self, library, rootdir, tmp_path) -> None:
+        src = Path(pdfshelf.__file__).parents[1]
+        env = {**os.environ, "HOME": str(tmp_path / "home"),
+               "PYTHONPATH": str(src)}
+        shards = [tmp_path / f"shard-{i}.db" for i in range(3)]
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-m", "pdfshelf", "import",
+                 str(rootdir / "test_data"), "--shard", f"{i}/3",
+                 "--shard-db", str(path), "--offline", "--no-sandbox"],
+                env=env, stdout=subprocess.DEVNULL
+            )
+            for i, path in enumerate(shards)
+        ]
+        assert [worker.wait(timeout=120) for worker in workers] == [0] * 3
+
+        for path in shards:
+            merge_shard(library, path)
+        assert count(library, "Book") == 6
+        assert count(library, "Folder") == 1
+        assert count(library, "Duplicate") == 0
+        ids = library.execute("SELECT book_id FROM Book ORDER BY 1")
+        assert [row[0] for row in ids] == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+# Submodules are listed where lazy_import has to load the (tiny) parent
+# package to find them.
+HEAVY_MODULES = ["pypdf", "ebooklib.epub", "pdf2image", "isbnlib",
+                 "requests", "PIL.Image", "zstandard"]
+
+
+@pytest.fixture
+def srcdir():
+    return os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "src")
+
+
+def run_import(srcdir: str, home: str, modules: list[str]) -> dict:
+    code = (
+        "import sys, json\n"
+        + "".join(f"import {module}\n" for module in modules)
+        + f"print(json.dumps([m for m in {HEAVY_MODULES!r} "
+        "if m in sys.modules and "
+        "type(sys.modules[m]).__name__ != '_LazyModule']))"
+    )
+    env = {**os.environ, "HOME": home, "PYTHONPATH": srcdir}
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+class TestStartup:
+
+    def test_import_has_no_side_effects(self, srcdir, tmp_path) -> None:
+        run_import(srcdir, str(tmp_path), [
+            "pdfshelf", "pdfshelf.config", "pdfshelf.database",
+            "pdfshelf.importer", "pdfshelf.cover"
+        ])
+        assert list(tmp_path.iterdir()) == []
+
+    def test_heavy_dependencies_are_lazy(self, srcdir, tmp_path) -> None:
+        loaded = run_import(srcdir, str(tmp_path), [
+            "pdfshelf.database", "pdfshelf.importer", "pdfshelf.cover",
+            "pdfshelf.ocr", "pdfshelf.pipeline", "pdfshelf.textstore"
+        ])
+        assert loaded == []
+
+    def test_config_resolved_on_first_use(self, srcdir, tmp_path) -> None:
+        code = ("from pdfshelf.config import get_config\n"
+                "print(get_config().cover_folder)")
+        env = {**os.environ, "HOME": str(tmp_path), "PYTHONPATH": srcdir}
+        out = subprocess.run([sys.executable, "-c", code], env=env,
+                             check=True, capture_output=True, text=True)
+
+        assert (tmp_path / ".config" / "pdfshelf" / "config.ini").is_file()
+        assert os.path.isdir(out.stdout.strip())
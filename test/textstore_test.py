@@ -0,0 +1,115 @@
+import os
+import pytest
+from pathlib import Path
+from pdfshelf.domain import Book, ParseStatus
+from pdfshelf.importer import ISBNParser
+from pdfshelf.textstore import TextStore
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TextStore(tmp_path / "text", codec="zlib")
+
+
+class TestTextStore:
+
+    def test_round_trip(self, store) -> None:
+        pages = ["first page", "ação e emoção " * 10000, "", "last\fpage"]
+        with store.writer("abc") as writer:
+            for page in pages:
+                writer.write_page(page)
+
+        assert store.exists("abc")
+        assert list(store.iter_pages("abc")) == [
+            "first page", "ação e emoção " * 10000, "", "last page"
+        ]
+
+    def test_compressed_on_disk(self, store) -> None:
+        with store.writer("abc") as writer:
+            writer.write_page("ISBN 978-0-9997730-1-7 " * 5000)
+
+        assert store.get_path("abc").stat().st_size < 5000
+
+    def test_failed_write_is_discarded(self, store) -> None:
+        with pytest.raises(RuntimeError):
+            with store.writer("abc") as writer:
+                writer.write_page("half a book")
+                raise RuntimeError("parser died")
+
+        assert not store.exists("abc")
+        assert list(store.folder.iterdir()) == []
+
+    def test_missing_text(self, store) -> None:
+        with pytest.raises(KeyError):
+            list(store.iter_pages("missing"))
+
+    def test_delete(self, store) -> None:
+        with store.writer("abc") as writer:
+            writer.write_page("text")
+        store.delete("abc")
+        assert not store.exists("abc")
+
+    def test_zstd_codec(self, tmp_path) -> None:
+        pytest.importorskip("zstandard")
+        store = TextStore(tmp_path / "text", codec="zstd")
+        with store.writer("abc") as writer:
+            writer.write_page("one")
+            writer.write_page("two")
+
+        assert store.get_path("abc").name == "abc.txt.zst"
+        assert list(store.iter_pages("abc")) == ["one", "two"]
+
+
+class TestParserTextStore:
+
+    def test_pdf_text_is_stored(self, store, rootdir) -> None:
+        path = Path(rootdir) / "test_data" / "think_python_2_no_isbn.pdf"
+        parser = ISBNParser(pages_to_read=2, text_store=store)
+        parser.parse(path)
+
+        pages = list(store.iter_pages(Book.hash_filename(path.name)))
+        # All pages are stored, not only the ones scanned for an ISBN.
+        assert len(pages) > 2
+        assert "Think Python" in store.get_text(Book.hash_filename(path.name))
+
+    def test_epub_text_is_stored(self, store, rootdir) -> None:
+        path = Path(rootdir) / "test_data" / "craft-isbn-13.epub"
+        parser = ISBNParser(text_store=store)
+        result = parser.parse(path)
+
+        text = store.get_text(Book.hash_filename(path.name))
+        assert result.isbn13 == "978-1-4116-8297-9"
+        assert "<p>" not in text
+        assert len(text) > 0
+
+    def test_parse_stored(self, store, rootdir) -> None:
+        path = Path(rootdir) / "test_data" / "craft-isbn-13.epub"
+        ISBNParser(text_store=store).parse(path)
+
+        hash_id = Book.hash_filename(path.name)
+        with store.writer(hash_id) as writer:
+            writer.write_page("New edition, ISBN 978-0-9997730-1-7")
+
+        result = ISBNParser(text_store=store).parse_stored(path)
+        assert result.status == ParseStatus.OK
+        assert result.isbn13 == "978-0-9997730-1-7"
+
+    def test_corrupted_file_stores_nothing(self, store, rootdir) -> None:
+        path = Path(rootdir) / "test_data" / "corrupted.pdf"
+        ISBNParser(text_store=store).parse(path)
+        assert list(store.folder.iterdir()) == []
+
+    def test_store_text_apart(self, store, rootdir) -> None:
+        data = Path(rootdir) / "test_data"
+        parser = ISBNParser(pages_to_read=2, text_store=store)
+        path = data / "think_python_2_no_isbn.pdf"
+        assert parser.store_text(path)
+        assert len(list(store.iter_pages(Book.hash_filename(path.name)))) > 2
+
+        assert not parser.store_text(data / "corrupted.pdf")
+        assert not store.exists(Book.hash_filename("corrupted.pdf"))
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import pytest
+from pathlib import Path
+from pdfshelf.database import DatabaseConnector
+from pdfshelf.domain import ParseStatus
+from pdfshelf.importer import BookImporter, ISBNParser, MetadataFetcher
+from pdfshelf.isbnindex import ISBNIndex
+from pdfshelf.titleindex import (
+    TitleIndex, filename_title, library_entries, similarity, trigrams
+)
+
+ENTRIES = [
+    {"Title": "Think Python: How to Think Like a Computer Scientist",
+     "Authors": ["Allen B. Downey"], "Publisher": "O'Reilly Media",
+     "Year": "2015", "Language": "en", "ISBN-13": "9781491939369"},
+    {"Title": "Think Python", "Authors": ["Allen B. Downey"],
+     "Year": "2012", "Language": "en", "ISBN-13": "9781449330729"},
+    {"Title": "How to get started with open source",
+     "Authors": ["Opensource.com"], "Language": "en"},
+    {"Title": "Python Crash Course", "Authors": ["Eric Matthes"]},
+    {"Title": "Fluent Python", "Authors": ["Luciano Ramalho"]},
+    {"Title": "Le Petit Prince", "Authors": ["Antoine de Saint-Exupéry"]},
+    {"Authors": ["No Title"]},
+]
+
+
+class NoMetadataFetcher(MetadataFetcher):
+    def from_isbn(self, isbn10: str, isbn13: str) -> tuple[dict, bool]:
+        return {}, False
+
+
+@pytest.fixture
+def rootdir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TitleIndex.build(ENTRIES, tmp_path / "titles.db")
+    yield index
+    index.close()
+
+
+class TestTitleIndex:
+
+    def test_build(self, index, tmp_path) -> None:
+        assert len(index) == 6
+        assert not (tmp_path / "titles.db.tmp").exists()
+
+    def test_match_filename(self, index) -> None:
+        matches = index.match(filename_title("think_python_2_no_isbn.pdf"))
+        assert matches[0].metadata["Title"] == "Think Python"
+        assert matches[1].metadata["Title"].startswith("Think Python:")
+        assert matches[0].score > matches[1].score
+        assert [m.score for m in matches] == sorted(
+            (m.score for m in matches), reverse=True)
+
+    def test_match_embedded_title(self, index) -> None:
+        match = index.best(
+            "beginners in open source no",
+            "How to get started with open source (Open Voices, Issue 9)"
+        )
+        assert match.metadata["Title"] == "How to get started with open source"
+        assert match.metadata["Authors"] == ["Opensource.com"]
+
+    def test_typos_authors_and_accents(self, index) -> None:
+        best = index.best("Fluent Pyhton - Ramalho")
+        assert best.metadata["Title"] == "Fluent Python"
+        assert index.best("le petit prince saint exupery") is not None
+
+    def test_no_match(self, index) -> None:
+        assert index.match("") == []
+        assert index.match("zzqx") == []
+        assert index.best("Cooking for beginners") is None
+
+    def test_helpers(self) -> None:
+        assert filename_title("ThinkPython-9781491939369_ebook.pdf") == \
+            "think python"
+        assert trigrams("Go") == {"  g", " go", "go "}
+        assert similarity(trigrams("Python"), trigrams("Python")) == 1.0
+        assert similarity(set(), trigrams("Python")) == 0.0
+
+
+class TestTitleSources:
+
+    def test_library_entries(self, tmp_path) -> None:
+        con = sqlite3.connect(":memory:")
+        DatabaseConnector.create_tables(con)
+        con.execute("""INSERT INTO Folder VALUES
+                       (NULL, 'f', '/f', '2023-01-01', 1)""")
+        con.execute("""INSERT INTO Book (title, authors, year, filename, ext,
+                       storage_path, folder_id, size, added_date, hash_id,
+                       active, confirmed) VALUES
+                       ('Fluent Python', '["Luciano Ramalho"]', 2015,
+                        'a.pdf', '.pdf', 'a.pdf', 1, 1, '2023-01-01', 'a',
+                        1, 0),
+                       (NULL, NULL, NULL, 'b.pdf', '.pdf', 'b.pdf', 1, 1,
+                        '2023-01-01', 'b', 1, 0)""")
+        assert list(library_entries(con)) == [{
+            "Title": "Fluent Python", "Authors": ["Luciano Ramalho"],
+            "Publisher": "", "Language": "", "Year": "2015"
+        }]
+        con.close()
+
+    def test_isbn_index_entries(self, tmp_path) -> None:
+        path = tmp_path / "editions.jsonl"
+        path.write_text('{"title": "Fluent Python", '
+                        '"isbn_13": ["9781491946008"]}\n')
+        with ISBNIndex.build(path, tmp_path / "isbn.db") as isbn_index:
+            entries = list(isbn_index.entries())
+            with TitleIndex.build(entries, tmp_path / "t.db") as index:
+                match = index.best("fluent_python.pdf")
+        assert match.metadata["ISBN-13"] == "9781491946008"
+
+
+class TestImporterTitleMatch:
+
+    def test_books_without_isbn(self, index, rootdir) -> None:
+        importer = BookImporter(NoMetadataFetcher(), ISBNParser(),
+                                titles=index)
+        file = Path(rootdir) / "test_data" / \
+            "beginners-in-open-source-no-isbn.epub"
+        result = importer.parser.parse(file)
+        assert result.status == ParseStatus.NO_ISBN
+        assert result.title.startswith("How to get started")
+
+        book = importer.import_from_file(file)
+        assert book.title == "How to get started with open source"
+        assert book.authors == ["Opensource.com"]
+        # A guessed ISBN could belong to another book of the library.
+        assert book.isbn13 is None
+        assert book.parsed_isbn is None
+
+        book = importer.import_from_file(
+            Path(rootdir) / "test_data" / "think_python_2_no_isbn.pdf")
+        assert book.title == "Think Python"